@@ -0,0 +1,68 @@
+# ai_models/answer_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+
+
+def get_answer_cache_config() -> Dict[str, Any]:
+    admission = getattr(settings, 'ADMISSION_CONTROL', {})
+    return {
+        'TTL': admission.get('ANSWER_CACHE_TTL', 600),
+        'MAX_ENTRIES': admission.get('ANSWER_CACHE_SIZE', 2000),
+    }
+
+
+class RecentAnswerCache:
+    """
+    Câu trả lời Gemini gần đây theo câu hỏi đã chuẩn hoá (chỉ lượt đầu của session,
+    không phụ thuộc ngữ cảnh hội thoại) - dùng khi bị load shed thay vì gọi lại Gemini.
+    """
+
+    def __init__(self, ttl: float = 600, max_entries: int = 2000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # query -> (expires_at, response_text)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def get(self, query: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(query)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[query]
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(query)
+            self._stats['hits'] += 1
+            return entry[1]
+
+    def set(self, query: str, response_text: str):
+        if not self.ttl or not response_text:
+            return
+        with self._lock:
+            self._entries[query] = (time.monotonic() + self.ttl, response_text)
+            self._entries.move_to_end(query)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, 'entries': len(self._entries)}
+
+
+def _build_answer_cache() -> RecentAnswerCache:
+    config = get_answer_cache_config()
+    return RecentAnswerCache(ttl=config['TTL'], max_entries=config['MAX_ENTRIES'])
+
+
+# Global answer cache
+recent_answers = _build_answer_cache()
@@ -0,0 +1,84 @@
+# ai_models/deadline.py
+
+import time
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+DEFAULT_STAGE_MIN_BUDGET = {
+    'intent': 0.5,  # PhoBERT classify
+    'llm': 3.0,     # 1 lời gọi Gemini tối thiểu
+}
+
+
+def get_deadline_config() -> Dict[str, Any]:
+    return getattr(settings, 'CHAT_DEADLINE', {})
+
+
+class Deadline:
+    """
+    Thời hạn cho 1 request chat, truyền qua từng stage của pipeline.
+    Stage nào không còn đủ budget thì bị bỏ qua và ghi lại vào skipped_stages.
+    """
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + budget
+        self.skipped_stages: List[str] = []
+        self.shed_stages: List[str] = []
+
+    @classmethod
+    def for_chat_request(cls) -> 'Deadline':
+        """Budget = CHAT_RESPONSE_TIMEOUT (timeout phía frontend) trừ safety margin"""
+        config = get_deadline_config()
+        timeout = getattr(settings, 'CHAT_RESPONSE_TIMEOUT', 30)
+        return cls(max(0.0, timeout - config.get('SAFETY_MARGIN', 3)))
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def min_budget(self, stage: str) -> float:
+        budgets = get_deadline_config().get('STAGE_MIN_BUDGET', DEFAULT_STAGE_MIN_BUDGET)
+        return budgets.get(stage, DEFAULT_STAGE_MIN_BUDGET.get(stage, 0))
+
+    def has_budget_for(self, stage: str) -> bool:
+        if stage in self.shed_stages:
+            return False
+        return self.remaining() >= self.min_budget(stage)
+
+    def shed(self, stage: str):
+        """Bỏ hẳn 1 stage bất kể budget (admission control khi quá tải)"""
+        if stage not in self.shed_stages:
+            self.shed_stages.append(stage)
+
+    def is_shed(self, stage: str) -> bool:
+        return stage in self.shed_stages
+
+    def skip(self, stage: str):
+        if stage not in self.skipped_stages:
+            self.skipped_stages.append(stage)
+
+    def cap(self, timeout: Optional[float]) -> float:
+        """Giới hạn timeout của 1 thao tác theo budget còn lại"""
+        remaining = self.remaining()
+        return remaining if timeout is None else min(timeout, remaining)
+
+    @property
+    def degraded(self) -> bool:
+        return bool(self.skipped_stages)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'budget': self.budget,
+            'elapsed': round(self.elapsed(), 3),
+            'remaining': round(self.remaining(), 3),
+            'skipped_stages': list(self.skipped_stages),
+            'degraded': self.degraded,
+        }
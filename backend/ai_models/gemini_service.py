@@ -1,136 +1,255 @@
+import atexit
 import logging
+import threading
 import time
 import requests
 import json
 import re
 from typing import Dict, Any, Optional, List
 
-logger = logging.getLogger(__name__)
-
-# ✅ SYSTEM PROMPT CỤ THỂ CHO GIẢNG VIÊN
-LECTURER_SYSTEM_PROMPT = """Bạn là AI assistant của Đại học Bình Dương (BDU), chuyên hỗ trợ giảng viên.
-
-🎯 QUY TẮC QUAN TRỌNG:
-- LUÔN xưng hô: "thầy/cô" (TUYỆT ĐỐI KHÔNG dùng "bạn", "mình", "anh/chị")
-- Bắt đầu: "Dạ thầy/cô,"
-- Kết thúc: "Thầy/cô có cần hỗ trợ thêm gì không ạ?"
-- NGẮN GỌN - Chỉ 1-2 câu chính, đi thẳng vào vấn đề
-- KHÔNG CHẾ TẠO thông tin không có
-- KHÔNG dùng format phức tạp với **1. **2. hay bullets
-
-✅ PHONG CÁCH MẪU:
-"Dạ thầy/cô, [thông tin chính ngắn gọn]. [Thêm 1 câu bổ sung nếu cần]. 🎓 Thầy/cô có cần hỗ trợ thêm gì không ạ?"
+# ✅ SYSTEM PROMPT + templates đã được tách sang prompt_templates.py
+from .prompt_templates import (
+    LECTURER_SYSTEM_PROMPT, MEMORY_CONTEXT_TEMPLATE, build_system_instruction,
+    build_conversation_flow, render_strategy_prompt, truncate_to_tokens,
+    estimate_tokens, get_token_budget, prompt_stats
+)
+from .singleflight import gemini_coalescer, make_key
+from .llm_limiter import llm_limiter, PRIORITY_ANONYMOUS
+from .deadline import Deadline
+from .session_store import (
+    SessionStore, ConversationState, Turn, get_session_memory_config
+)
+from .session_backends import SessionBackend, WriteBehindFlusher
+from .topics import match_topics
+from backend.tracing import span
+from backend.metrics import gemini_request_duration, gemini_requests
+from backend.logging_utils import log_sampler
 
-🚫 TUYỆT ĐỐI TRÁNH:
-- Format phức tạp (**1. **2. **3. etc.)
-- Bullets (• hoặc *)
-- Câu trả lời dài dòng trên 3 câu
-- Thông tin không chắc chắn
-- Chế tạo số liệu, quy định
-
-📝 KHI KHÔNG HIỂU RÕ:
-- Hỏi lại để làm rõ: "Dạ thầy/cô, để em hỗ trợ chính xác, thầy/cô có thể nói rõ hơn về [vấn đề cụ thể] không ạ?"
-
-❌ KHI KHÔNG CÓ THÔNG TIN:
-- Nói thẳng: "Dạ thầy/cô, em chưa có thông tin về vấn đề này. Thầy/cô có thể liên hệ [bộ phận liên quan] để được hỗ trợ chi tiết ạ."
-"""
+logger = logging.getLogger(__name__)
 
 class ConversationMemory:
-    """Quản lý bộ nhớ hội thoại"""
+    """
+    Quản lý bộ nhớ hội thoại (LRU + idle TTL, history giới hạn bằng deque).
+
+    Với backend dùng chung (SQLite/Redis): session nóng được cache trong process,
+    ghi xuống backend theo kiểu write-behind và đối chiếu lại sau REVALIDATE_AFTER
+    giây để các worker thấy lượt mới của nhau. Session lạnh được load lazily từ
+    backend, rồi tới ChatHistory (load_from_db=True).
+    """
     
-    def __init__(self, max_history=10):
-        self.conversations = {}  # {session_id: conversation_data}
+    def __init__(self, max_history=10, backend: Optional[SessionBackend] = None, load_from_db: bool = False):
+        config = get_session_memory_config()
         self.max_history = max_history
+        self.conversations = SessionStore(
+            factory=lambda: ConversationState(self.max_history),
+            max_sessions=config['MAX_SESSIONS'],
+            idle_ttl=config['IDLE_TTL'],
+            name='conversation_memory'
+        )
+        
+        # ✅ THÊM: Backend dùng chung giữa các worker + write-behind
+        self.backend = backend or SessionBackend()
+        self.load_from_db = load_from_db
+        self.revalidate_after = config.get('REVALIDATE_AFTER', 2.0)
+        self._lock = threading.RLock()
+        self._dirty = set()
+        self.stats = {'backend_loads': 0, 'db_loads': 0, 'flushed': 0, 'flush_errors': 0}
+        
+        self.flusher = None
+        if self.backend.shared:
+            self.flusher = WriteBehindFlusher(self, interval=config.get('FLUSH_INTERVAL', 1.0))
+            self.flusher.start()
+            atexit.register(self.flush)
     
-    def add_interaction(self, session_id: str, user_query: str, bot_response: str, 
-                       intent_info: dict = None, entities: dict = None):
-        """Thêm interaction vào memory"""
-        if session_id not in self.conversations:
-            self.conversations[session_id] = {
-                'history': [],
-                'context_summary': "",
-                'user_interests': set(),
-                'conversation_type': 'lecturer'  # ✅ CHANGED: Default to lecturer
-            }
+    def _get_state(self, session_id: str, create: bool = False) -> Optional[ConversationState]:
+        """Lấy state từ cache trong process, đối chiếu backend dùng chung / ChatHistory khi cần"""
+        if not self.backend.shared and not self.load_from_db:
+            return self.conversations.get_or_create(session_id) if create else self.conversations.get(session_id)
+        
+        now = time.time()
+        conv = self.conversations.get(session_id)
+        if conv is not None and (
+            session_id in self._dirty
+            or not self.backend.shared
+            or now - conv.synced_at < self.revalidate_after
+        ):
+            return conv
+        
+        remote = None
+        if self.backend.shared:
+            try:
+                remote = self.backend.load(session_id)
+            except Exception as e:
+                logger.warning(f"Session backend load failed ({self.backend.name}): {e}")
+        
+        with self._lock:
+            if remote and (conv is None or remote.get('updated_at', 0) > conv.updated_at):
+                conv = ConversationState.from_dict(remote, self.max_history)
+                self.stats['backend_loads'] += 1
+            elif conv is None and self.load_from_db:
+                conv = self._load_from_chat_history(session_id)
+            
+            # Session chưa có ở đâu -> cache state rỗng để không query lại mỗi lần đọc
+            if conv is None:
+                conv = ConversationState(self.max_history)
+            conv.synced_at = now
+            self.conversations.put(session_id, conv)
+        return conv
+    
+    def _load_from_chat_history(self, session_id: str) -> Optional[ConversationState]:
+        """Session lạnh: dựng lại history từ các lượt đã lưu trong ChatHistory"""
+        try:
+            from knowledge.models import ChatHistory
+            rows = list(
+                ChatHistory.objects.filter(session_id=session_id)
+                .order_by('-timestamp')
+                .values('user_message', 'bot_response', 'intent', 'method', 'confidence_score', 'timestamp')
+                [:self.max_history]
+            )
+        except Exception as e:
+            logger.warning(f"Could not load session {session_id} from ChatHistory: {e}")
+            return None
+        
+        if not rows:
+            return None
         
+        conv = ConversationState(self.max_history)
+        for row in reversed(rows):
+            answered = row['method'] not in (None, 'rejected_non_education')
+            topics = match_topics(row['user_message'])
+            conv.append_turn(Turn(
+                timestamp=row['timestamp'].timestamp(),
+                user_query=row['user_message'],
+                bot_response=row['bot_response'],
+                intent=row['intent'] or 'unknown',
+                entities={},
+                confidence=row['confidence_score'],
+                decision_type=row['method'],
+                was_education_related=answered,
+                is_education_query=answered,
+                topic_mask=topics.summary_mask,
+                main_topic=topics.main_topic
+            ))
+        conv.updated_at = conv.history[-1].timestamp
+        self.stats['db_loads'] += 1
+        return conv
+    
+    def flush(self):
+        """Ghi các session dirty xuống backend (gọi từ write-behind thread và lúc tắt process)"""
+        if not self.backend.shared:
+            return
+        
+        with self._lock:
+            if not self._dirty:
+                return
+            items = {}
+            for session_id in self._dirty:
+                conv = self.conversations.get(session_id)
+                if conv is not None:
+                    items[session_id] = conv.to_dict()
+            self._dirty.clear()
+        
+        try:
+            self.backend.save_many(items)
+            self.stats['flushed'] += len(items)
+        except Exception as e:
+            self.stats['flush_errors'] += 1
+            logger.error(f"Session backend flush failed ({self.backend.name}): {e}")
+            with self._lock:
+                self._dirty.update(items)
+    
+    def clear(self, session_id: str = None):
+        with self._lock:
+            if session_id:
+                self.conversations.pop(session_id)
+                self._dirty.discard(session_id)
+                self.backend.delete(session_id)
+            else:
+                self.conversations.clear()
+                self._dirty.clear()
+                self.backend.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.conversations.get_stats(),
+            'backend': self.backend.name,
+            'dirty': len(self._dirty),
+            **self.stats,
+        }
+    
+    def add_interaction(self, session_id: str, user_query: str, bot_response: str, 
+                       intent_info: dict = None, entities: dict = None, confidence: float = 0.0,
+                       decision_type: str = None, was_education_related: bool = True,
+                       is_education_query: bool = False):
+        """Thêm interaction vào memory (mỗi lượt chỉ ghi 1 lần)"""
+        conv = self._get_state(session_id, create=True)
+        
+        with self._lock:
+            self._add_turn(conv, user_query, bot_response, intent_info, entities, confidence,
+                           decision_type, was_education_related, is_education_query)
+            conv.updated_at = time.time()
+            if self.backend.shared:
+                self._dirty.add(session_id)
+    
+    def _add_turn(self, conv, user_query, bot_response, intent_info, entities, confidence,
+                  decision_type, was_education_related, is_education_query):
         # Extract user interests from entities
         if entities:
             if 'major' in entities:
-                self.conversations[session_id]['user_interests'].add(entities['major'])
-        
-        # Add to history
-        interaction = {
-            'timestamp': time.time(),
-            'user_query': user_query,
-            'bot_response': bot_response,
-            'intent': intent_info.get('intent', 'unknown') if intent_info else 'unknown',
-            'entities': entities or {}
-        }
-        
-        self.conversations[session_id]['history'].append(interaction)
-        
-        # Keep only recent history
-        if len(self.conversations[session_id]['history']) > self.max_history:
-            self.conversations[session_id]['history'] = self.conversations[session_id]['history'][-self.max_history:]
-        
-        # Update context summary
-        self._update_context_summary(session_id)
+                conv.user_interests.add(entities['major'])
+        
+        # ✅ Keyword hits tính 1 lần/lượt (match_topics có cache, strategy đã tính cho câu này)
+        topics = match_topics(user_query)
+        
+        # Add to history (deque(maxlen) tự bỏ lượt cũ nhất), summary cập nhật tăng dần
+        conv.append_turn(Turn(
+            timestamp=time.time(),
+            user_query=user_query,
+            bot_response=bot_response,
+            intent=intent_info.get('intent', 'unknown') if intent_info else 'unknown',
+            entities=entities or {},
+            confidence=confidence,
+            decision_type=decision_type,
+            was_education_related=was_education_related,
+            is_education_query=is_education_query,
+            topic_mask=topics.summary_mask,
+            main_topic=topics.main_topic
+        ))
+    
+    def get_history(self, session_id: str) -> list:
+        """Toàn bộ history (tối đa MAX_HISTORY lượt) của session"""
+        conv = self._get_state(session_id)
+        return list(conv.history) if conv is not None else []
     
     def get_conversation_context(self, session_id: str) -> dict:
         """Lấy context của conversation"""
-        if session_id not in self.conversations:
+        conv = self._get_state(session_id)
+        if conv is None:
             return {'history': [], 'context_summary': '', 'user_interests': []}
         
-        conv = self.conversations[session_id]
         return {
-            'history': conv['history'][-5:],  # Last 5 interactions
-            'context_summary': conv['context_summary'],
-            'user_interests': list(conv['user_interests']),
-            'conversation_type': conv['conversation_type']
+            'history': list(conv.history)[-5:],  # Last 5 interactions
+            'context_summary': conv.context_summary,
+            'user_interests': list(conv.user_interests),
+            'conversation_type': conv.conversation_type
         }
-    
-    def _update_context_summary(self, session_id: str):
-        """Cập nhật tóm tắt context cho giảng viên"""
-        conv = self.conversations[session_id]
-        recent_queries = [h['user_query'] for h in conv['history'][-3:]]
-        
-        # ✅ ENHANCED: Context analysis for lecturers
-        query_text = ' '.join(recent_queries).lower()
-        
-        # ✅ LECTURER-SPECIFIC contexts
-        if any(word in query_text for word in ['ngân hàng đề', 'đề thi', 'khảo thí']):
-            conv['context_summary'] = 'Đang hỏi về ngân hàng đề thi'
-        elif any(word in query_text for word in ['kê khai', 'nhiệm vụ', 'giờ chuẩn']):
-            conv['context_summary'] = 'Đang hỏi về kê khai nhiệm vụ năm học'
-        elif any(word in query_text for word in ['tạp chí', 'nghiên cứu', 'bài viết']):
-            conv['context_summary'] = 'Đang hỏi về tạp chí khoa học'
-        elif any(word in query_text for word in ['thi đua', 'khen thưởng', 'danh hiệu']):
-            conv['context_summary'] = 'Đang hỏi về thi đua khen thưởng'
-        elif any(word in query_text for word in ['báo cáo', 'nộp', 'hạn cuối']):
-            conv['context_summary'] = 'Đang hỏi về báo cáo và thủ tục'
-        elif any(word in query_text for word in ['lịch', 'thời khóa biểu', 'giảng dạy']):
-            conv['context_summary'] = 'Đang hỏi về lịch giảng dạy'
-        elif any(word in query_text for word in ['học phí', 'tiền', 'chi phí']):
-            conv['context_summary'] = 'Đang quan tâm học phí'
-        elif any(word in query_text for word in ['tuyển sinh', 'điểm', 'xét tuyển']):
-            conv['context_summary'] = 'Đang hỏi về tuyển sinh'
-        elif any(word in query_text for word in ['ngành', 'chuyên ngành', 'đào tạo']):
-            conv['context_summary'] = 'Đang tìm hiểu về ngành học'
-        elif any(word in query_text for word in ['cơ sở', 'phòng', 'trang thiết bị']):
-            conv['context_summary'] = 'Đang hỏi về cơ sở vật chất'
-        else:
-            conv['context_summary'] = 'Hỏi đáp chung về BDU'
 
 class GeminiResponseGenerator:
     """Gemini API Response Generator cho Giảng viên BDU"""
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, memory: Optional[ConversationMemory] = None):
         from django.conf import settings
         self.api_key = api_key or settings.GEMINI_API_KEY
         self.model_name = "gemini-1.5-flash"
-        self.base_url = f"https://generativelanguage.googleapis.com/v1beta/models/{self.model_name}:generateContent"
+        # ✅ THÊM: Có thể trỏ sang Gemini stub server khi test offline
+        self.api_root = getattr(settings, 'GEMINI_API_BASE_URL', '').rstrip('/') or "https://generativelanguage.googleapis.com/v1beta"
+        self.base_url = f"{self.api_root}/models/{self.model_name}:generateContent"
+        
+        # ✅ THÊM: Kết quả probe gần nhất (do HealthMonitor cập nhật ở background)
+        self.last_probe = None
         
-        self.memory = ConversationMemory(max_history=10)
+        # ✅ Dùng chung memory với HybridChatbotAI nếu được truyền vào
+        self.memory = memory or ConversationMemory(max_history=get_session_memory_config()['MAX_HISTORY'])
         
         # ✅ UPDATED: Role consistency for lecturers
         self.role_consistency_rules = {
@@ -143,38 +262,48 @@ class GeminiResponseGenerator:
             ]
         }
         
+        # ✅ THÊM: System instruction tĩnh, build 1 lần và gửi qua field systemInstruction
+        self.system_instruction = build_system_instruction(self.role_consistency_rules)
+        self.system_instruction_tokens = estimate_tokens(self.system_instruction)
+        
         logger.info("✅ Gemini Response Generator for LECTURERS initialized")
     
     def generate_response(self, query: str, context: Optional[Dict] = None, 
                           intent_info: Optional[Dict] = None, entities: Optional[Dict] = None,
-                          session_id: str = None) -> Dict[str, Any]:
-        """Tạo phản hồi cho giảng viên với bộ nhớ hội thoại"""
+                          session_id: str = None, priority: int = PRIORITY_ANONYMOUS,
+                          deadline: Optional[Deadline] = None, record: bool = True) -> Dict[str, Any]:
+        """
+        Tạo phản hồi cho giảng viên với bộ nhớ hội thoại.
+        record=False: caller (HybridChatbotAI) tự ghi lượt này vào memory dùng chung.
+        """
         start_time = time.time()
-        
-        print(f"\n--- LECTURER REQUEST (Session: {session_id}) ---")
-        print(f"🧠 MEMORY DEBUG: Total active sessions = {len(self.memory.conversations)}")
+        # ✅ CHANGED: print() -> log DEBUG lấy mẫu (LOG_SAMPLING), không format gì khi tắt
+        verbose = log_sampler.sample(logger)
 
         try:
             # 1. Lấy ngữ cảnh hội thoại
             conversation_context = {}
             if session_id:
                 conversation_context = self.memory.get_conversation_context(session_id)
-                print(f"🧠 MEMORY DEBUG: History length = {len(conversation_context.get('history', []))}")
-                print(f"🧠 MEMORY DEBUG: Context summary = {conversation_context.get('context_summary', 'None')}")
-
+            if verbose:
+                logger.debug("🧠 Lecturer request session=%s active_sessions=%d history=%d summary=%r",
+                             session_id, len(self.memory.conversations),
+                             len(conversation_context.get('history', [])), conversation_context.get('context_summary'))
             
             # 2. Xác định chiến lược phản hồi cho giảng viên
             response_strategy = self._determine_lecturer_response_strategy(
-                query, context, intent_info, conversation_context
+                query, context, intent_info, conversation_context, verbose
             )
             
             # ✅ ENHANCED: Check for special lecturer instructions
             instruction = context.get('instruction', '') if context else ''
             
             if instruction == 'direct_answer_lecturer':
-                response = self._generate_direct_lecturer_answer(query, context)
+                response = self._generate_direct_lecturer_answer(query, context, priority, deadline)
             elif instruction == 'enhance_answer_lecturer':
-                response = self._generate_enhanced_lecturer_answer(query, context, intent_info, entities, session_id)
+                response = self._generate_enhanced_lecturer_answer(
+                    query, context, intent_info, entities, session_id, priority, deadline
+                )
             elif instruction == 'clarification_needed':
                 response = self._generate_clarification_request(query, context)
             elif instruction == 'dont_know_lecturer':
@@ -182,12 +311,11 @@ class GeminiResponseGenerator:
             else:
                 # 3. Kiểm tra ngoài phạm vi (cho giảng viên)
                 if context and context.get('emergency_education', False):
-                    print(f"🚨 GEMINI: Emergency education mode activated")
-                    pass 
+                    logger.debug("🚨 GEMINI: Emergency education mode activated")
                 elif not self._is_lecturer_education_related(query) and not context.get('force_education_response', False):
                     response = self._get_contextual_out_of_scope_response_lecturer(conversation_context)
                     
-                    if session_id:
+                    if session_id and record:
                         self.memory.add_interaction(session_id, query, response, intent_info, entities)
                     
                     return {
@@ -198,26 +326,29 @@ class GeminiResponseGenerator:
                     }
                 
                 # 4. Xây dựng prompt cho giảng viên
-                enhanced_prompt = self._build_lecturer_context_aware_prompt(
-                    query, context, intent_info, entities, response_strategy, conversation_context
-                )
+                with span('prompt_build'):
+                    enhanced_prompt = self._build_lecturer_context_aware_prompt(
+                        query, context, intent_info, entities, response_strategy, conversation_context
+                    )
                 
                 # 5. Gọi Gemini API
-                response = self._call_gemini_api_optimized(enhanced_prompt, response_strategy)
+                response = self._call_gemini_api_optimized(
+                    enhanced_prompt, response_strategy, system_instruction=self.system_instruction,
+                    priority=priority, deadline=deadline
+                )
                 
                 # 6. Hậu xử lý để đảm bảo nhất quán cho giảng viên
                 if response:
-                    response = self._post_process_with_lecturer_consistency(
-                        response, query, context, response_strategy, conversation_context
-                    )
+                    with span('post_process'):
+                        response = self._post_process_with_lecturer_consistency(
+                            response, query, context, response_strategy, conversation_context
+                        )
             
             final_response = response or self._get_smart_fallback_with_context_lecturer(query, intent_info, conversation_context)
             
             # 7. Lưu vào bộ nhớ
-            if session_id:
-                print(f"🧠 MEMORY DEBUG: Saving interaction to memory...")
+            if session_id and record:
                 self.memory.add_interaction(session_id, query, final_response, intent_info, entities)
-                print(f"🧠 MEMORY DEBUG: Memory saved. New history length = {len(self.memory.conversations.get(session_id, {}).get('history', []))}")
 
             return {
                 'response': final_response,
@@ -231,7 +362,7 @@ class GeminiResponseGenerator:
             logger.error(f"Gemini API error: {str(e)}")
             fallback_response = self._get_smart_fallback_with_context_lecturer(query, intent_info, conversation_context)
             
-            if session_id:
+            if session_id and record:
                 self.memory.add_interaction(session_id, query, fallback_response, intent_info, entities)
             
             return {
@@ -241,56 +372,27 @@ class GeminiResponseGenerator:
                 'generation_time': time.time() - start_time
             }
 
-    def _generate_direct_lecturer_answer(self, query, context):
+    def _generate_direct_lecturer_answer(self, query, context, priority=PRIORITY_ANONYMOUS, deadline=None):
         """Generate direct answer for lecturers with high confidence"""
         
-        prompt = f"""
-        {LECTURER_SYSTEM_PROMPT}
+        with span('prompt_build'):
+            reference = truncate_to_tokens(context['db_answer'], get_token_budget().get('REFERENCE_TOKENS', 600))
+            prompt = render_strategy_prompt('direct_answer', query=query, reference=reference)
         
-        NHIỆM VỤ: Trả lời TRỰC TIẾP cho giảng viên BDU
-        
-        CÂU HỎI GIẢNG VIÊN: {query}
-        
-        THÔNG TIN CHÍNH XÁC TỪ CSDL:
-        {context['db_answer']}
-        
-        YÊU CẦU:
-        - Dùng CHÍNH XÁC thông tin từ CSDL
-        - Bắt đầu: "Dạ thầy/cô,"
-        - Kết thúc: "Thầy/cô có cần hỗ trợ thêm gì không ạ?"
-        - NGẮN GỌN, đi thẳng vào vấn đề
-        - KHÔNG format phức tạp
-        
-        Trả lời:
-        """
-        
-        response = self._call_gemini_api_optimized(prompt, 'direct_enhance')
+        response = self._call_gemini_api_optimized(prompt, 'direct_enhance', system_instruction=self.system_instruction,
+                                                   priority=priority, deadline=deadline)
         return response or f"Dạ thầy/cô, {context['db_answer']} 🎓 Thầy/cô có cần hỗ trợ thêm gì không ạ?"
     
-    def _generate_enhanced_lecturer_answer(self, query, context, intent_info, entities, session_id):
+    def _generate_enhanced_lecturer_answer(self, query, context, intent_info, entities, session_id,
+                                           priority=PRIORITY_ANONYMOUS, deadline=None):
         """Generate enhanced answer for lecturers"""
         
-        prompt = f"""
-        {LECTURER_SYSTEM_PROMPT}
-        
-        NHIỆM VỤ: Trả lời có bổ sung cho giảng viên BDU
+        with span('prompt_build'):
+            reference = truncate_to_tokens(context['db_answer'], get_token_budget().get('REFERENCE_TOKENS', 600))
+            prompt = render_strategy_prompt('enhanced_answer', query=query, reference=reference)
         
-        CÂU HỎI GIẢNG VIÊN: {query}
-        
-        THÔNG TIN LIÊN QUAN TỪ CSDL:
-        {context['db_answer']}
-        
-        YÊU CẦU:
-        - Sử dụng thông tin CSDL làm gốc
-        - Bổ sung ngữ cảnh phù hợp nếu cần
-        - Bắt đầu: "Dạ thầy/cô,"
-        - Kết thúc: "Thầy/cô có cần hỗ trợ thêm gì không ạ?"
-        - NGẮN GỌN, 2-3 câu tối đa
-        
-        Trả lời:
-        """
-        
-        response = self._call_gemini_api_optimized(prompt, 'balanced')
+        response = self._call_gemini_api_optimized(prompt, 'balanced', system_instruction=self.system_instruction,
+                                                   priority=priority, deadline=deadline)
         return response or f"Dạ thầy/cô, {context['db_answer']} 🎓 Thầy/cô có cần hỗ trợ thêm gì không ạ?"
     
     def _generate_clarification_request(self, query, context):
@@ -345,50 +447,23 @@ class GeminiResponseGenerator:
         
         return f"Dạ thầy/cô, em chưa có thông tin về vấn đề này. Thầy/cô có thể liên hệ {dept} qua email {contact} để được hỗ trợ chi tiết ạ. 🎓"
 
-    def _determine_lecturer_response_strategy(self, query, context, intent_info, conversation_context):
+    def _determine_lecturer_response_strategy(self, query, context, intent_info, conversation_context, verbose=False):
         """Xác định chiến lược phản hồi cho giảng viên"""
-        
+        strategy = self._select_lecturer_response_strategy(query, context, intent_info, conversation_context, verbose)
+        logger.debug("💡 Lecturer strategy selected: %s", strategy)
+        return strategy
+
+    def _select_lecturer_response_strategy(self, query, context, intent_info, conversation_context, verbose=False):
         has_real_history = bool(conversation_context.get('history') and len(conversation_context['history']) > 0)
         
-        print(f"🔍 LECTURER STRATEGY DEBUG: has_real_history = {has_real_history}")
-        if not has_real_history:
-             print("🔍 LECTURER STRATEGY DEBUG: No history, using standard strategy...")
-        else:
+        if has_real_history:
             # ✅ ENHANCED: Lecturer-specific follow-up detection
             last_interaction = conversation_context['history'][-1]
-            last_query = last_interaction['user_query'].lower()
             current_query = query.lower()
             
-            print(f"🔍 LECTURER STRATEGY DEBUG: last_query = '{last_query[:50]}...'")
-            print(f"🔍 LECTURER STRATEGY DEBUG: current_query = '{current_query[:50]}...'")
-            
-            # ✅ LECTURER-SPECIFIC topics
-            lecturer_topics = {
-                'ngân hàng đề thi': ['ngân hàng', 'đề thi', 'đề', 'khảo thí'],
-                'kê khai nhiệm vụ': ['kê khai', 'nhiệm vụ', 'giờ chuẩn'],
-                'tạp chí khoa học': ['tạp chí', 'bài viết', 'nghiên cứu'],
-                'thi đua khen thưởng': ['thi đua', 'khen thưởng', 'danh hiệu'],
-                'báo cáo': ['báo cáo', 'nộp', 'hạn cuối'],
-                'lịch giảng dạy': ['lịch', 'giảng dạy', 'thời khóa biểu'],
-                'cơ sở vật chất': ['cơ sở', 'phòng', 'trang thiết bị'],
-                'học phí': ['học phí', 'phí', 'tiền học', 'chi phí'],
-                'tuyển sinh': ['tuyển sinh', 'nhập học', 'đăng ký', 'điểm'],
-                'ngành học': ['ngành', 'chuyên ngành', 'khoa', 'đào tạo']
-            }
-            
-            last_main_topic = None
-            for topic, keywords in lecturer_topics.items():
-                if any(kw in last_query for kw in keywords):
-                    last_main_topic = topic
-                    break
-            
-            current_main_topic = None
-            for topic, keywords in lecturer_topics.items():
-                if any(kw in current_query for kw in keywords):
-                    current_main_topic = topic
-                    break
-
-            print(f"🔍 LECTURER STRATEGY DEBUG: last_main_topic = {last_main_topic}, current_main_topic = {current_main_topic}")
+            # ✅ Chủ đề của lượt trước đã tính sẵn khi ghi; câu hiện tại quét 1 lần (có cache)
+            last_main_topic = last_interaction.main_topic
+            current_main_topic = match_topics(query).main_topic
 
             has_exact_same_topic = last_main_topic is not None and last_main_topic == current_main_topic
             
@@ -401,140 +476,69 @@ class GeminiResponseGenerator:
             memory_test_words = ['nhớ không', 'hỏi gì', 'nói gì trước', 'vừa nói', 'tổng hợp']
             is_memory_test = any(word in current_query for word in memory_test_words)
 
-            print(f"🔍 LECTURER STRATEGY DEBUG: has_exact_same_topic = {has_exact_same_topic}")
-            print(f"🔍 LECTURER STRATEGY DEBUG: has_strong_continuation = {has_strong_continuation}")
-            print(f"🔍 LECTURER STRATEGY DEBUG: has_strong_clarification = {has_strong_clarification}")
+            if verbose:
+                logger.debug("🔍 Strategy inputs: last_query=%r current_query=%r last_topic=%s current_topic=%s "
+                             "same_topic=%s continuation=%s clarification=%s memory_test=%s",
+                             last_interaction.user_query[:50], current_query[:50], last_main_topic,
+                             current_main_topic, has_exact_same_topic, has_strong_continuation,
+                             has_strong_clarification, is_memory_test)
 
             # ĐIỀU KIỆN NGHIÊM NGẶT CHO CÁC CHIẾN LƯỢC NGỮ CẢNH
             if has_strong_continuation and has_exact_same_topic:
-                print(f"💡 LECTURER STRATEGY SELECTED: → follow_up_continuation")
                 return 'follow_up_continuation'
             
             if has_strong_clarification and has_exact_same_topic:
-                print(f"💡 LECTURER STRATEGY SELECTED: → follow_up_clarification")
                 return 'follow_up_clarification'
 
             if is_memory_test:
-                 print(f"💡 LECTURER STRATEGY SELECTED: → memory_reference")
                  return 'memory_reference'
                  
             if current_main_topic is not None and last_main_topic is not None and current_main_topic != last_main_topic:
-                print(f"💡 LECTURER STRATEGY SELECTED: → topic_shift")
                 return 'topic_shift'
         
         # MẶC ĐỊNH: Sử dụng logic chiến lược cơ bản cho giảng viên
-        print(f"🔍 LECTURER STRATEGY DEBUG: No clear follow-up detected, using standard strategy logic...")
-        
         if isinstance(context, dict) and context.get('confidence', 0) > 0.7:
-            print(f"💡 LECTURER STRATEGY SELECTED: → direct_enhance")
             return 'direct_enhance'
         
         if intent_info and intent_info.get('intent') in ['greeting', 'general'] and len(query.split()) <= 5:
-            print(f"💡 LECTURER STRATEGY SELECTED: → quick_clarify")
             return 'quick_clarify'
         
         if any(word in query.lower() for word in ['khó khăn', 'cần gấp', 'hạn cuối', 'urgent']):
-            print(f"💡 LECTURER STRATEGY SELECTED: → supportive_brief")
             return 'supportive_brief'
         
-        print(f"💡 LECTURER STRATEGY SELECTED: → balanced (default)")
         return 'balanced'
 
     def _build_lecturer_context_aware_prompt(self, query, context, intent_info, entities, strategy, conversation_context):
-        """Xây dựng prompt cho giảng viên với LECTURER_SYSTEM_PROMPT"""
-        
-        base_personality = f"""
-        {LECTURER_SYSTEM_PROMPT}
-
-        🤖 QUY TẮC VAI TRÒ NGHIÊM NGẶT:
-        - LUÔN giữ vai trò: "{self.role_consistency_rules['identity']}"
-        - KHÔNG BAO GIỜ xưng hô là: {', '.join(self.role_consistency_rules['prohibited_roles'])}
-        - LUÔN nói "em là AI assistant của BDU hỗ trợ giảng viên" nếu được hỏi về vai trò.
-
-        🗣️ PHONG CÁCH CHO GIẢNG VIÊN:
-        - LUÔN bắt đầu câu trả lời bằng "Dạ thầy/cô,".
-        - LUÔN kết thúc bằng "Thầy/cô có cần hỗ trợ thêm gì không ạ?"
-        - Dùng emoji phù hợp (🎓, 📚, 📊, 📋).
-        - TUYỆT ĐỐI KHÔNG nói dài dòng hay lặp lại.
-        - ĐI THẲNG VÀO TRỌNG TÂM.
         """
+        Xây dựng prompt cho giảng viên - chỉ render template của strategy được chọn.
+        LECTURER_SYSTEM_PROMPT nằm trong self.system_instruction, không lặp lại ở đây.
+        """
+        budget = get_token_budget()
         
         context_info = str(context.get('response', '')) if isinstance(context, dict) else str(context or '')
+        reference = truncate_to_tokens(context_info, budget.get('REFERENCE_TOKENS', 600))
         
         memory_context = ""
-        conversation_flow = ""
-        
         if conversation_context.get('history'):
-            flow_items = []
-            for h in conversation_context['history'][-3:]:
-                flow_items.append(f"Thầy/cô hỏi: '{h['user_query'][:40]}...' -> Em trả lời: '{h['bot_response'][:50]}...'")
-            
-            conversation_flow = "\n".join(flow_items)
-            
-            memory_context = f"""
-            ---
-            📚 NGỮ CẢNH HỘI THOẠI TRƯỚC VỚI GIẢNG VIÊN:
-            - Chủ đề chính đang thảo luận: {conversation_context.get('context_summary', 'Chung')}
-            - Các lĩnh vực thầy/cô quan tâm: {', '.join(conversation_context.get('user_interests', [])) or 'Chưa rõ'}
-            - Dòng chảy hội thoại gần đây:
-            {conversation_flow}
-            ---
-            """
-        
-        strategy_prompts = {
-            'follow_up_continuation': f"""
-            {base_personality}
-            {memory_context}
-            NHIỆM VỤ: Thầy/cô đang hỏi tiếp về CÙNG CHỦ ĐỀ.
-            ⚠️ KIỂM TRA: Thầy/cô hỏi "{query}". Đây là câu hỏi tiếp nối về chủ đề "{conversation_context.get('context_summary', 'trước đó')}".
-            HÀNH ĐỘNG: Cung cấp thông tin BỔ SUNG, đừng lặp lại ý cũ. Bắt đầu bằng "Dạ thầy/cô, ngoài ra về [chủ đề]..." hoặc một cách tự nhiên. Trả lời ngắn gọn.
-            DỮ LIỆU THAM KHẢO (nếu có): {context_info}
-            Trả lời:
-            """,
-            
-            'follow_up_clarification': f"""
-            {base_personality}
-            {memory_context}
-            NHIỆM VỤ: Thầy/cô muốn làm RÕ HƠN về CÙNG CHỦ ĐỀ.
-            ⚠️ KIỂM TRA: Thầy/cô hỏi "{query}". Đây là yêu cầu làm rõ về chủ đề "{conversation_context.get('context_summary', 'trước đó')}".
-            HÀNH ĐỘNG: Giải thích chi tiết, cụ thể hơn. Bắt đầu bằng "Dạ thầy/cô, để làm rõ hơn về [chủ đề]...".
-            DỮ LIỆU THAM KHẢO (nếu có): {context_info}
-            Trả lời:
-            """,
-            
-            'topic_shift': f"""
-            {base_personality}
-            {memory_context}
-            NHIỆM VỤ: Thầy/cô đã CHUYỂN SANG một chủ đề MỚI.
-            ⚠️ KIỂM TRA: Thầy/cô hỏi "{query}". Chủ đề này khác với chủ đề trước đó.
-            HÀNH ĐỘNG: Trả lời trực tiếp vào chủ đề mới. TUYỆT ĐỐI KHÔNG dùng các cụm từ như "như đã nói", "ngoài ra". Có thể thừa nhận sự thay đổi một cách nhẹ nhàng nếu muốn.
-            DỮ LIỆU THAM KHẢO (nếu có): {context_info}
-            Trả lời:
-            """,
-            
-            'memory_reference': f"""
-            {base_personality}
-            {memory_context}
-            NHIỆM VỤ: Thầy/cô đang hỏi về những gì đã nói (kiểm tra trí nhớ).
-            ⚠️ KIỂM TRA: Thầy/cô hỏi "{query}".
-            HÀNH ĐỘNG: Dựa vào 'Dòng chảy hội thoại gần đây' để tóm tắt ngắn gọn 1-2 ý chính đã trao đổi. Hỏi xem thầy/cô muốn biết thêm gì không.
-            Trả lời:
-            """,
-            
-            'balanced': f"""
-            {base_personality}
-            {memory_context if 'history' in conversation_context else ''}
-            NHIỆM VỤ: Trả lời câu hỏi của thầy/cô một cách tự nhiên, cân bằng.
-            ⚠️ KIỂM TRA: Thầy/cô hỏi "{query}". Đây có vẻ là một câu hỏi mới hoặc không có liên kết rõ ràng.
-            HÀNH ĐỘNG: Trả lời trực tiếp, ngắn gọn, đi thẳng vào vấn đề. KHÔNG tham chiếu đến hội thoại trước trừ khi câu hỏi CỰC KỲ liên quan.
-            DỮ LIỆU THAM KHẢO (nếu có): {context_info}
-            Trả lời:
-            """
-        }
-
-        # Dùng 'balanced' làm prompt mặc định cho các strategy khác chưa được định nghĩa riêng
-        final_prompt = strategy_prompts.get(strategy, strategy_prompts['balanced'])
-        print(f"📝 LECTURER PROMPT DEBUG (Strategy: {strategy}):\n{final_prompt[:400]}...") # In ra một phần prompt để debug
+            conversation_flow = build_conversation_flow(
+                conversation_context['history'], budget.get('HISTORY_TOKENS', 250)
+            )
+            memory_context = MEMORY_CONTEXT_TEMPLATE.substitute(
+                context_summary=conversation_context.get('context_summary', 'Chung'),
+                user_interests=', '.join(conversation_context.get('user_interests', [])) or 'Chưa rõ',
+                conversation_flow=conversation_flow
+            )
+        
+        final_prompt = render_strategy_prompt(
+            strategy,
+            memory_context=memory_context,
+            query=query,
+            topic=conversation_context.get('context_summary', 'trước đó'),
+            reference=reference
+        )
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"📝 LECTURER PROMPT DEBUG (Strategy: {strategy}):\n{final_prompt[:400]}...")
         return final_prompt
 
     def _post_process_with_lecturer_consistency(self, response, query, context, strategy, conversation_context):
@@ -644,10 +648,17 @@ class GeminiResponseGenerator:
         return any(kw in query_lower for kw in lecturer_education_keywords)
 
     # Keep existing methods but ensure they're adapted for lecturers
-    def _call_gemini_api_optimized(self, prompt: str, strategy: str) -> Optional[str]:
-        """Call Gemini API - same as before"""
+    def _call_gemini_api_optimized(self, prompt: str, strategy: str,
+                                   system_instruction: Optional[str] = None,
+                                   priority: int = PRIORITY_ANONYMOUS,
+                                   deadline: Optional[Deadline] = None) -> Optional[str]:
+        """Call Gemini API - system instruction (nếu có) gửi qua field riêng"""
+        # ✅ THÊM: Không còn đủ budget cho 1 lời gọi LLM -> None để caller dùng câu trả lời CSDL
+        if deadline and not deadline.has_budget_for('llm'):
+            deadline.skip('llm')
+            return None
+        
         try:
-            headers = {'Content-Type': 'application/json'}
             generation_configs = {
                 'quick_clarify': {"temperature": 0.3, "maxOutputTokens": 60},
                 'direct_enhance': {"temperature": 0.4, "maxOutputTokens": 120},
@@ -674,45 +685,151 @@ class GeminiResponseGenerator:
                 ]
             }
             
-            url = f"{self.base_url}?key={self.api_key}"
-            response = requests.post(url, headers=headers, json=data, timeout=20)
+            if system_instruction:
+                data["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+            
+            # ✅ THÊM: Thống kê kích thước prompt (input tokens quyết định latency và chi phí)
+            prompt_stats.record(
+                strategy,
+                self.system_instruction_tokens if system_instruction else 0,
+                estimate_tokens(prompt)
+            )
+            
+            # ✅ THÊM: Gộp các request giống hệt nhau đang chạy song song (single-flight)
+            key = make_key(self.model_name, data)
+            with span('llm', strategy=strategy):
+                return gemini_coalescer.do(
+                    key,
+                    lambda: self._request_generation(data, priority, deadline),
+                    wait_timeout=self._coalescer_wait_timeout(deadline)
+                )
+        except Exception as e:
+            logger.error(f"Gemini API call failed: {str(e)}")
+            return None
+    
+    @staticmethod
+    def _coalescer_wait_timeout(deadline: Optional[Deadline]) -> Optional[float]:
+        """Chờ single-flight tối đa tới lúc budget còn lại chỉ đủ cho 1 lời gọi LLM"""
+        if not deadline:
+            return None
+        return max(0.0, min(gemini_coalescer.local.wait_timeout,
+                            deadline.remaining() - deadline.min_budget('llm')))
+    
+    def _request_generation(self, data: Dict[str, Any], priority: int = PRIORITY_ANONYMOUS,
+                            deadline: Optional[Deadline] = None) -> Optional[str]:
+        """HTTP call thực tới generateContent, qua limiter (rate + concurrency + priority)"""
+        # ✅ THÊM: Có thể đã chờ single-flight lâu -> kiểm tra lại budget trước khi gọi upstream
+        if deadline and not deadline.has_budget_for('llm'):
+            deadline.skip('llm')
+            return None
+        
+        # Thời gian chờ trong hàng đợi không được ăn vào budget tối thiểu của lời gọi LLM
+        queue_timeout = None
+        if deadline:
+            queue_timeout = max(0.0, min(llm_limiter.queue_timeout, deadline.remaining() - deadline.min_budget('llm')))
+        
+        # ✅ THÊM: Chờ quá lâu trong hàng đợi -> None để caller fallback về câu trả lời CSDL
+        with span('llm_queue'):
+            admitted = llm_limiter.acquire(priority, timeout=queue_timeout)
+        if not admitted:
+            gemini_requests.inc('queue_timeout')
+            if deadline:
+                deadline.skip('llm')
+            return None
+        
+        outcome = 'error'
+        started = time.monotonic()
+        try:
+            headers = {'Content-Type': 'application/json', 'x-goog-api-key': self.api_key}
+            timeout = deadline.cap(20) if deadline else 20
+            response = requests.post(self.base_url, headers=headers, json=data, timeout=timeout)
             
             if response.status_code == 200:
+                outcome = 'empty'
                 result = response.json()
                 if 'candidates' in result and result['candidates']:
                     candidate = result['candidates'][0]
                     if 'content' in candidate and 'parts' in candidate['content']:
+                        outcome = 'success'
                         return candidate['content']['parts'][0]['text']
+            elif response.status_code == 429:
+                outcome = 'rate_limited'
+                retry_after = response.headers.get('Retry-After')
+                llm_limiter.report_rate_limited(float(retry_after) if retry_after and retry_after.isdigit() else None)
             else:
+                outcome = 'http_error'
                 logger.error(f"Gemini API Error {response.status_code}: {response.text}")
 
             return None
+        except requests.Timeout:
+            outcome = 'timeout'
+            logger.warning(f"⏱️ Gemini API call timed out after {timeout:.1f}s")
+            if deadline:
+                deadline.skip('llm')
+            return None
         except Exception as e:
             logger.error(f"Gemini API call failed: {str(e)}")
             return None
+        finally:
+            llm_limiter.release()
+            gemini_request_duration.observe(time.monotonic() - started)
+            gemini_requests.inc(outcome)
     
     def get_conversation_memory(self, session_id: str):
-        return self.memory.get_conversation_context(session_id)
+        """Context dạng JSON-serializable (dùng cho API)"""
+        context = self.memory.get_conversation_context(session_id)
+        context['history'] = [turn.as_dict() for turn in context['history']]
+        return context
     
     def clear_conversation_memory(self, session_id: str = None):
-        if session_id:
-            if session_id in self.memory.conversations:
-                del self.memory.conversations[session_id]
-        else:
-            self.memory.conversations.clear()
+        self.memory.clear(session_id)
+    
+    def probe_api(self) -> Dict[str, Any]:
+        """
+        Probe rẻ: GET metadata của model (không tốn token, không sinh nội dung).
+        Chỉ được gọi từ HealthMonitor ở background.
+        """
+        started = time.time()
+        if not self.api_key:
+            self.last_probe = {'available': False, 'error': 'api_key_missing', 'checked_at': started}
+            return self.last_probe
+        
+        try:
+            # ✅ CHANGED: key đi trong header - URL có thể lọt vào message của exception
+            url = f"{self.api_root}/models/{self.model_name}"
+            response = requests.get(url, headers={'x-goog-api-key': self.api_key}, timeout=5)
+            self.last_probe = {
+                'available': response.status_code == 200,
+                'status_code': response.status_code,
+                'latency': round(time.time() - started, 3),
+                'checked_at': started
+            }
+        except Exception as e:
+            # ✅ CHANGED: chỉ lưu tên exception - last_probe được trả ra các endpoint health công khai
+            self.last_probe = {
+                'available': False,
+                'error': type(e).__name__,
+                'latency': round(time.time() - started, 3),
+                'checked_at': started
+            }
+        return self.last_probe
     
     def get_system_status(self) -> Dict[str, Any]:
-        """Get system status for lecturers"""
+        """Get system status for lecturers - dùng kết quả probe đã cache, không gọi API"""
         try:
-            test_prompt = "Test ngắn cho giảng viên"
-            response = self._call_gemini_api_optimized(test_prompt, 'quick_clarify')
+            probe = self.last_probe or {}
+            available = bool(probe.get('available'))
             
             return {
-                'gemini_api_available': response is not None,
+                'gemini_api_available': available,
                 'api_key_configured': bool(self.api_key),
-                'service_status': 'active' if response else 'error',
+                'service_status': ('active' if available else 'error') if probe else 'unknown',
+                'last_probe': probe,
                 'mode': 'lecturer_focused_with_memory',
                 'memory_sessions': len(self.memory.conversations),
+                'memory_store': self.memory.get_stats(),
+                'single_flight': gemini_coalescer.get_stats(),
+                'llm_limiter': llm_limiter.get_stats(),
                 'features': [
                     'lecturer_conversation_memory',
                     'lecturer_role_consistency',
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gemini stand-in server cho test offline (không cần API key / mạng).
+
+Hỗ trợ các endpoint mà GeminiResponseGenerator dùng:
+- GET  /v1beta/models/<model>                          (health probe)
+- POST /v1beta/models/<model>:generateContent
+- POST /v1beta/models/<model>:streamGenerateContent   (?alt=sse hoặc JSON array)
+
+Phản hồi được replay từ fixtures (key = sha256 của prompt), có latency
+distribution, inject lỗi 429/5xx và slow-drip streaming. Cùng --seed và
+cùng thứ tự request -> kết quả lặp lại chính xác.
+
+Chạy:
+    python ai_models/gemini_stub_server.py --port 8765 --fixtures data/gemini_fixtures.json \\
+        --latency lognormal:-0.7,0.4 --rate-429 0.05 --rate-5xx 0.02 --seed 42
+
+Trỏ backend vào stub:
+    GEMINI_API_BASE_URL=http://127.0.0.1:8765/v1beta GEMINI_API_KEY=stub python manage.py runserver
+
+Record fixtures từ Gemini thật (prompt chưa có sẽ được forward và lưu lại):
+    GEMINI_API_KEY=... python ai_models/gemini_stub_server.py --record --fixtures data/gemini_fixtures.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+DEFAULT_UPSTREAM = 'https://generativelanguage.googleapis.com/v1beta'
+DEFAULT_MISS_TEXT = (
+    "Dạ thầy/cô, đây là phản hồi mẫu từ Gemini stub server. "
+    "🎓 Thầy/cô có cần hỗ trợ thêm gì không ạ?"
+)
+
+PATH_PATTERN = re.compile(r'/models/(?P<model>[^/:]+)(?::(?P<method>\w+))?$')
+
+
+def prompt_key(payload):
+    """Key của fixture: sha256 của system instruction + nội dung prompt"""
+    def texts(block):
+        return [part.get('text', '') for part in (block or {}).get('parts', [])]
+
+    prompt = {
+        'system': texts(payload.get('systemInstruction')),
+        'contents': [texts(content) for content in payload.get('contents', [])],
+    }
+    raw = json.dumps(prompt, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def prompt_preview(payload, length=80):
+    for content in payload.get('contents', []):
+        for part in content.get('parts', []):
+            if part.get('text'):
+                return part['text'][:length]
+    return ''
+
+
+class LatencyModel:
+    """
+    Latency distribution (giây), dạng "<kind>:<params>":
+    fixed:0.5 | uniform:0.2,1.5 | normal:0.8,0.2 | lognormal:-0.7,0.4 | exponential:0.6
+    """
+
+    def __init__(self, spec, rng):
+        self.spec = spec or 'fixed:0'
+        self.rng = rng
+        kind, _, params = self.spec.partition(':')
+        self.kind = kind
+        self.params = [float(p) for p in params.split(',') if p]
+
+        samplers = {
+            'fixed': lambda: self.params[0],
+            'uniform': lambda: self.rng.uniform(self.params[0], self.params[1]),
+            'normal': lambda: self.rng.gauss(self.params[0], self.params[1]),
+            'lognormal': lambda: self.rng.lognormvariate(self.params[0], self.params[1]),
+            'exponential': lambda: self.rng.expovariate(1.0 / self.params[0]),
+        }
+        if kind not in samplers:
+            raise ValueError(f"Unknown latency distribution: {self.spec}")
+        self._sample = samplers[kind]
+
+    def sample(self):
+        return max(0.0, self._sample())
+
+
+class FixtureStore:
+    """Fixtures dạng JSON: {"version": 1, "fixtures": {key: {"text": ..., ...}}}"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.fixtures = {}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.fixtures = json.load(f).get('fixtures', {})
+
+    def get(self, key):
+        return self.fixtures.get(key)
+
+    def put(self, key, fixture):
+        with self._lock:
+            self.fixtures[key] = fixture
+            if not self.path:
+                return
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'version': 1, 'fixtures': self.fixtures}, f, ensure_ascii=False, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+class StubState:
+    """Cấu hình + trạng thái dùng chung giữa các request handler"""
+
+    def __init__(self, args):
+        self.rng = random.Random(args.seed)
+        self.rng_lock = threading.Lock()
+        self.latency = LatencyModel(args.latency, self.rng)
+        self.fixtures = FixtureStore(args.fixtures)
+        self.rate_429 = args.rate_429
+        self.rate_5xx = args.rate_5xx
+        self.retry_after = args.retry_after
+        self.miss = args.miss
+        self.drip_interval = args.drip_interval
+        self.chunk_chars = args.chunk_chars
+        self.record = args.record
+        self.upstream = args.upstream.rstrip('/')
+        self.api_key = os.getenv('GEMINI_API_KEY')
+
+        self.stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'hits': 0, 'misses': 0, 'recorded': 0,
+                      'injected_429': 0, 'injected_5xx': 0, 'streams': 0}
+
+    def count(self, name):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def draw(self):
+        """1 lần rút ngẫu nhiên cho mỗi request (latency + fault), giữ thứ tự seed ổn định"""
+        with self.rng_lock:
+            latency = self.latency.sample()
+            roll = self.rng.random()
+        if roll < self.rate_429:
+            fault = 429
+        elif roll < self.rate_429 + self.rate_5xx:
+            fault = 503
+        else:
+            fault = None
+        return latency, fault
+
+    def resolve(self, model, payload):
+        """Trả về (text, usage) từ fixture, upstream (record mode) hoặc câu mặc định"""
+        key = prompt_key(payload)
+        fixture = self.fixtures.get(key)
+        if fixture:
+            self.count('hits')
+            return fixture['text'], fixture.get('usageMetadata')
+
+        self.count('misses')
+        if self.record:
+            text, usage = self._record(model, payload, key)
+            if text is not None:
+                return text, usage
+
+        if self.miss == 'error':
+            return None, None
+        return DEFAULT_MISS_TEXT, None
+
+    def _record(self, model, payload, key):
+        if not self.api_key:
+            return None, None
+
+        url = f"{self.upstream}/models/{model}:generateContent"
+        request = urllib.request.Request(
+            url, data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json', 'x-goog-api-key': self.api_key}, method='POST'
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                result = json.loads(response.read().decode('utf-8'))
+            text = result['candidates'][0]['content']['parts'][0]['text']
+        except (urllib.error.URLError, KeyError, IndexError, ValueError) as e:
+            print(f"⚠️ Record failed: {e}")
+            return None, None
+
+        usage = result.get('usageMetadata')
+        self.fixtures.put(key, {
+            'model': model,
+            'prompt_preview': prompt_preview(payload),
+            'text': text,
+            'usageMetadata': usage,
+            'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        })
+        self.count('recorded')
+        return text, usage
+
+
+def _generation_body(text, model, usage=None, finish_reason='STOP'):
+    candidate = {'content': {'parts': [{'text': text}], 'role': 'model'}, 'index': 0}
+    if finish_reason:
+        candidate['finishReason'] = finish_reason
+    body = {'candidates': [candidate], 'modelVersion': model}
+    if usage:
+        body['usageMetadata'] = usage
+    return body
+
+
+def _error_body(code, status, message):
+    return {'error': {'code': code, 'message': message, 'status': status}}
+
+
+class GeminiStubHandler(BaseHTTPRequestHandler):
+    server_version = 'GeminiStub/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def state(self) -> StubState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, code, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == '/__stub__/stats':
+            with self.state.stats_lock:
+                return self._send_json(200, dict(self.state.stats))
+
+        match = PATH_PATTERN.search(parsed.path)
+        if not match or match.group('method'):
+            return self._send_json(404, _error_body(404, 'NOT_FOUND', 'Unknown path'))
+
+        model = match.group('model')
+        return self._send_json(200, {
+            'name': f'models/{model}',
+            'displayName': f'{model} (stub)',
+            'supportedGenerationMethods': ['generateContent', 'streamGenerateContent'],
+        })
+
+    def do_POST(self):
+        # Đọc hết body trước mọi response - byte chưa đọc sẽ làm hỏng request kế tiếp trên
+        # kết nối keep-alive (HTTP/1.1)
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            self.close_connection = True
+            return self._send_json(400, _error_body(400, 'INVALID_ARGUMENT', 'Invalid Content-Length'))
+        body = self.rfile.read(length) if length > 0 else b''
+
+        parsed = urlparse(self.path)
+        match = PATH_PATTERN.search(parsed.path)
+        method = match.group('method') if match else None
+        if method not in ('generateContent', 'streamGenerateContent'):
+            return self._send_json(404, _error_body(404, 'NOT_FOUND', 'Unknown path'))
+
+        try:
+            payload = json.loads(body.decode('utf-8') or '{}')
+        except ValueError:
+            return self._send_json(400, _error_body(400, 'INVALID_ARGUMENT', 'Invalid JSON payload'))
+
+        self.state.count('requests')
+        latency, fault = self.state.draw()
+        time.sleep(latency)
+
+        if fault == 429:
+            self.state.count('injected_429')
+            return self._send_json(
+                429, _error_body(429, 'RESOURCE_EXHAUSTED', 'Resource has been exhausted (stub)'),
+                headers={'Retry-After': str(self.state.retry_after)}
+            )
+        if fault:
+            self.state.count('injected_5xx')
+            return self._send_json(
+                fault, _error_body(fault, 'UNAVAILABLE', 'The model is overloaded (stub)')
+            )
+
+        model = match.group('model')
+        text, usage = self.state.resolve(model, payload)
+        if text is None:
+            return self._send_json(404, _error_body(404, 'NOT_FOUND', 'No fixture for prompt'))
+
+        if method == 'generateContent':
+            return self._send_json(200, _generation_body(text, model, usage))
+
+        sse = parse_qs(parsed.query).get('alt') == ['sse']
+        self._stream(text, model, usage, sse)
+
+    def _stream(self, text, model, usage, sse):
+        """Slow-drip streaming: chia text thành chunk, nghỉ drip_interval giữa các chunk"""
+        self.state.count('streams')
+        size = max(1, self.state.chunk_chars)
+        chunks = [text[i:i + size] for i in range(0, len(text), size)] or ['']
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream' if sse else 'application/json; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def write(data):
+            raw = data.encode('utf-8')
+            self.wfile.write(f"{len(raw):X}\r\n".encode('ascii') + raw + b"\r\n")
+            self.wfile.flush()
+
+        try:
+            if not sse:
+                write('[')
+            for index, chunk in enumerate(chunks):
+                last = index == len(chunks) - 1
+                body = _generation_body(chunk, model, usage if last else None,
+                                        finish_reason='STOP' if last else None)
+                event = json.dumps(body, ensure_ascii=False)
+                if sse:
+                    write(f"data: {event}\r\n\r\n")
+                else:
+                    write(('' if index == 0 else ',\r\n') + event)
+                if not last:
+                    time.sleep(self.state.drip_interval)
+            if not sse:
+                write(']')
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def build_server(args) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((args.host, args.port), GeminiStubHandler)
+    server.daemon_threads = True
+    server.state = StubState(args)
+    server.quiet = args.quiet
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Local Gemini stand-in server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--fixtures', default=None, help='File JSON chứa fixtures')
+    parser.add_argument('--latency', default='fixed:0',
+                        help='fixed:S | uniform:A,B | normal:MU,SIGMA | lognormal:MU,SIGMA | exponential:MEAN')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Xác suất trả 429')
+    parser.add_argument('--rate-5xx', type=float, default=0.0, help='Xác suất trả 503')
+    parser.add_argument('--retry-after', type=int, default=5, help='Retry-After (giây) khi trả 429')
+    parser.add_argument('--miss', choices=['canned', 'error'], default='canned',
+                        help='Prompt không có fixture: trả câu mẫu hoặc 404')
+    parser.add_argument('--drip-interval', type=float, default=0.1, help='Giây giữa các chunk khi stream')
+    parser.add_argument('--chunk-chars', type=int, default=24, help='Số ký tự mỗi chunk khi stream')
+    parser.add_argument('--seed', type=int, default=None, help='Seed cho latency/fault (lặp lại chính xác)')
+    parser.add_argument('--record', action='store_true',
+                        help='Forward prompt chưa có fixture tới Gemini thật (GEMINI_API_KEY) và lưu lại')
+    parser.add_argument('--upstream', default=DEFAULT_UPSTREAM)
+    parser.add_argument('--quiet', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = build_server(args)
+    state = server.state
+    print(f"🧪 Gemini stub listening on http://{args.host}:{args.port}/v1beta "
+          f"({len(state.fixtures.fixtures)} fixtures, latency={args.latency}, "
+          f"429={args.rate_429}, 5xx={args.rate_5xx}, seed={args.seed}, record={args.record})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"📊 Stub stats: {state.stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+# ai_models/health_monitor.py
+
+import logging
+import threading
+import time
+from typing import Dict, Any
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """
+    Background refresher cho trạng thái các thành phần phụ thuộc
+    (Gemini, SBERT, FAISS, PhoBERT, Whisper, Database).
+
+    Health/status endpoints chỉ đọc snapshot trong cache, KHÔNG BAO GIỜ
+    gọi Gemini generateContent trên request path.
+    """
+
+    def __init__(self, interval: int = None):
+        config = getattr(settings, 'HEALTH_CHECK', {})
+        self.interval = interval or config.get('REFRESH_INTERVAL', 60)
+        self.stale_after = config.get('STALE_AFTER', self.interval * 3)
+
+        self._snapshot = {
+            'status': 'starting',
+            'checked_at': None,
+            'components': {},
+            'system_status': {},
+            'speech_status': {},
+        }
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Khởi động thread refresh (idempotent)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='health-monitor', daemon=True
+            )
+            self._thread.start()
+        logger.info(f"🩺 Health monitor started (interval={self.interval}s)")
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Health refresh failed: {e}")
+            self._stop_event.wait(self.interval)
+
+    def refresh(self) -> Dict[str, Any]:
+        """Chạy tất cả probes và cập nhật snapshot"""
+        # Import trong function để tránh circular import
+        from .services import chatbot_ai
+        from .speech_service import speech_service
+
+        started = time.time()
+
+        gemini_probe = chatbot_ai.response_generator.probe_api()
+        system_status = chatbot_ai.get_system_status()
+        speech_status = speech_service.get_system_status()
+
+        components = {
+            'database': self._probe_database(),
+            'gemini': gemini_probe,
+            'sbert': {'available': bool(system_status.get('sbert_model'))},
+            'faiss': {
+                'available': bool(system_status.get('faiss_index')),
+                'entries': system_status.get('knowledge_entries', 0),
+            },
+            'phobert': {'available': bool(system_status.get('phobert_available'))},
+            'whisper': {'available': bool(speech_status.get('available'))},
+        }
+
+        # Retrieval (SBERT + FAISS) và DB là bắt buộc; Gemini/PhoBERT/Whisper có fallback
+        ready = (
+            components['database']['available']
+            and components['sbert']['available']
+            and components['faiss']['available']
+        )
+        degraded = not all(c.get('available') for c in components.values())
+
+        snapshot = {
+            'status': ('degraded' if degraded else 'healthy') if ready else 'unready',
+            'ready': ready,
+            'checked_at': time.time(),
+            'probe_duration': round(time.time() - started, 3),
+            'components': components,
+            'system_status': system_status,
+            'speech_status': speech_status,
+        }
+
+        with self._lock:
+            self._snapshot = snapshot
+
+        logger.debug(f"🩺 Health snapshot refreshed: {snapshot['status']} ({snapshot['probe_duration']}s)")
+        return snapshot
+
+    def _probe_database(self) -> Dict[str, Any]:
+        from django.db import connection
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return {'available': True}
+        except Exception as e:
+            return {'available': False, 'error': str(e)}
+        finally:
+            connection.close()
+
+    def get_snapshot(self) -> Dict[str, Any]:
+        """Trả về snapshot đã cache, kèm tuổi của dữ liệu"""
+        self.start()
+        with self._lock:
+            snapshot = dict(self._snapshot)
+
+        checked_at = snapshot.get('checked_at')
+        snapshot['age'] = round(time.time() - checked_at, 1) if checked_at else None
+        snapshot['stale'] = checked_at is None or snapshot['age'] > self.stale_after
+        return snapshot
+
+    def is_ready(self) -> bool:
+        snapshot = self.get_snapshot()
+        return bool(snapshot.get('ready')) and not snapshot['stale']
+
+
+# Global monitor instance
+health_monitor = HealthMonitor()
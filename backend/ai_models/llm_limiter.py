@@ -0,0 +1,184 @@
+# ai_models/llm_limiter.py
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Mức ưu tiên (số nhỏ hơn = được phục vụ trước)
+PRIORITY_FACULTY = 0      # Giảng viên đã đăng nhập, chat trực tiếp
+PRIORITY_ANONYMOUS = 1    # Session ẩn danh, chat trực tiếp
+PRIORITY_BATCH = 2        # Batch / test scripts
+
+PRIORITY_NAMES = {
+    PRIORITY_FACULTY: 'faculty',
+    PRIORITY_ANONYMOUS: 'anonymous',
+    PRIORITY_BATCH: 'batch',
+}
+
+
+def resolve_priority(user_context: Optional[Dict[str, Any]] = None, batch: bool = False) -> int:
+    """Chọn mức ưu tiên cho request"""
+    if batch:
+        return PRIORITY_BATCH
+    return PRIORITY_FACULTY if user_context else PRIORITY_ANONYMOUS
+
+
+class LLMLimiter:
+    """
+    Giới hạn lời gọi LLM ra ngoài: token bucket (requests/giây) + số request
+    đồng thời tối đa, xếp hàng theo mức ưu tiên (FIFO trong cùng mức).
+
+    Request chờ quá queue_timeout sẽ bị từ chối (acquire trả về False) để
+    caller fallback về câu trả lời từ CSDL thay vì treo tới timeout.
+    """
+
+    def __init__(self, max_concurrency: int = 4, requests_per_minute: float = 60,
+                 burst: int = 10, queue_timeout: float = 8.0, max_queue: int = 50,
+                 rate_limit_backoff: float = 10.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate = requests_per_minute / 60.0 if requests_per_minute else 0
+        self.burst = max(1, burst)
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.rate_limit_backoff = rate_limit_backoff
+
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+
+        self._stats = {
+            name: {'admitted': 0, 'timeouts': 0, 'rejected': 0,
+                   'total_wait': 0.0, 'max_wait': 0.0}
+            for name in PRIORITY_NAMES.values()
+        }
+        self._max_queue_seen = 0
+        self._rate_limited = 0
+
+    def _refill(self, now: float):
+        if self.rate:
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def _time_until_token(self, now: float) -> float:
+        """Số giây cần chờ trước khi có token (0 = có ngay)"""
+        if self._paused_until > now:
+            return self._paused_until - now
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def acquire(self, priority: int = PRIORITY_ANONYMOUS, timeout: Optional[float] = None) -> bool:
+        """Chờ tới lượt; False nếu hết thời gian chờ hoặc hàng đợi đầy"""
+        timeout = self.queue_timeout if timeout is None else timeout
+        stats = self._stats[PRIORITY_NAMES.get(priority, 'anonymous')]
+        enqueued_at = time.monotonic()
+        deadline = enqueued_at + timeout
+
+        with self._cond:
+            if self.max_queue and len(self._waiters) >= self.max_queue:
+                stats['rejected'] += 1
+                logger.warning(f"🚦 LLM queue full ({len(self._waiters)}), rejecting request")
+                return False
+
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiters, entry)
+            self._max_queue_seen = max(self._max_queue_seen, len(self._waiters))
+
+            while True:
+                now = time.monotonic()
+                wait_for = None
+                if self._waiters[0] == entry and self._in_flight < self.max_concurrency:
+                    wait_for = self._time_until_token(now)
+                    if wait_for <= 0:
+                        heapq.heappop(self._waiters)
+                        if self.rate:
+                            self._tokens -= 1
+                        self._in_flight += 1
+
+                        waited = now - enqueued_at
+                        stats['admitted'] += 1
+                        stats['total_wait'] += waited
+                        stats['max_wait'] = max(stats['max_wait'], waited)
+                        self._cond.notify_all()
+                        return True
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    stats['timeouts'] += 1
+                    self._cond.notify_all()
+                    logger.warning(
+                        f"🚦 LLM queue wait exceeded {timeout}s "
+                        f"(priority={PRIORITY_NAMES.get(priority, priority)}), falling back"
+                    )
+                    return False
+
+                self._cond.wait(min(remaining, wait_for) if wait_for else remaining)
+
+    def release(self):
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._cond.notify_all()
+
+    def report_rate_limited(self, retry_after: Optional[float] = None):
+        """Upstream trả 429: tạm dừng cấp token trong retry_after giây"""
+        backoff = retry_after if retry_after else self.rate_limit_backoff
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + backoff)
+            self._tokens = 0.0
+            self._rate_limited += 1
+            self._cond.notify_all()
+        logger.warning(f"🚦 Gemini rate limited (429), pausing outbound calls for {backoff}s")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            by_priority = {}
+            for name, entry in self._stats.items():
+                by_priority[name] = {
+                    'admitted': entry['admitted'],
+                    'timeouts': entry['timeouts'],
+                    'rejected': entry['rejected'],
+                    'avg_wait': round(entry['total_wait'] / entry['admitted'], 3) if entry['admitted'] else 0,
+                    'max_wait': round(entry['max_wait'], 3),
+                }
+            return {
+                'queue_length': len(self._waiters),
+                'max_queue_length': self._max_queue_seen,
+                'in_flight': self._in_flight,
+                'max_concurrency': self.max_concurrency,
+                'tokens': round(self._tokens, 2) if self.rate else None,
+                'paused_for': round(max(0.0, self._paused_until - now), 1),
+                'rate_limited': self._rate_limited,
+                'by_priority': by_priority,
+            }
+
+
+def _build_llm_limiter() -> LLMLimiter:
+    from django.conf import settings
+    config = getattr(settings, 'GEMINI_RATE_LIMIT', {})
+    return LLMLimiter(
+        max_concurrency=config.get('MAX_CONCURRENCY', 4),
+        requests_per_minute=config.get('REQUESTS_PER_MINUTE', 60),
+        burst=config.get('BURST', 10),
+        queue_timeout=config.get('QUEUE_TIMEOUT', 8),
+        max_queue=config.get('MAX_QUEUE', 50),
+        rate_limit_backoff=config.get('RATE_LIMIT_BACKOFF', 10),
+    )
+
+
+# Global limiter cho các lời gọi Gemini generateContent
+llm_limiter = _build_llm_limiter()
@@ -5,6 +5,9 @@ import re
 from sklearn.metrics.pairwise import cosine_similarity
 import time
 
+from backend.logging_utils import log_sampler
+from backend.tracing import span
+
 # Try to import transformers, fallback if not available
 try:
     from transformers import AutoTokenizer, AutoModel
@@ -29,6 +32,7 @@ class PhoBERTIntentClassifier:
         # Initialize components
         self.intent_categories = self._initialize_lecturer_intents()
         self.entity_patterns = self._initialize_lecturer_entities()
+        self._intent_embeddings = None  # (intent names, ma trận embedding) - encode 1 lần cho batch
         
         # ✅ THÊM: Initialize normalizer BEFORE model loading
         self.normalizer = None
@@ -243,26 +247,67 @@ class PhoBERTIntentClassifier:
     def classify_intent(self, query):
         """Enhanced intent classification with normalization for lecturers"""
         if not query or not query.strip():
-            return {
-                'intent': 'general',
-                'confidence': 0.3,
-                'description': 'Câu hỏi chung',
-                'response_style': 'neutral'
-            }
+            return self._empty_query_intent()
+        
+        normalized_query, intent_scores = self._score_intent_keywords(query)
         
+        # Method 3: PhoBERT similarity (if available)
+        if not self.fallback_mode and self.model and self.tokenizer:
+            try:
+                # Use normalized query for semantic similarity
+                self._add_semantic_similarity(normalized_query, intent_scores)
+            except Exception as e:
+                logger.warning(f"Semantic similarity failed, using fallback: {str(e)}")
+        
+        return self._select_intent(normalized_query, intent_scores)
+    
+    def classify_intents(self, queries):
+        """
+        ✅ THÊM: Batch intent classification - keyword scoring từng câu,
+        PhoBERT encode cả batch 1 lần (embedding của intent được cache)
+        """
+        results = [None] * len(queries)
+        scored = []
+        for index, query in enumerate(queries):
+            if not query or not query.strip():
+                results[index] = self._empty_query_intent()
+            else:
+                normalized_query, intent_scores = self._score_intent_keywords(query)
+                scored.append((index, normalized_query, intent_scores))
+        
+        if scored and not self.fallback_mode and self.model and self.tokenizer:
+            try:
+                self._add_semantic_similarity_batch(
+                    [normalized for _, normalized, _ in scored],
+                    [intent_scores for _, _, intent_scores in scored]
+                )
+            except Exception as e:
+                logger.warning(f"Batch semantic similarity failed, using keyword scores: {str(e)}")
+        
+        for index, normalized_query, intent_scores in scored:
+            results[index] = self._select_intent(normalized_query, intent_scores)
+        return results
+    
+    def _empty_query_intent(self):
+        return {
+            'intent': 'general',
+            'confidence': 0.3,
+            'description': 'Câu hỏi chung',
+            'response_style': 'neutral'
+        }
+    
+    def _score_intent_keywords(self, query):
+        """Keyword + context scoring (Method 1, 2); trả về (normalized_query, intent_scores)"""
         # ✅ CRITICAL: Check if normalizer exists
         if not self.normalizer:
-            print("❌ NORMALIZER ERROR: Normalizer not available")
+            logger.warning("❌ NORMALIZER ERROR: Normalizer not available")
             query_variants = [query, query.lower()]
             normalized_query = query.lower()
         else:
             # NORMALIZE QUERY FIRST
-            normalized_query = self.normalizer.normalize_query(query)
-            query_variants = self.normalizer.create_search_variants(query)
-        
-        print(f"🔍 LECTURER INTENT DEBUG: Original = '{query}'")
-        print(f"🔍 LECTURER INTENT DEBUG: Normalized = '{normalized_query}'")
-        print(f"🔍 LECTURER INTENT DEBUG: Variants = {query_variants}")
+            with span('normalize'):
+                normalized_query = self.normalizer.normalize_query(query)
+                query_variants = self.normalizer.create_search_variants(query)
         
         intent_scores = {}
         
@@ -297,28 +342,27 @@ class PhoBERTIntentClassifier:
                     # Update intent score with max from all variants
                     intent_scores[intent] = max(intent_scores.get(intent, 0), min(base_score, 1.0))
         
-        print(f"🔍 LECTURER INTENT DEBUG: Intent scores = {intent_scores}")
+        # ✅ CHANGED: print() -> 1 dòng DEBUG lấy mẫu (LOG_SAMPLING), chỉ format dict khi được chọn
+        verbose = log_sampler.sample(logger)
+        keyword_scores = dict(intent_scores) if verbose else None
         
         # Method 2: Context-based boosting with normalized query for lecturers
         self._boost_lecturer_contextual_intents(normalized_query.lower(), intent_scores)
         
-        print(f"🔍 LECTURER INTENT DEBUG: After lecturer boosting = {intent_scores}")
-        
-        # Method 3: PhoBERT similarity (if available)
-        if not self.fallback_mode and self.model and self.tokenizer:
-            try:
-                # Use normalized query for semantic similarity
-                self._add_semantic_similarity(normalized_query, intent_scores)
-            except Exception as e:
-                logger.warning(f"Semantic similarity failed, using fallback: {str(e)}")
+        if verbose:
+            logger.debug("🔍 Intent scoring: query=%r normalized=%r variants=%s keyword_scores=%s boosted=%s",
+                         query, normalized_query, query_variants,
+                         {k: v for k, v in keyword_scores.items() if v}, {k: v for k, v in intent_scores.items() if v})
         
+        return normalized_query, intent_scores
+    
+    def _select_intent(self, normalized_query, intent_scores):
+        """Chọn intent tốt nhất theo threshold động"""
         # Find best intent
         if intent_scores:
             best_intent = max(intent_scores.items(), key=lambda x: x[1])
             intent_name, confidence = best_intent
             
-            print(f"🔍 LECTURER INTENT DEBUG: Best intent = {intent_name}, confidence = {confidence}")
-            
             # ✅ Dynamic threshold based on query complexity for lecturers
             base_threshold = self.intent_categories[intent_name]['confidence_threshold']
             if self.fallback_mode:
@@ -326,10 +370,10 @@ class PhoBERTIntentClassifier:
             else:
                 threshold = base_threshold * 0.5  # ✅ LOWER with normalization
             
-            print(f"🔍 LECTURER INTENT DEBUG: Threshold = {threshold}, base = {base_threshold}")
+            logger.debug("🔍 Best intent %s confidence=%.3f threshold=%.3f matched=%s",
+                         intent_name, confidence, threshold, confidence >= threshold)
             
             if confidence >= threshold:
-                print(f"🔍 LECTURER INTENT DEBUG: INTENT MATCHED!")
                 return {
                     'intent': intent_name,
                     'confidence': confidence,
@@ -339,7 +383,6 @@ class PhoBERTIntentClassifier:
                     'lecturer_optimized': True
                 }
         
-        print(f"🔍 LECTURER INTENT DEBUG: NO INTENT MATCHED - using general")
         return {
             'intent': 'general',
             'confidence': 0.3,
@@ -412,6 +455,51 @@ class PhoBERTIntentClassifier:
         except Exception as e:
             logger.warning(f"Semantic similarity failed: {str(e)}")
     
+    def _add_semantic_similarity_batch(self, queries, intent_scores_list):
+        """PhoBERT similarity cho cả batch: 1 ma trận query x intent"""
+        if self._intent_embeddings is None:
+            names = list(self.intent_categories)
+            texts = [
+                f"{config['description']} {' '.join(config['keywords'][:5])}"
+                for config in self.intent_categories.values()
+            ]
+            embeddings = self.encode_texts(texts)
+            if embeddings is None:
+                return
+            self._intent_embeddings = (names, embeddings)
+        
+        names, intent_embeddings = self._intent_embeddings
+        query_embeddings = self.encode_texts(queries)
+        if query_embeddings is None:
+            return
+        
+        similarities = cosine_similarity(query_embeddings, intent_embeddings)
+        for intent_scores, row in zip(intent_scores_list, similarities):
+            for intent, similarity in zip(names, row):
+                # Blend with keyword score (giống _add_semantic_similarity)
+                intent_scores[intent] = (intent_scores.get(intent, 0) * 0.7) + (similarity * 0.3)
+    
+    def encode_texts(self, texts, batch_size=32):
+        """Encode nhiều câu theo batch (padding trong từng batch)"""
+        if self.fallback_mode or not self.model or not self.tokenizer:
+            return None
+        
+        try:
+            chunks = []
+            for start in range(0, len(texts), batch_size):
+                inputs = self.tokenizer(texts[start:start + batch_size], return_tensors="pt",
+                                        padding=True, truncation=True, max_length=256)
+                inputs = {k: v.to(self.device) for k, v in inputs.items()}
+                
+                with torch.no_grad():
+                    outputs = self.model(**inputs)
+                chunks.append(outputs.pooler_output.cpu().numpy())
+            
+            return np.vstack(chunks)
+        except Exception as e:
+            logger.error(f"Error encoding texts: {str(e)}")
+            return None
+    
     def encode_text(self, text):
         """Encode text using PhoBERT with error handling"""
         if self.fallback_mode or not self.model or not self.tokenizer:
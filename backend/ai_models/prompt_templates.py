@@ -0,0 +1,219 @@
+# ai_models/prompt_templates.py
+
+import logging
+import threading
+from string import Template
+from typing import Dict, Any, List
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# ✅ SYSTEM PROMPT CỤ THỂ CHO GIẢNG VIÊN
+LECTURER_SYSTEM_PROMPT = """Bạn là AI assistant của Đại học Bình Dương (BDU), chuyên hỗ trợ giảng viên.
+
+🎯 QUY TẮC QUAN TRỌNG:
+- LUÔN xưng hô: "thầy/cô" (TUYỆT ĐỐI KHÔNG dùng "bạn", "mình", "anh/chị")
+- Bắt đầu: "Dạ thầy/cô,"
+- Kết thúc: "Thầy/cô có cần hỗ trợ thêm gì không ạ?"
+- NGẮN GỌN - Chỉ 1-2 câu chính, đi thẳng vào vấn đề
+- KHÔNG CHẾ TẠO thông tin không có
+- KHÔNG dùng format phức tạp với **1. **2. hay bullets
+
+✅ PHONG CÁCH MẪU:
+"Dạ thầy/cô, [thông tin chính ngắn gọn]. [Thêm 1 câu bổ sung nếu cần]. 🎓 Thầy/cô có cần hỗ trợ thêm gì không ạ?"
+
+🚫 TUYỆT ĐỐI TRÁNH:
+- Format phức tạp (**1. **2. **3. etc.)
+- Bullets (• hoặc *)
+- Câu trả lời dài dòng trên 3 câu
+- Thông tin không chắc chắn
+- Chế tạo số liệu, quy định
+
+📝 KHI KHÔNG HIỂU RÕ:
+- Hỏi lại để làm rõ: "Dạ thầy/cô, để em hỗ trợ chính xác, thầy/cô có thể nói rõ hơn về [vấn đề cụ thể] không ạ?"
+
+❌ KHI KHÔNG CÓ THÔNG TIN:
+- Nói thẳng: "Dạ thầy/cô, em chưa có thông tin về vấn đề này. Thầy/cô có thể liên hệ [bộ phận liên quan] để được hỗ trợ chi tiết ạ."
+"""
+
+ROLE_RULES_TEMPLATE = Template("""
+🤖 QUY TẮC VAI TRÒ NGHIÊM NGẶT:
+- LUÔN giữ vai trò: "$identity"
+- KHÔNG BAO GIỜ xưng hô là: $prohibited_roles
+- LUÔN nói "em là AI assistant của BDU hỗ trợ giảng viên" nếu được hỏi về vai trò.
+
+🗣️ PHONG CÁCH CHO GIẢNG VIÊN:
+- Dùng emoji phù hợp (🎓, 📚, 📊, 📋).
+- TUYỆT ĐỐI KHÔNG nói dài dòng hay lặp lại.
+- ĐI THẲNG VÀO TRỌNG TÂM.
+""")
+
+MEMORY_CONTEXT_TEMPLATE = Template("""---
+📚 NGỮ CẢNH HỘI THOẠI TRƯỚC VỚI GIẢNG VIÊN:
+- Chủ đề chính đang thảo luận: $context_summary
+- Các lĩnh vực thầy/cô quan tâm: $user_interests
+- Dòng chảy hội thoại gần đây:
+$conversation_flow
+---
+""")
+
+# ✅ Template cho từng strategy - chỉ strategy được chọn mới được render
+STRATEGY_TEMPLATES = {
+    'follow_up_continuation': Template("""$memory_context
+NHIỆM VỤ: Thầy/cô đang hỏi tiếp về CÙNG CHỦ ĐỀ.
+⚠️ KIỂM TRA: Thầy/cô hỏi "$query". Đây là câu hỏi tiếp nối về chủ đề "$topic".
+HÀNH ĐỘNG: Cung cấp thông tin BỔ SUNG, đừng lặp lại ý cũ. Bắt đầu bằng "Dạ thầy/cô, ngoài ra về [chủ đề]..." hoặc một cách tự nhiên. Trả lời ngắn gọn.
+DỮ LIỆU THAM KHẢO (nếu có): $reference
+Trả lời:"""),
+
+    'follow_up_clarification': Template("""$memory_context
+NHIỆM VỤ: Thầy/cô muốn làm RÕ HƠN về CÙNG CHỦ ĐỀ.
+⚠️ KIỂM TRA: Thầy/cô hỏi "$query". Đây là yêu cầu làm rõ về chủ đề "$topic".
+HÀNH ĐỘNG: Giải thích chi tiết, cụ thể hơn. Bắt đầu bằng "Dạ thầy/cô, để làm rõ hơn về [chủ đề]...".
+DỮ LIỆU THAM KHẢO (nếu có): $reference
+Trả lời:"""),
+
+    'topic_shift': Template("""$memory_context
+NHIỆM VỤ: Thầy/cô đã CHUYỂN SANG một chủ đề MỚI.
+⚠️ KIỂM TRA: Thầy/cô hỏi "$query". Chủ đề này khác với chủ đề trước đó.
+HÀNH ĐỘNG: Trả lời trực tiếp vào chủ đề mới. TUYỆT ĐỐI KHÔNG dùng các cụm từ như "như đã nói", "ngoài ra". Có thể thừa nhận sự thay đổi một cách nhẹ nhàng nếu muốn.
+DỮ LIỆU THAM KHẢO (nếu có): $reference
+Trả lời:"""),
+
+    'memory_reference': Template("""$memory_context
+NHIỆM VỤ: Thầy/cô đang hỏi về những gì đã nói (kiểm tra trí nhớ).
+⚠️ KIỂM TRA: Thầy/cô hỏi "$query".
+HÀNH ĐỘNG: Dựa vào 'Dòng chảy hội thoại gần đây' để tóm tắt ngắn gọn 1-2 ý chính đã trao đổi. Hỏi xem thầy/cô muốn biết thêm gì không.
+Trả lời:"""),
+
+    'balanced': Template("""$memory_context
+NHIỆM VỤ: Trả lời câu hỏi của thầy/cô một cách tự nhiên, cân bằng.
+⚠️ KIỂM TRA: Thầy/cô hỏi "$query". Đây có vẻ là một câu hỏi mới hoặc không có liên kết rõ ràng.
+HÀNH ĐỘNG: Trả lời trực tiếp, ngắn gọn, đi thẳng vào vấn đề. KHÔNG tham chiếu đến hội thoại trước trừ khi câu hỏi CỰC KỲ liên quan.
+DỮ LIỆU THAM KHẢO (nếu có): $reference
+Trả lời:"""),
+
+    # Prompt cho các decision của LecturerDecisionEngine
+    'direct_answer': Template("""NHIỆM VỤ: Trả lời TRỰC TIẾP cho giảng viên BDU
+
+CÂU HỎI GIẢNG VIÊN: $query
+
+THÔNG TIN CHÍNH XÁC TỪ CSDL:
+$reference
+
+YÊU CẦU:
+- Dùng CHÍNH XÁC thông tin từ CSDL
+- NGẮN GỌN, đi thẳng vào vấn đề
+- KHÔNG format phức tạp
+
+Trả lời:"""),
+
+    'enhanced_answer': Template("""NHIỆM VỤ: Trả lời có bổ sung cho giảng viên BDU
+
+CÂU HỎI GIẢNG VIÊN: $query
+
+THÔNG TIN LIÊN QUAN TỪ CSDL:
+$reference
+
+YÊU CẦU:
+- Sử dụng thông tin CSDL làm gốc
+- Bổ sung ngữ cảnh phù hợp nếu cần
+- NGẮN GỌN, 2-3 câu tối đa
+
+Trả lời:"""),
+}
+
+
+def build_system_instruction(role_rules: Dict[str, Any]) -> str:
+    """System instruction tĩnh - build 1 lần cho mỗi generator"""
+    return LECTURER_SYSTEM_PROMPT + ROLE_RULES_TEMPLATE.substitute(
+        identity=role_rules['identity'],
+        prohibited_roles=', '.join(role_rules['prohibited_roles'])
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token (tiếng Việt có dấu ~3 ký tự/token với tokenizer của Gemini)"""
+    if not text:
+        return 0
+    return (len(text) + 2) // 3
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cắt text theo token budget, ưu tiên cắt ở ranh giới từ"""
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text or ''
+
+    max_chars = max(0, max_tokens * 3 - 1)
+    cut = text[:max_chars]
+    last_space = cut.rfind(' ')
+    if last_space > max_chars // 2:
+        cut = cut[:last_space]
+    return cut.rstrip() + '…'
+
+
+def build_conversation_flow(history: List[Any], max_tokens: int) -> str:
+    """Dòng chảy hội thoại gần đây, lấy từ lượt mới nhất tới khi hết budget"""
+    lines = []
+    used = 0
+    for h in reversed(history[-3:]):
+        line = f"Thầy/cô hỏi: '{h.user_query[:40]}...' -> Em trả lời: '{h.bot_response[:50]}...'"
+        cost = estimate_tokens(line)
+        if used + cost > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+    lines.reverse()
+    return "\n".join(lines)
+
+
+def render_strategy_prompt(strategy: str, **values) -> str:
+    """Render duy nhất template của strategy được chọn (mặc định 'balanced')"""
+    template = STRATEGY_TEMPLATES.get(strategy, STRATEGY_TEMPLATES['balanced'])
+    return template.safe_substitute(**values).strip()
+
+
+class PromptStats:
+    """Thống kê kích thước prompt (input tokens) theo strategy"""
+
+    def __init__(self, log_every: int = 100):
+        self.log_every = log_every
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._total_calls = 0
+
+    def record(self, strategy: str, system_tokens: int, prompt_tokens: int):
+        total = system_tokens + prompt_tokens
+        with self._lock:
+            entry = self._stats.setdefault(strategy, {
+                'calls': 0, 'total_tokens': 0, 'max_tokens': 0, 'min_tokens': None
+            })
+            entry['calls'] += 1
+            entry['total_tokens'] += total
+            entry['max_tokens'] = max(entry['max_tokens'], total)
+            entry['min_tokens'] = total if entry['min_tokens'] is None else min(entry['min_tokens'], total)
+            self._total_calls += 1
+            should_log_summary = self.log_every and self._total_calls % self.log_every == 0
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"📏 Prompt size ({strategy}): system={system_tokens} + prompt={prompt_tokens} = {total} tokens (est.)")
+        if should_log_summary:
+            logger.info(f"📏 Prompt size summary: {self.get_stats()}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                strategy: {
+                    **entry,
+                    'avg_tokens': round(entry['total_tokens'] / entry['calls'], 1) if entry['calls'] else 0
+                }
+                for strategy, entry in self._stats.items()
+            }
+
+
+def get_token_budget() -> Dict[str, int]:
+    return getattr(settings, 'PROMPT_TOKEN_BUDGET', {})
+
+
+prompt_stats = PromptStats(log_every=get_token_budget().get('STATS_LOG_EVERY', 100))
@@ -5,15 +5,33 @@ import time
 import pickle
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 from knowledge.models import KnowledgeBase
 import logging
 from .phobert_service import PhoBERTIntentClassifier
-from .gemini_service import GeminiResponseGenerator
+from .gemini_service import GeminiResponseGenerator, ConversationMemory
+from .llm_limiter import PRIORITY_ANONYMOUS, PRIORITY_BATCH
+from .deadline import Deadline
+from .answer_cache import recent_answers
+from backend.tracing import span
+from backend.metrics import chat_response_duration, chat_responses
+from .session_store import get_session_memory_config
+from .session_backends import build_session_backend
 import pandas as pd
 
 logger = logging.getLogger(__name__)
 
+
+def get_batch_config():
+    config = dict(getattr(settings, 'CHAT_BATCH', {}))
+    config.setdefault('MAX_ITEMS', 100)
+    config.setdefault('MAX_CONCURRENCY', 4)
+    config.setdefault('ITEM_TIMEOUT', 60)
+    config.setdefault('ENCODE_BATCH_SIZE', 64)
+    return config
+
+
 class LecturerDecisionEngine:
     """
     Enhanced Decision Engine specifically for BDU Lecturers
@@ -149,7 +167,8 @@ class LecturerDecisionEngine:
                     found_keywords.append(f"pattern:{pattern}")
                     break
         
-        logger.info(f"🎓 Education check: '{query}' -> keywords:{found_keywords} -> {is_education}")
+        # ✅ CHANGED: DEBUG + format lười (trước đây INFO cho mọi lần gọi)
+        logger.debug("🎓 Education check: %r -> keywords:%s -> %s", query, found_keywords, is_education)
         return is_education
     
     def needs_clarification(self, query, confidence):
@@ -169,7 +188,8 @@ class LecturerDecisionEngine:
             (confidence < self.confidence_thresholds['low_trust'] and vague_count >= 1)
         )
         
-        logger.info(f"❓ Clarification check: vague:{vague_count}, words:{word_count}, conf:{confidence:.3f} -> {needs_clarification}")
+        logger.debug("❓ Clarification check: vague:%d, words:%d, conf:%.3f -> %s",
+                     vague_count, word_count, confidence, needs_clarification)
         return needs_clarification
     
     def categorize_confidence(self, similarity_score):
@@ -183,23 +203,24 @@ class LecturerDecisionEngine:
         else:
             return 'no_trust'
     
-    def make_decision(self, query, retrieval_result, intent_result, session_memory=None):
+    def make_decision(self, query, retrieval_result, intent_result, session_memory=None, is_education_query=None):
         """Enhanced decision making for lecturers with memory context"""
         
         # Step 1: Check conversation context first
         context_override = False
         if session_memory and len(session_memory) > 0:
-            # Kiểm tra 3 câu hỏi gần nhất có phải về education không
-            recent_queries = [item.get('query', '') for item in session_memory[-3:]]
-            recent_education_queries = [q for q in recent_queries if self.is_education_related(q)]
+            # Kiểm tra 3 câu hỏi gần nhất có phải về education không (đã tính sẵn khi ghi lượt)
+            recent_education_queries = [turn for turn in session_memory[-3:] if turn.is_education_query]
             
             # Nếu có ít nhất 1 câu gần đây về education -> cho phép câu hiện tại
             if len(recent_education_queries) >= 1:
                 context_override = True
-                logger.info(f"🧠 MEMORY OVERRIDE: Recent education context detected - allowing current query")
+                logger.debug("🧠 MEMORY OVERRIDE: Recent education context detected - allowing current query")
         
         # Step 2: Check if education-related
-        is_education = self.is_education_related(query) or context_override
+        if is_education_query is None:
+            is_education_query = self.is_education_related(query)
+        is_education = is_education_query or context_override
         
         if not is_education:
             return 'reject_non_education', None, False
@@ -211,7 +232,8 @@ class LecturerDecisionEngine:
         # Step 4: Check if needs clarification
         needs_clarification = self.needs_clarification(query, similarity)
         
-        logger.info(f"🤖 Decision inputs: education={is_education}, context_override={context_override}, similarity={similarity:.3f}, level={confidence_level}, clarify={needs_clarification}")
+        logger.debug("🤖 Decision inputs: education=%s, context_override=%s, similarity=%.3f, level=%s, clarify=%s",
+                     is_education, context_override, similarity, confidence_level, needs_clarification)
         
         # Step 5: Make decision
         if needs_clarification:
@@ -257,7 +279,7 @@ class LecturerDecisionEngine:
                 'message': 'No relevant information - say dont know'
             }
         
-        logger.info(f"🎯 Decision made: {decision}")
+        logger.debug("🎯 Decision made: %s", decision)
         return decision, context, True
 
 
@@ -266,16 +288,23 @@ class HybridChatbotAI:
     Enhanced Hybrid Chatbot specifically for BDU Lecturers
     """
     
+    # Các decision cần gọi Gemini
+    LLM_DECISIONS = ('use_db_direct', 'enhance_db_answer')
+    
     def __init__(self):
         # Initialize components with lecturer-specific enhancements
         self.sbert_retriever = ChatbotAI()
         self.intent_classifier = PhoBERTIntentClassifier()
-        self.response_generator = GeminiResponseGenerator()  # Now uses enhanced version
+        # ✅ 1 bộ nhớ hội thoại duy nhất, dùng chung cho decision engine và Gemini generator
+        memory_config = get_session_memory_config()
+        self.memory = ConversationMemory(
+            max_history=memory_config['MAX_HISTORY'],
+            backend=build_session_backend(memory_config),
+            load_from_db=memory_config.get('LOAD_FROM_CHAT_HISTORY', True)
+        )
+        self.response_generator = GeminiResponseGenerator(memory=self.memory)  # Now uses enhanced version
         self.decision_engine = LecturerDecisionEngine()  # New lecturer-specific engine
         
-        # Enhanced conversation memory for lecturers
-        self.conversation_memory = {}
-        
         logger.info("🚀 HybridChatbotAI initialized specifically for BDU Lecturers")
     
     @property
@@ -314,78 +343,196 @@ class HybridChatbotAI:
             'gemini_status': gemini_status
         }
     
-    def process_query(self, query, session_id=None):
+    def process_query(self, query, session_id=None, priority=PRIORITY_ANONYMOUS, deadline=None):
         """
         Main query processing specifically optimized for lecturers
         """
         start_time = time.time()
+        # ✅ THÊM: Deadline cho toàn pipeline (caller không truyền -> theo CHAT_RESPONSE_TIMEOUT)
+        deadline = deadline or Deadline.for_chat_request()
         
-        logger.info(f"👨‍🏫 Processing lecturer query: '{query}' (session: {session_id})")
+        logger.debug("👨‍🏫 Processing lecturer query: %r (session: %s)", query, session_id)
         
         try:
             # Step 1: Clean and validate input
-            query = self._clean_query(query)
+            with span('clean'):
+                query = self._clean_query(query)
             if not query or len(query.strip()) < 2:
                 return self._get_empty_query_response_lecturer()
             
             # Step 2: Get intent and entities
-            intent_result = self.intent_classifier.classify_intent(query)
-            entities = self.intent_classifier.extract_entities(query)
+            if deadline.has_budget_for('intent'):
+                with span('intent'):
+                    intent_result = self.intent_classifier.classify_intent(query)
+            else:
+                deadline.skip('intent')
+                intent_result = {
+                    'intent': 'general',
+                    'confidence': 0.0,
+                    'description': 'Câu hỏi chung',
+                    'response_style': 'neutral'
+                }
+            with span('entities'):
+                entities = self.intent_classifier.extract_entities(query)
             
             # Step 3: Search knowledge base
-            retrieval_result = self.sbert_retriever.generate_response(query)
+            with span('retrieval'):
+                retrieval_result = self.sbert_retriever.generate_response(query)
             
-            logger.info(f"🔍 Retrieval result: confidence={retrieval_result.get('confidence', 0):.3f}")
+            return self._respond(
+                query, intent_result, entities, retrieval_result, session_id, priority, deadline, start_time
+            )
             
-            # Step 4: Make lecturer-specific decision WITH MEMORY CONTEXT
-            session_memory = self.get_conversation_context(session_id) if session_id else None
+        except Exception as e:
+            logger.error(f"❌ Processing error: {str(e)}")
+            return self._get_error_response_lecturer(e, start_time)
+    
+    def process_batch(self, queries, priority=PRIORITY_BATCH, max_concurrency=None, item_timeout=None,
+                      load_shed=False):
+        """
+        ✅ THÊM: Xử lý nhiều câu hỏi độc lập (không có session) theo từng stage cho cả batch:
+        chuẩn hoá + loại trùng, 1 lần SBERT encode + FAISS search, intent theo batch,
+        rồi decision/generation chạy song song có giới hạn (Gemini vẫn qua llm_limiter).
+        load_shed: admission control báo quá tải -> bỏ Gemini cho mọi câu (trả lời từ CSDL/cache).
+        """
+        config = get_batch_config()
+        max_concurrency = max_concurrency or config['MAX_CONCURRENCY']
+        item_timeout = item_timeout or config['ITEM_TIMEOUT']
+        timings = {}
+        batch_start = time.time()
+        
+        # Stage 1: Bulk normalization - câu trùng nhau chỉ xử lý 1 lần
+        stage_start = time.time()
+        cleaned = [self._clean_query(query) for query in queries]
+        unique_queries = list(dict.fromkeys(query for query in cleaned if query and len(query.strip()) >= 2))
+        timings['normalize'] = time.time() - stage_start
+        
+        # Stage 2: Retrieval cho cả batch
+        stage_start = time.time()
+        retrievals = dict(zip(unique_queries, self.sbert_retriever.generate_responses(unique_queries)))
+        timings['retrieval'] = time.time() - stage_start
+        
+        # Stage 3: Intent + entities
+        stage_start = time.time()
+        intents = dict(zip(unique_queries, self.intent_classifier.classify_intents(unique_queries)))
+        entities = {query: self.intent_classifier.extract_entities(query) for query in unique_queries}
+        timings['intent'] = time.time() - stage_start
+        
+        # Stage 4: Decision + generation, tối đa max_concurrency câu cùng lúc
+        def respond(query):
+            item_start = time.time()
+            deadline = Deadline(item_timeout)
+            if load_shed:
+                deadline.shed('llm')
+            try:
+                return self._respond(
+                    query, intents[query], entities[query], retrievals[query], None, priority,
+                    deadline, item_start
+                )
+            except Exception as e:
+                logger.error(f"❌ Batch item error: {str(e)}")
+                return self._get_error_response_lecturer(e, item_start)
+        
+        stage_start = time.time()
+        with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='chat-batch') as pool:
+            responses = dict(zip(unique_queries, pool.map(respond, unique_queries)))
+        timings['generation'] = time.time() - stage_start
+        
+        results = []
+        for index, query in enumerate(cleaned):
+            result = dict(responses[query]) if query in responses else self._get_empty_query_response_lecturer()
+            result['index'] = index
+            result['query'] = queries[index]
+            results.append(result)
+        
+        timings['total'] = time.time() - batch_start
+        logger.info(f"📦 Batch processed: {len(queries)} queries ({len(unique_queries)} unique) in {timings['total']:.2f}s")
+        
+        return {
+            'results': results,
+            'count': len(results),
+            'unique_queries': len(unique_queries),
+            'timings': {stage: round(seconds, 4) for stage, seconds in timings.items()}
+        }
+    
+    def _respond(self, query, intent_result, entities, retrieval_result, session_id, priority, deadline, start_time):
+        """Step 4-6: decision, thực thi decision, ghi memory (dùng chung cho process_query và process_batch)"""
+        logger.debug("🔍 Retrieval result: confidence=%.3f", retrieval_result.get('confidence', 0))
+        
+        # Step 4: Make lecturer-specific decision WITH MEMORY CONTEXT
+        session_memory = self.get_conversation_context(session_id) if session_id else None
+        with span('decision'):
+            is_education_query = self.decision_engine.is_education_related(query)
             decision_type, gemini_context, should_respond = self.decision_engine.make_decision(
-                query, retrieval_result, intent_result, session_memory
+                query, retrieval_result, intent_result, session_memory, is_education_query
             )
-            
-            # Step 5: Execute decision
-            if not should_respond:
-                response_text = "Dạ thầy/cô, em chỉ hỗ trợ các vấn đề liên quan đến công việc giảng viên tại BDU thôi ạ. 🎓 Thầy/cô có câu hỏi nào khác về trường không ạ?"
-                method = 'rejected_non_education'
+        
+        # Step 5: Execute decision
+        if not should_respond:
+            response_text = "Dạ thầy/cô, em chỉ hỗ trợ các vấn đề liên quan đến công việc giảng viên tại BDU thôi ạ. 🎓 Thầy/cô có câu hỏi nào khác về trường không ạ?"
+            method = 'rejected_non_education'
+        elif decision_type in self.LLM_DECISIONS and not deadline.has_budget_for('llm'):
+            # ✅ THÊM: Không đủ thời gian cho Gemini -> trả câu trả lời CSDL tốt nhất
+            deadline.skip('llm')
+            # ✅ THÊM: Bị load shed -> ưu tiên câu trả lời Gemini gần đây cho cùng câu hỏi
+            cached_answer = recent_answers.get(query) if deadline.is_shed('llm') else None
+            if cached_answer:
+                response_text = cached_answer
+                method = f'{decision_type}_load_shed_cached'
             else:
+                response_text = self._format_db_answer_lecturer(gemini_context['db_answer'])
+                reason = 'load_shed' if deadline.is_shed('llm') else 'deadline_fallback'
+                method = f'{decision_type}_{reason}'
+        else:
+            with span('generation', decision_type=decision_type):
                 response_text = self._execute_lecturer_decision(
-                    decision_type, query, gemini_context, intent_result, entities, session_id
+                    decision_type, query, gemini_context, intent_result, entities, session_id, priority,
+                    deadline
                 )
-                method = decision_type
-            
-            # Step 6: Update memory WITH MORE DETAILS
-            if session_id and should_respond:
-                self._update_memory(session_id, query, intent_result, retrieval_result.get('confidence', 0), decision_type, should_respond)
-            
-            processing_time = time.time() - start_time
-            
-            return {
-                'response': response_text,
-                'confidence': retrieval_result.get('confidence', 0),
-                'method': method,
-                'decision_type': decision_type,
-                'intent': intent_result,
-                'sources': retrieval_result.get('sources', []),
-                'entities': entities,
-                'processing_time': processing_time,
-                'is_education': gemini_context is not None,
-                'lecturer_optimized': True
-            }
-            
-        except Exception as e:
-            logger.error(f"❌ Processing error: {str(e)}")
-            return {
-                'response': "Dạ thầy/cô, em gặp khó khăn kỹ thuật. Thầy/cô có thể liên hệ bộ phận IT qua email it@bdu.edu.vn để được hỗ trợ ạ. 🎓",
-                'confidence': 0.0,
-                'method': 'error_fallback',
-                'processing_time': time.time() - start_time,
-                'error': str(e)
-            }
+            method = decision_type
+            if decision_type in self.LLM_DECISIONS and not session_memory:
+                recent_answers.set(query, response_text)
+        
+        # Step 6: Update memory WITH MORE DETAILS (ghi 1 lần duy nhất cho lượt này)
+        if session_id and should_respond:
+            self._update_memory(
+                session_id, query, response_text, intent_result, entities,
+                retrieval_result.get('confidence', 0), decision_type, should_respond, is_education_query
+            )
+        
+        processing_time = time.time() - start_time
+        chat_responses.inc(decision_type, method)
+        chat_response_duration.observe(processing_time, decision_type)
+        
+        return {
+            'response': response_text,
+            'confidence': retrieval_result.get('confidence', 0),
+            'method': method,
+            'decision_type': decision_type,
+            'intent': intent_result,
+            'sources': retrieval_result.get('sources', []),
+            'entities': entities,
+            'processing_time': processing_time,
+            'is_education': gemini_context is not None,
+            'lecturer_optimized': True,
+            'skipped_stages': list(deadline.skipped_stages),
+            'degraded': deadline.degraded
+        }
     
-    def _execute_lecturer_decision(self, decision_type, query, gemini_context, intent_result, entities, session_id):
+    def _get_error_response_lecturer(self, error, start_time):
+        return {
+            'response': "Dạ thầy/cô, em gặp khó khăn kỹ thuật. Thầy/cô có thể liên hệ bộ phận IT qua email it@bdu.edu.vn để được hỗ trợ ạ. 🎓",
+            'confidence': 0.0,
+            'method': 'error_fallback',
+            'processing_time': time.time() - start_time,
+            'error': str(error)
+        }
+    
+    def _execute_lecturer_decision(self, decision_type, query, gemini_context, intent_result, entities, session_id,
+                                   priority=PRIORITY_ANONYMOUS, deadline=None):
         """Execute lecturer-specific decisions"""
         
-        logger.info(f"🎯 Executing lecturer decision: {decision_type}")
+        logger.debug("🎯 Executing lecturer decision: %s", decision_type)
         
         if decision_type == 'use_db_direct':
             # High confidence -> Use database answer directly with lecturer formatting
@@ -394,7 +541,10 @@ class HybridChatbotAI:
                 context=gemini_context,
                 intent_info=intent_result,
                 entities=entities,
-                session_id=session_id
+                session_id=session_id,
+                priority=priority,
+                deadline=deadline,
+                record=False
             )
             return response.get('response', f"Dạ thầy/cô, {gemini_context['db_answer']} 🎓 Thầy/cô có cần hỗ trợ thêm gì không ạ?")
             
@@ -405,7 +555,10 @@ class HybridChatbotAI:
                 context=gemini_context,
                 intent_info=intent_result,
                 entities=entities,
-                session_id=session_id
+                session_id=session_id,
+                priority=priority,
+                deadline=deadline,
+                record=False
             )
             return response.get('response', f"Dạ thầy/cô, {gemini_context['db_answer']} 🎓 Thầy/cô có cần hỗ trợ thêm gì không ạ?")
             
@@ -416,7 +569,10 @@ class HybridChatbotAI:
                 context=gemini_context,
                 intent_info=intent_result,
                 entities=entities,
-                session_id=session_id
+                session_id=session_id,
+                priority=priority,
+                deadline=deadline,
+                record=False
             )
             return response.get('response', self._get_default_clarification_request(query))
             
@@ -427,7 +583,10 @@ class HybridChatbotAI:
                 context=gemini_context,
                 intent_info=intent_result,
                 entities=entities,
-                session_id=session_id
+                session_id=session_id,
+                priority=priority,
+                deadline=deadline,
+                record=False
             )
             return response.get('response', self._get_default_dont_know_response(query))
             
@@ -435,6 +594,10 @@ class HybridChatbotAI:
             logger.warning(f"⚠️ Unknown decision type: {decision_type}")
             return "Dạ thầy/cô, em gặp khó khăn trong việc xử lý câu hỏi. Thầy/cô có cần hỗ trợ thêm gì không ạ? 🎓"
     
+    def _format_db_answer_lecturer(self, db_answer):
+        """Câu trả lời CSDL định dạng cho giảng viên (không qua Gemini)"""
+        return f"Dạ thầy/cô, {db_answer} 🎓 Thầy/cô có cần hỗ trợ thêm gì không ạ?"
+    
     def _get_default_clarification_request(self, query):
         """Default clarification request if Gemini fails"""
         # Extract key topic for targeted clarification
@@ -480,26 +643,18 @@ class HybridChatbotAI:
         
         return query
     
-    def _update_memory(self, session_id, query, intent_result, confidence, decision_type=None, was_education=True):
+    def _update_memory(self, session_id, query, response_text, intent_result, entities, confidence,
+                       decision_type=None, was_education=True, is_education_query=False):
         """Enhanced memory update for lecturers with more context"""
-        if session_id not in self.conversation_memory:
-            self.conversation_memory[session_id] = []
-        
-        self.conversation_memory[session_id].append({
-            'query': query,
-            'intent': intent_result.get('intent', 'unknown'),
-            'confidence': confidence,
-            'timestamp': time.time(),
-            'user_type': 'lecturer',  # Track that this is a lecturer session
-            'decision_type': decision_type,  # ✅ NEW: Track decision made
-            'was_education_related': was_education,  # ✅ NEW: Track if was education
-            'is_education_query': self.decision_engine.is_education_related(query)  # ✅ NEW: Direct check
-        })
-        
-        # Keep last 10 interactions for lecturers (more history for work context)
-        self.conversation_memory[session_id] = self.conversation_memory[session_id][-10:]
+        self.memory.add_interaction(
+            session_id, query, response_text, intent_result, entities,
+            confidence=confidence,
+            decision_type=decision_type,  # ✅ NEW: Track decision made
+            was_education_related=was_education,  # ✅ NEW: Track if was education
+            is_education_query=is_education_query  # ✅ Đã tính ở process_query, không tính lại
+        )
         
-        logger.info(f"🧠 Memory updated for session {session_id}: {len(self.conversation_memory[session_id])} total interactions")
+        logger.debug("🧠 Memory updated for session %s", session_id)
     
     def _get_empty_query_response_lecturer(self):
         """Response for empty queries from lecturers"""
@@ -512,7 +667,7 @@ class HybridChatbotAI:
     
     def get_conversation_context(self, session_id):
         """Get conversation context for a lecturer session"""
-        return self.conversation_memory.get(session_id, [])
+        return self.memory.get_history(session_id)
     
     def get_conversation_memory(self, session_id):
         """Get conversation memory from Gemini service"""
@@ -520,13 +675,7 @@ class HybridChatbotAI:
     
     def clear_conversation_memory(self, session_id=None):
         """Clear conversation memory"""
-        if session_id:
-            self.response_generator.clear_conversation_memory(session_id)
-            if session_id in self.conversation_memory:
-                del self.conversation_memory[session_id]
-        else:
-            self.response_generator.clear_conversation_memory()
-            self.conversation_memory.clear()
+        self.memory.clear(session_id)
 
 
 # Keep original ChatbotAI for retrieval (unchanged but enhanced for lecturers)
@@ -634,10 +783,12 @@ class ChatbotAI:
             if not self.model or not self.index:
                 return self.keyword_search(query)
             
-            query_embedding = self.model.encode([query])
-            faiss.normalize_L2(query_embedding)
+            with span('encode'):
+                query_embedding = self.model.encode([query])
+                faiss.normalize_L2(query_embedding)
             
-            scores, indices = self.index.search(query_embedding.astype('float32'), top_k)
+            with span('faiss'):
+                scores, indices = self.index.search(query_embedding.astype('float32'), top_k)
             
             results = []
             for score, idx in zip(scores[0], indices[0]):
@@ -652,6 +803,27 @@ class ChatbotAI:
             logger.error(f"Semantic search error: {str(e)}")
             return self.keyword_search(query)
     
+    def batch_semantic_search(self, queries, top_k=3):
+        """✅ THÊM: 1 lần SBERT encode + 1 lần FAISS search cho cả ma trận query"""
+        with span('encode', batch_size=len(queries)):
+            embeddings = self.model.encode(queries, batch_size=get_batch_config()['ENCODE_BATCH_SIZE'])
+            embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+            faiss.normalize_L2(embeddings)
+        
+        with span('faiss', batch_size=len(queries)):
+            scores, indices = self.index.search(embeddings, top_k)
+        
+        batch_results = []
+        for row_scores, row_indices in zip(scores, indices):
+            results = []
+            for score, idx in zip(row_scores, row_indices):
+                if 0 <= idx < len(self.knowledge_data):
+                    result = self.knowledge_data[idx].copy()
+                    result['similarity'] = float(score)
+                    results.append(result)
+            batch_results.append(results)
+        return batch_results
+    
     def keyword_search(self, query):
         """Enhanced keyword fallback search for lecturers"""
         query_words = set(query.lower().split())
@@ -691,29 +863,14 @@ class ChatbotAI:
                 }
             
             # Search for match
+            confidence = 0
             if self.model and self.index:
                 best_match, all_results = self.semantic_search(query)
             else:
                 best_match, confidence = self.keyword_search(query)
                 all_results = [best_match] if best_match else []
             
-            if best_match:
-                similarity = best_match.get('similarity', confidence if 'confidence' in locals() else 0)
-                
-                return {
-                    'response': best_match['answer'],
-                    'confidence': similarity,
-                    'method': 'retrieval',
-                    'sources': self._format_sources(all_results[:2]),
-                    'category': best_match.get('category', 'Giảng viên')
-                }
-            else:
-                return {
-                    'response': 'Em chưa có thông tin về vấn đề này.',
-                    'confidence': 0.1,
-                    'method': 'no_match',
-                    'sources': []
-                }
+            return self._build_retrieval_response(best_match, all_results, confidence)
             
         except Exception as e:
             logger.error(f"Generate response error: {str(e)}")
@@ -724,6 +881,43 @@ class ChatbotAI:
                 'sources': []
             }
     
+    def generate_responses(self, queries):
+        """✅ THÊM: generate_response cho cả batch (câu rỗng đã được lọc ở process_batch)"""
+        if not queries:
+            return []
+        if not (self.model and self.index):
+            return [self.generate_response(query) for query in queries]
+        
+        try:
+            batch_results = self.batch_semantic_search(queries)
+        except Exception as e:
+            logger.error(f"Batch semantic search error: {str(e)}")
+            return [self.generate_response(query) for query in queries]
+        
+        return [
+            self._build_retrieval_response(results[0] if results else None, results)
+            for results in batch_results
+        ]
+    
+    def _build_retrieval_response(self, best_match, all_results, confidence=0):
+        if best_match:
+            similarity = best_match.get('similarity', confidence)
+            
+            return {
+                'response': best_match['answer'],
+                'confidence': similarity,
+                'method': 'retrieval',
+                'sources': self._format_sources(all_results[:2]),
+                'category': best_match.get('category', 'Giảng viên')
+            }
+        else:
+            return {
+                'response': 'Em chưa có thông tin về vấn đề này.',
+                'confidence': 0.1,
+                'method': 'no_match',
+                'sources': []
+            }
+    
     def _format_sources(self, results):
         """Format sources for display"""
         sources = []
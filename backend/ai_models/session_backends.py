@@ -0,0 +1,198 @@
+# ai_models/session_backends.py
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# Redis là tùy chọn - chỉ cần khi SESSION_MEMORY['BACKEND'] = 'redis'
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class SessionBackend:
+    """
+    Interface lưu state hội thoại dùng chung giữa các worker.
+    Dữ liệu là dict JSON-serializable, có field 'updated_at' (epoch seconds).
+    """
+
+    name = 'local'
+    shared = False
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return None
+
+    def save_many(self, items: Dict[str, Dict[str, Any]]):
+        pass
+
+    def delete(self, session_id: str):
+        pass
+
+    def clear(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """SQLite ở chế độ WAL: nhiều worker đọc song song, ghi theo batch"""
+
+    name = 'sqlite'
+    shared = True
+
+    def __init__(self, path: str, idle_ttl: float = 3600):
+        self.path = str(path)
+        self.idle_ttl = idle_ttl
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS session_memory ('
+            ' session_id TEXT PRIMARY KEY,'
+            ' data TEXT NOT NULL,'
+            ' updated_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS session_memory_updated_at ON session_memory (updated_at)')
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def load(self, session_id):
+        row = self._conn().execute(
+            'SELECT data, updated_at FROM session_memory WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        if not row or (self.idle_ttl and time.time() - row[1] > self.idle_ttl):
+            return None
+        return json.loads(row[0])
+
+    def save_many(self, items):
+        if not items:
+            return
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                'INSERT INTO session_memory (session_id, data, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(session_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at '
+                'WHERE excluded.updated_at >= session_memory.updated_at',
+                [
+                    (session_id, json.dumps(data, ensure_ascii=False), data['updated_at'])
+                    for session_id, data in items.items()
+                ]
+            )
+            if self.idle_ttl:
+                conn.execute('DELETE FROM session_memory WHERE updated_at < ?', (time.time() - self.idle_ttl,))
+
+    def delete(self, session_id):
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM session_memory WHERE session_id = ?', (session_id,))
+
+    def clear(self):
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM session_memory')
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class RedisSessionBackend(SessionBackend):
+    """Redis (hoặc server tương thích Redis protocol), key hết hạn theo idle TTL"""
+
+    name = 'redis'
+    shared = True
+
+    def __init__(self, url: str, idle_ttl: float = 3600, prefix: str = 'bdu:session_memory:'):
+        self.client = redis.Redis.from_url(url, socket_timeout=2)
+        self.idle_ttl = int(idle_ttl) if idle_ttl else None
+        self.prefix = prefix
+
+    def _key(self, session_id):
+        return f'{self.prefix}{session_id}'
+
+    def load(self, session_id):
+        raw = self.client.get(self._key(session_id))
+        return json.loads(raw) if raw else None
+
+    def save_many(self, items):
+        if not items:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for session_id, data in items.items():
+            pipe.set(self._key(session_id), json.dumps(data, ensure_ascii=False), ex=self.idle_ttl)
+        pipe.execute()
+
+    def delete(self, session_id):
+        self.client.delete(self._key(session_id))
+
+    def clear(self):
+        for key in self.client.scan_iter(f'{self.prefix}*'):
+            self.client.delete(key)
+
+
+def build_session_backend(config: Dict[str, Any]) -> SessionBackend:
+    """Tạo backend theo SESSION_MEMORY['BACKEND'] (local | sqlite | redis)"""
+    backend = (config.get('BACKEND') or 'local').lower()
+    idle_ttl = config.get('IDLE_TTL', 3600)
+
+    try:
+        if backend == 'sqlite':
+            return SQLiteSessionBackend(config['SQLITE_PATH'], idle_ttl=idle_ttl)
+        if backend == 'redis':
+            if not REDIS_AVAILABLE:
+                logger.warning("redis package not installed - falling back to process-local session memory")
+                return SessionBackend()
+            return RedisSessionBackend(config['REDIS_URL'], idle_ttl=idle_ttl)
+    except Exception as e:
+        logger.error(f"Could not initialise session backend '{backend}': {e}")
+        return SessionBackend()
+
+    return SessionBackend()
+
+
+class WriteBehindFlusher:
+    """Thread nền ghi các session dirty xuống backend theo batch"""
+
+    def __init__(self, memory, interval: float = 1.0):
+        self.memory = memory
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='session-write-behind', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.memory.flush()
+            except Exception as e:
+                logger.error(f"Session write-behind flush failed: {e}")
@@ -0,0 +1,219 @@
+# ai_models/session_store.py
+
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+
+from .topics import (
+    SUMMARY_WINDOW, match_topics, new_topic_counts, apply_topic_mask, summary_from_counts
+)
+
+logger = logging.getLogger(__name__)
+
+
+def get_session_memory_config() -> Dict[str, Any]:
+    config = dict(getattr(settings, 'SESSION_MEMORY', {}))
+    personalization = getattr(settings, 'CHATBOT_PERSONALIZATION', {})
+    config.setdefault('IDLE_TTL', personalization.get('FACULTY_SESSION_TIMEOUT', 3600))
+    config.setdefault('MAX_SESSIONS', 5000)
+    config.setdefault('MAX_HISTORY', 10)
+    return config
+
+
+# ✅ Record cho mỗi lượt hội thoại - __slots__ thay cho dict lồng nhau
+# (khai báo __slots__ thủ công để chạy được cả trên Python < 3.10)
+@dataclass
+class Turn:
+    """
+    1 lượt hỏi/đáp - nguồn dữ liệu duy nhất cho cả decision engine
+    (decision_type, is_education_query) và Gemini generator (history, summary)
+    """
+    __slots__ = ('timestamp', 'user_query', 'bot_response', 'intent', 'entities',
+                 'confidence', 'decision_type', 'was_education_related', 'is_education_query',
+                 'topic_mask', 'main_topic')
+    timestamp: float
+    user_query: str
+    bot_response: str
+    intent: str
+    entities: Dict[str, Any]
+    confidence: float
+    decision_type: Optional[str]
+    was_education_related: bool
+    is_education_query: bool
+    topic_mask: int             # keyword hits theo SUMMARY_TOPICS (tính 1 lần khi ghi)
+    main_topic: Optional[str]   # chủ đề chính theo LECTURER_TOPICS
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Turn':
+        data = dict(data)
+        if 'topic_mask' not in data:
+            # Bản lưu cũ (trước khi có topic fields)
+            topics = match_topics(data['user_query'])
+            data['topic_mask'], data['main_topic'] = topics.summary_mask, topics.main_topic
+        return cls(**data)
+
+
+class _Entry:
+    __slots__ = ('value', 'last_access')
+
+    def __init__(self, value, last_access):
+        self.value = value
+        self.last_access = last_access
+
+
+class SessionStore:
+    """
+    Map session_id -> state, giới hạn số session (LRU) và tự hết hạn
+    session không hoạt động quá idle_ttl giây.
+
+    OrderedDict giữ thứ tự truy cập nên session cũ nhất luôn ở đầu:
+    dọn dẹp (LRU + TTL) là O(1) khấu hao cho mỗi lần ghi.
+    """
+
+    def __init__(self, factory: Callable[[], Any], max_sessions: int = 5000,
+                 idle_ttl: float = 3600, name: str = 'sessions'):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.name = name
+        self._sessions = OrderedDict()
+        self._lock = threading.RLock()
+        self.stats = {'created': 0, 'evicted_lru': 0, 'expired': 0}
+
+    def _is_expired(self, entry: _Entry, now: float) -> bool:
+        return bool(self.idle_ttl) and now - entry.last_access > self.idle_ttl
+
+    def _evict(self, now: float):
+        # Hết hạn theo idle TTL (session cũ nhất ở đầu)
+        while self._sessions:
+            session_id, entry = next(iter(self._sessions.items()))
+            if not self._is_expired(entry, now):
+                break
+            self._sessions.popitem(last=False)
+            self.stats['expired'] += 1
+
+        # Vượt quá số session tối đa -> bỏ session ít dùng nhất
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.stats['evicted_lru'] += 1
+
+    def get(self, session_id: str, default=None):
+        """Lấy state (không tạo mới), đánh dấu vừa truy cập"""
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return default
+            if self._is_expired(entry, now):
+                del self._sessions[session_id]
+                self.stats['expired'] += 1
+                return default
+            entry.last_access = now
+            self._sessions.move_to_end(session_id)
+            return entry.value
+
+    def get_or_create(self, session_id: str):
+        now = time.time()
+        with self._lock:
+            value = self.get(session_id)
+            if value is None:
+                value = self.factory()
+                self._sessions[session_id] = _Entry(value, now)
+                self.stats['created'] += 1
+                self._evict(now)
+            return value
+
+    def put(self, session_id: str, value):
+        """Ghi đè state (vd. bản mới hơn load từ backend dùng chung)"""
+        now = time.time()
+        with self._lock:
+            self._sessions[session_id] = _Entry(value, now)
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+
+    def pop(self, session_id: str, default=None):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            return entry.value if entry else default
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def __contains__(self, session_id) -> bool:
+        return self.get(session_id) is not None
+
+    def __delitem__(self, session_id):
+        with self._lock:
+            del self._sessions[session_id]
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._evict(time.time())
+            return len(self._sessions)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'active_sessions': len(self),
+            'max_sessions': self.max_sessions,
+            'idle_ttl': self.idle_ttl,
+            **self.stats,
+        }
+
+
+def new_history(max_history: Optional[int] = None) -> deque:
+    if max_history is None:
+        max_history = get_session_memory_config()['MAX_HISTORY']
+    return deque(maxlen=max_history)
+
+
+class ConversationState:
+    """State hội thoại của 1 session trong ConversationMemory"""
+    __slots__ = ('history', 'context_summary', 'user_interests', 'conversation_type',
+                 'updated_at', 'synced_at', 'topic_counts')
+
+    def __init__(self, max_history: Optional[int] = None):
+        self.history = new_history(max_history)
+        self.context_summary = ""
+        self.topic_counts = new_topic_counts()  # số lượt chạm mỗi chủ đề trong SUMMARY_WINDOW lượt gần nhất
+        self.user_interests = set()
+        self.conversation_type = 'lecturer'
+        self.updated_at = 0.0  # lần ghi cuối (so sánh với bản trong backend dùng chung)
+        self.synced_at = 0.0   # lần cuối đối chiếu với backend
+
+    def append_turn(self, turn: Turn):
+        """Thêm lượt mới, cập nhật bộ đếm chủ đề và summary tăng dần (O(1) mỗi lượt)"""
+        window = min(SUMMARY_WINDOW, self.history.maxlen or SUMMARY_WINDOW)
+        if len(self.history) >= window:
+            apply_topic_mask(self.topic_counts, self.history[-window].topic_mask, -1)
+        self.history.append(turn)
+        apply_topic_mask(self.topic_counts, turn.topic_mask, 1)
+        self.context_summary = summary_from_counts(self.topic_counts)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'history': [turn.as_dict() for turn in self.history],
+            'context_summary': self.context_summary,
+            'user_interests': sorted(self.user_interests),
+            'conversation_type': self.conversation_type,
+            'updated_at': self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], max_history: Optional[int] = None) -> 'ConversationState':
+        state = cls(max_history)
+        for turn in data.get('history', []):
+            state.append_turn(Turn.from_dict(turn))
+        state.user_interests = set(data.get('user_interests', []))
+        state.conversation_type = data.get('conversation_type', 'lecturer')
+        state.updated_at = data.get('updated_at', 0.0)
+        return state
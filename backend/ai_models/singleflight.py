@@ -0,0 +1,227 @@
+# ai_models/singleflight.py
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Optional
+
+# fcntl chỉ có trên Unix - trên Windows chỉ coalescing trong cùng worker
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+def make_key(*parts) -> str:
+    """Key ổn định từ các thành phần của request (prompt đã render, config, ...)"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error', 'followers')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Gộp các lời gọi giống nhau đang chạy song song giữa các thread trong 1 worker.
+    Caller đầu tiên (leader) thực hiện lời gọi, các caller trùng key chờ kết quả.
+    """
+
+    def __init__(self, wait_timeout: float = 30.0):
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {'leaders': 0, 'followers': 0, 'follower_timeouts': 0}
+
+    def do(self, key: str, fn: Callable[[], Any], wait_timeout: Optional[float] = None) -> Any:
+        wait_timeout = self.wait_timeout if wait_timeout is None else wait_timeout
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self.stats['leaders'] += 1
+                is_leader = True
+            else:
+                call.followers += 1
+                self.stats['followers'] += 1
+                is_leader = False
+
+        if not is_leader:
+            if not call.event.wait(wait_timeout):
+                self.stats['follower_timeouts'] += 1
+                logger.warning(f"⏳ Single-flight follower timed out after {wait_timeout}s")
+                return None
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+            if call.followers:
+                logger.info(f"🔗 Single-flight: 1 upstream call served {call.followers + 1} requests")
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class SharedFileSingleFlight:
+    """
+    Coalescing giữa các worker qua lock file (fcntl.flock) trong thư mục dùng chung.
+    Worker giữ lock gọi upstream và ghi kết quả; worker khác chờ lock rồi đọc
+    kết quả nếu còn trong result_ttl.
+    """
+
+    def __init__(self, directory: str, result_ttl: float = 15.0,
+                 wait_timeout: float = 30.0, poll_interval: float = 0.05):
+        self.directory = directory
+        self.result_ttl = result_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.stats = {'shared_hits': 0, 'shared_leaders': 0, 'lock_timeouts': 0}
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + '.lock', base + '.json'
+
+    def _read_fresh_result(self, result_path) -> Optional[dict]:
+        try:
+            if time.time() - os.path.getmtime(result_path) > self.result_ttl:
+                return None
+            with open(result_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_result(self, result_path, result):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'result': result}, f, ensure_ascii=False)
+        os.replace(tmp_path, result_path)
+
+        self._writes += 1
+        if self._writes % 200 == 0:
+            self._prune()
+
+    def _prune(self):
+        """Xóa file kết quả/lock cũ"""
+        cutoff = time.time() - max(self.result_ttl * 10, 300)
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.unlink(path)
+            except OSError:
+                pass
+
+    def do(self, key: str, fn: Callable[[], Any], wait_timeout: Optional[float] = None) -> Any:
+        wait_timeout = self.wait_timeout if wait_timeout is None else wait_timeout
+        lock_path, result_path = self._paths(key)
+
+        cached = self._read_fresh_result(result_path)
+        if cached is not None:
+            self.stats['shared_hits'] += 1
+            return cached['result']
+
+        with open(lock_path, 'a') as lock_file:
+            deadline = time.monotonic() + wait_timeout
+            while True:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        # ✅ CHANGED: Hết thời gian chờ -> None (caller fallback), không gọi upstream
+                        # muộn khi request có thể đã bị frontend cắt
+                        self.stats['lock_timeouts'] += 1
+                        logger.warning(f"⏳ Shared single-flight lock timed out after {wait_timeout:.1f}s")
+                        return None
+                    time.sleep(self.poll_interval)
+
+            try:
+                # Worker khác có thể vừa hoàn thành trong lúc mình chờ lock
+                cached = self._read_fresh_result(result_path)
+                if cached is not None:
+                    self.stats['shared_hits'] += 1
+                    return cached['result']
+
+                self.stats['shared_leaders'] += 1
+                result = fn()
+                if result is not None:
+                    self._write_result(result_path, result)
+                return result
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class RequestCoalescer:
+    """SingleFlight trong worker, tùy chọn thêm tầng coalescing giữa các worker"""
+
+    def __init__(self, enabled: bool = True, wait_timeout: float = 30.0,
+                 shared_dir: Optional[str] = None, shared_result_ttl: float = 15.0):
+        self.enabled = enabled
+        self.local = SingleFlight(wait_timeout=wait_timeout)
+        self.shared = None
+
+        if shared_dir:
+            if FCNTL_AVAILABLE:
+                self.shared = SharedFileSingleFlight(
+                    shared_dir, result_ttl=shared_result_ttl, wait_timeout=wait_timeout
+                )
+                logger.info(f"🔗 Cross-worker single-flight enabled: {shared_dir}")
+            else:
+                logger.warning("fcntl not available - cross-worker single-flight disabled")
+
+    def do(self, key: str, fn: Callable[[], Any], wait_timeout: Optional[float] = None) -> Any:
+        if not self.enabled:
+            return fn()
+        if self.shared is not None:
+            return self.local.do(key, lambda: self.shared.do(key, fn, wait_timeout), wait_timeout)
+        return self.local.do(key, fn, wait_timeout)
+
+    def get_stats(self):
+        stats = dict(self.local.stats)
+        stats['in_flight'] = self.local.in_flight()
+        if self.shared is not None:
+            stats.update(self.shared.stats)
+        return stats
+
+
+def _build_gemini_coalescer() -> RequestCoalescer:
+    from django.conf import settings
+    config = getattr(settings, 'GEMINI_SINGLE_FLIGHT', {})
+    return RequestCoalescer(
+        enabled=config.get('ENABLED', True),
+        wait_timeout=config.get('WAIT_TIMEOUT', 30),
+        shared_dir=config.get('SHARED_DIR'),
+        shared_result_ttl=config.get('SHARED_RESULT_TTL', 15),
+    )
+
+
+# Global coalescer cho các lời gọi Gemini generateContent
+gemini_coalescer = _build_gemini_coalescer()
@@ -5,6 +5,7 @@ import tempfile
 import torch
 import logging
 import time
+import threading
 from typing import Optional, Dict, Any
 import numpy as np
 from pathlib import Path
@@ -42,6 +43,11 @@ class SpeechToTextService:
         self.beam_size = 5
         self.temperature = 0.0
         
+        # ✅ THÊM: Số transcription đang chờ/chạy (metrics bdu_whisper_queue_depth)
+        self._queue_lock = threading.Lock()
+        self._queue_depth = 0
+        self._max_queue_depth = 0
+        
         # Initialize model if available
         if WHISPER_AVAILABLE:
             try:
@@ -129,6 +135,17 @@ class SpeechToTextService:
             return {"valid": False, "error": f"Validation error: {str(e)}"}
     
     def transcribe_audio(self, file_path: str, **kwargs) -> Dict[str, Any]:
+        """Transcribe audio file to text (đếm vào queue depth trong lúc chờ/chạy model)"""
+        with self._queue_lock:
+            self._queue_depth += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queue_depth)
+        try:
+            return self._transcribe_audio(file_path, **kwargs)
+        finally:
+            with self._queue_lock:
+                self._queue_depth -= 1
+    
+    def _transcribe_audio(self, file_path: str, **kwargs) -> Dict[str, Any]:
         """
         Transcribe audio file to text
         
@@ -271,6 +288,10 @@ class SpeechToTextService:
             "max_file_size_mb": self.max_file_size_mb
         }
     
+    def get_queue_stats(self) -> Dict[str, Any]:
+        with self._queue_lock:
+            return {'queue_depth': self._queue_depth, 'max_queue_depth': self._max_queue_depth}
+    
     def __del__(self):
         """Cleanup GPU memory if using CUDA"""
         if self.device == "cuda" and torch.cuda.is_available():
@@ -1,3 +1,300 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+from .deadline import Deadline
+from .llm_limiter import PRIORITY_BATCH, PRIORITY_FACULTY, LLMLimiter
+from .session_backends import SessionBackend, SQLiteSessionBackend, build_session_backend
+from .session_store import ConversationState, SessionStore, Turn
+from .singleflight import FCNTL_AVAILABLE, SharedFileSingleFlight, SingleFlight, make_key
+from .topics import match_topics
+
+
+def make_turn(user_query: str, timestamp: float = 0.0) -> Turn:
+    topics = match_topics(user_query)
+    return Turn(
+        timestamp=timestamp, user_query=user_query, bot_response='...', intent='general',
+        entities={}, confidence=0.8, decision_type=None, was_education_related=True,
+        is_education_query=True, topic_mask=topics.summary_mask, main_topic=topics.main_topic,
+    )
+
+
+def wait_until(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            raise AssertionError('condition not reached')
+        time.sleep(0.005)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def upstream():
+            calls.append(1)
+            release.wait(2)
+            return 'answer'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do('k', upstream))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        wait_until(lambda: flight.stats['followers'] == 3)
+        release.set()
+        for thread in threads:
+            thread.join(2)
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, ['answer'] * 4)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_error_reaches_followers(self):
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def upstream():
+            release.wait(2)
+            raise TimeoutError('Gemini timeout')
+
+        errors = []
+
+        def call():
+            try:
+                flight.do('k', upstream)
+            except TimeoutError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        wait_until(lambda: flight.stats['followers'] == 1)
+        release.set()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual(len(errors), 2)
+
+    def test_follower_timeout_returns_none(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        leader = threading.Thread(target=flight.do, args=('k', lambda: release.wait(2)))
+        leader.start()
+        wait_until(lambda: flight.in_flight() == 1)
+
+        self.assertIsNone(flight.do('k', lambda: 'unused', wait_timeout=0.01))
+        self.assertEqual(flight.stats['follower_timeouts'], 1)
+        release.set()
+        leader.join(2)
+
+    def test_make_key_is_stable(self):
+        self.assertEqual(make_key('prompt', {'b': 1, 'a': 2}), make_key('prompt', {'a': 2, 'b': 1}))
+        self.assertNotEqual(make_key('prompt', 1), make_key('prompt', 2))
+
+
+@skipUnless(FCNTL_AVAILABLE, 'fcntl chỉ có trên Unix')
+class SharedFileSingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_result_shared_between_workers(self):
+        worker_a = SharedFileSingleFlight(self.directory)
+        worker_b = SharedFileSingleFlight(self.directory)
+
+        self.assertEqual(worker_a.do('k', lambda: {'text': 'answer'}), {'text': 'answer'})
+        self.assertEqual(worker_b.do('k', lambda: self.fail('upstream called twice')), {'text': 'answer'})
+        self.assertEqual(worker_b.stats['shared_hits'], 1)
+
+    def test_none_result_not_shared(self):
+        flight = SharedFileSingleFlight(self.directory)
+        self.assertIsNone(flight.do('k', lambda: None))
+        self.assertEqual(flight.do('k', lambda: 'retry'), 'retry')
+
+    def test_lock_timeout_returns_none_without_calling_upstream(self):
+        import fcntl
+        flight = SharedFileSingleFlight(self.directory, poll_interval=0.01)
+        lock_path, _ = flight._paths('k')
+        with open(lock_path, 'a') as held:
+            # Worker khác đang gọi upstream
+            fcntl.flock(held.fileno(), fcntl.LOCK_EX)
+            result = flight.do('k', lambda: self.fail('upstream called after timeout'), wait_timeout=0.05)
+        self.assertIsNone(result)
+        self.assertEqual(flight.stats['lock_timeouts'], 1)
+
+
+class LLMLimiterTests(SimpleTestCase):
+    def test_concurrency_limit_times_out(self):
+        limiter = LLMLimiter(max_concurrency=1, requests_per_minute=0)
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire(timeout=0.02))
+        self.assertEqual(limiter.get_stats()['by_priority']['anonymous']['timeouts'], 1)
+
+        limiter.release()
+        self.assertTrue(limiter.acquire(timeout=0.02))
+
+    def test_higher_priority_served_first(self):
+        limiter = LLMLimiter(max_concurrency=1, requests_per_minute=0)
+        self.assertTrue(limiter.acquire())
+        order = []
+
+        def waiter(priority, name):
+            if limiter.acquire(priority, timeout=2):
+                order.append(name)
+                limiter.release()
+
+        batch = threading.Thread(target=waiter, args=(PRIORITY_BATCH, 'batch'))
+        batch.start()
+        wait_until(lambda: limiter.get_stats()['queue_length'] == 1)
+        faculty = threading.Thread(target=waiter, args=(PRIORITY_FACULTY, 'faculty'))
+        faculty.start()
+        wait_until(lambda: limiter.get_stats()['queue_length'] == 2)
+
+        limiter.release()
+        batch.join(2)
+        faculty.join(2)
+        self.assertEqual(order, ['faculty', 'batch'])
+
+    def test_full_queue_rejects(self):
+        limiter = LLMLimiter(max_concurrency=1, requests_per_minute=0, max_queue=1)
+        limiter.acquire()
+        waiter = threading.Thread(target=limiter.acquire, kwargs={'timeout': 0.5})
+        waiter.start()
+        wait_until(lambda: limiter.get_stats()['queue_length'] == 1)
+
+        self.assertFalse(limiter.acquire(timeout=0.5))
+        self.assertEqual(limiter.get_stats()['by_priority']['anonymous']['rejected'], 1)
+        limiter.release()
+        waiter.join(2)
+
+    def test_rate_limited_pauses_calls(self):
+        limiter = LLMLimiter(requests_per_minute=600, burst=5)
+        limiter.report_rate_limited(retry_after=30)
+
+        self.assertFalse(limiter.acquire(timeout=0.02))
+        stats = limiter.get_stats()
+        self.assertGreater(stats['paused_for'], 25)
+        self.assertEqual(stats['rate_limited'], 1)
+
+    def test_burst_limit(self):
+        limiter = LLMLimiter(max_concurrency=10, requests_per_minute=60, burst=2)
+        self.assertTrue(limiter.acquire())
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire(timeout=0.02))
+
+
+class DeadlineTests(SimpleTestCase):
+    @override_settings(CHAT_RESPONSE_TIMEOUT=30, CHAT_DEADLINE={'SAFETY_MARGIN': 3})
+    def test_budget_from_frontend_timeout(self):
+        self.assertEqual(Deadline.for_chat_request().budget, 27)
+
+    def test_stage_budget(self):
+        deadline = Deadline(budget=2.0)
+        self.assertTrue(deadline.has_budget_for('intent'))
+        self.assertFalse(deadline.has_budget_for('llm'))  # cần tối thiểu 3s
+        self.assertLessEqual(deadline.cap(10), 2.0)
+        self.assertEqual(deadline.cap(0.5), 0.5)
+
+    def test_shed_and_skip(self):
+        deadline = Deadline(budget=20.0)
+        deadline.shed('llm')
+        self.assertFalse(deadline.has_budget_for('llm'))
+        self.assertFalse(deadline.degraded)
+
+        deadline.skip('llm')
+        deadline.skip('llm')
+        self.assertEqual(deadline.as_dict()['skipped_stages'], ['llm'])
+        self.assertTrue(deadline.degraded)
+
+    def test_expired(self):
+        deadline = Deadline(budget=0.0)
+        self.assertTrue(deadline.expired())
+        self.assertEqual(deadline.cap(None), 0.0)
+
+
+class SessionStoreTests(SimpleTestCase):
+    def test_lru_eviction(self):
+        store = SessionStore(factory=dict, max_sessions=2, idle_ttl=0)
+        store.get_or_create('a')
+        store.get_or_create('b')
+        store.get('a')  # 'b' thành session ít dùng nhất
+        store.get_or_create('c')
+
+        self.assertIn('a', store)
+        self.assertNotIn('b', store)
+        self.assertEqual(store.stats['evicted_lru'], 1)
+
+    def test_idle_ttl(self):
+        store = SessionStore(factory=dict, idle_ttl=60)
+        with mock.patch('ai_models.session_store.time.time', return_value=1000.0):
+            state = store.get_or_create('a')
+        with mock.patch('ai_models.session_store.time.time', return_value=1059.0):
+            self.assertIs(store.get('a'), state)
+        with mock.patch('ai_models.session_store.time.time', return_value=1120.0):
+            self.assertIsNone(store.get('a'))
+            self.assertIsNot(store.get_or_create('a'), state)
+        self.assertEqual(store.stats['expired'], 1)
+
+    def test_conversation_state_round_trip(self):
+        state = ConversationState(max_history=3)
+        for index, query in enumerate(['Học phí ngành CNTT', 'Lịch thi học kỳ', 'Nghiên cứu khoa học', 'Học phí']):
+            state.append_turn(make_turn(query, timestamp=index))
+        state.user_interests = {'cntt'}
+        state.updated_at = 42.0
+
+        restored = ConversationState.from_dict(state.to_dict(), max_history=3)
+        self.assertEqual(len(restored.history), 3)
+        self.assertEqual([turn.user_query for turn in restored.history],
+                         [turn.user_query for turn in state.history])
+        self.assertEqual(restored.context_summary, state.context_summary)
+        self.assertEqual(restored.topic_counts, state.topic_counts)
+        self.assertEqual(restored.user_interests, {'cntt'})
+        self.assertEqual(restored.updated_at, 42.0)
+
+    def test_turn_from_legacy_dict(self):
+        data = make_turn('Học phí ngành CNTT').as_dict()
+        expected = (data.pop('topic_mask'), data.pop('main_topic'))
+        turn = Turn.from_dict(data)
+        self.assertEqual((turn.topic_mask, turn.main_topic), expected)
+
+
+class SQLiteSessionBackendTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'session_memory.sqlite3')
+        self.backend = SQLiteSessionBackend(self.path, idle_ttl=3600)
+        self.addCleanup(self.backend.close)
+
+    def test_shared_between_backends(self):
+        now = time.time()
+        self.backend.save_many({'s1': {'history': [], 'updated_at': now}})
+
+        other = SQLiteSessionBackend(self.path, idle_ttl=3600)
+        self.addCleanup(other.close)
+        self.assertEqual(other.load('s1'), {'history': [], 'updated_at': now})
+
+        other.delete('s1')
+        self.assertIsNone(self.backend.load('s1'))
+
+    def test_older_write_does_not_overwrite(self):
+        now = time.time()
+        self.backend.save_many({'s1': {'value': 'new', 'updated_at': now}})
+        self.backend.save_many({'s1': {'value': 'stale', 'updated_at': now - 10}})
+        self.assertEqual(self.backend.load('s1')['value'], 'new')
+
+    def test_idle_sessions_expire(self):
+        self.backend.save_many({'s1': {'updated_at': time.time() - 7200}})
+        self.assertIsNone(self.backend.load('s1'))
+
+    def test_build_backend(self):
+        backend = build_session_backend({'BACKEND': 'sqlite', 'SQLITE_PATH': self.path})
+        self.addCleanup(backend.close)
+        self.assertTrue(backend.shared)
+        self.assertIs(type(build_session_backend({})), SessionBackend)
@@ -0,0 +1,80 @@
+# ai_models/topics.py
+
+from functools import lru_cache
+from typing import NamedTuple, Optional, Sequence
+
+# Chủ đề dùng cho context summary - thứ tự = độ ưu tiên
+SUMMARY_TOPICS = (
+    ('Đang hỏi về ngân hàng đề thi', ('ngân hàng đề', 'đề thi', 'khảo thí')),
+    ('Đang hỏi về kê khai nhiệm vụ năm học', ('kê khai', 'nhiệm vụ', 'giờ chuẩn')),
+    ('Đang hỏi về tạp chí khoa học', ('tạp chí', 'nghiên cứu', 'bài viết')),
+    ('Đang hỏi về thi đua khen thưởng', ('thi đua', 'khen thưởng', 'danh hiệu')),
+    ('Đang hỏi về báo cáo và thủ tục', ('báo cáo', 'nộp', 'hạn cuối')),
+    ('Đang hỏi về lịch giảng dạy', ('lịch', 'thời khóa biểu', 'giảng dạy')),
+    ('Đang quan tâm học phí', ('học phí', 'tiền', 'chi phí')),
+    ('Đang hỏi về tuyển sinh', ('tuyển sinh', 'điểm', 'xét tuyển')),
+    ('Đang tìm hiểu về ngành học', ('ngành', 'chuyên ngành', 'đào tạo')),
+    ('Đang hỏi về cơ sở vật chất', ('cơ sở', 'phòng', 'trang thiết bị')),
+)
+DEFAULT_SUMMARY = 'Hỏi đáp chung về BDU'
+
+# Số lượt gần nhất dùng để tính context summary
+SUMMARY_WINDOW = 3
+
+# Chủ đề chính dùng cho follow-up / topic shift detection
+LECTURER_TOPICS = (
+    ('ngân hàng đề thi', ('ngân hàng', 'đề thi', 'đề', 'khảo thí')),
+    ('kê khai nhiệm vụ', ('kê khai', 'nhiệm vụ', 'giờ chuẩn')),
+    ('tạp chí khoa học', ('tạp chí', 'bài viết', 'nghiên cứu')),
+    ('thi đua khen thưởng', ('thi đua', 'khen thưởng', 'danh hiệu')),
+    ('báo cáo', ('báo cáo', 'nộp', 'hạn cuối')),
+    ('lịch giảng dạy', ('lịch', 'giảng dạy', 'thời khóa biểu')),
+    ('cơ sở vật chất', ('cơ sở', 'phòng', 'trang thiết bị')),
+    ('học phí', ('học phí', 'phí', 'tiền học', 'chi phí')),
+    ('tuyển sinh', ('tuyển sinh', 'nhập học', 'đăng ký', 'điểm')),
+    ('ngành học', ('ngành', 'chuyên ngành', 'khoa', 'đào tạo')),
+)
+
+
+class TopicMatch(NamedTuple):
+    summary_mask: int           # bit i = câu hỏi chạm SUMMARY_TOPICS[i]
+    main_topic: Optional[str]   # chủ đề đầu tiên khớp trong LECTURER_TOPICS
+
+
+@lru_cache(maxsize=2048)
+def match_topics(query: str) -> TopicMatch:
+    """Quét keyword 1 lần cho mỗi câu hỏi (cache: strategy và memory dùng chung kết quả)"""
+    text = query.lower()
+    mask = 0
+    for index, (_, keywords) in enumerate(SUMMARY_TOPICS):
+        if any(kw in text for kw in keywords):
+            mask |= 1 << index
+
+    main_topic = None
+    for topic, keywords in LECTURER_TOPICS:
+        if any(kw in text for kw in keywords):
+            main_topic = topic
+            break
+
+    return TopicMatch(mask, main_topic)
+
+
+def new_topic_counts():
+    return [0] * len(SUMMARY_TOPICS)
+
+
+def apply_topic_mask(counts, mask: int, delta: int):
+    """Cộng/trừ các bit của mask vào bộ đếm theo chủ đề"""
+    index = 0
+    while mask:
+        if mask & 1:
+            counts[index] += delta
+        mask >>= 1
+        index += 1
+
+
+def summary_from_counts(counts: Sequence[int]) -> str:
+    for index, count in enumerate(counts):
+        if count > 0:
+            return SUMMARY_TOPICS[index][0]
+    return DEFAULT_SUMMARY
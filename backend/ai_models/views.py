@@ -3,10 +3,12 @@ from django.shortcuts import render
 # Create your views here.
 from django.http import JsonResponse
 from django.utils import timezone
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework import status
+from backend.http_cache import cache_response
+from backend.throttling import SpeechThrottle
 import logging
 
 logger = logging.getLogger(__name__)
@@ -32,6 +34,7 @@ def health_check(request):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])  # Speech status cũng public
+@cache_response('ai_speech_status')
 def speech_status(request):
     """
     Speech recognition status endpoint - Public access
@@ -60,6 +63,7 @@ def speech_status(request):
 # Speech-to-text endpoint cần authentication
 @api_view(['POST'])
 # Không thêm @permission_classes([AllowAny]) - sử dụng default authentication
+@throttle_classes([SpeechThrottle])
 def speech_to_text(request):
     """
     Speech to text endpoint - Requires authentication
@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class AuthenticationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'authentication'
+
+    def ready(self):
+        # ✅ THÊM: Token bị xoá (logout, admin) -> bỏ khỏi cache của CachedTokenAuthentication
+        from django.db.models.signals import post_delete
+        from rest_framework.authtoken.models import Token
+        from .authentication import token_cache
+
+        def _invalidate_token(sender, instance, **kwargs):
+            token_cache.invalidate_key(instance.key)
+
+        post_delete.connect(_invalidate_token, sender=Token, weak=False,
+                            dispatch_uid='authentication.token_cache.invalidate')
@@ -0,0 +1,189 @@
+# authentication/authentication.py
+
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+logger = logging.getLogger(__name__)
+
+
+def get_token_cache_config() -> Dict[str, Any]:
+    config = dict(getattr(settings, 'TOKEN_AUTH_CACHE', {}))
+    config.setdefault('ENABLED', True)
+    config.setdefault('TTL', 5)
+    config.setdefault('MAX_ENTRIES', 5000)
+    config.setdefault('REVOCATION_CACHE', 'default')
+    return config
+
+
+class TokenCache:
+    """
+    Cache (user, token) theo token key trong mỗi process.
+
+    Invalidate khi logout / đổi mật khẩu / khoá tài khoản (Faculty.save,
+    Token bị xoá): bỏ entry trong process và ghi dấu thu hồi vào Django cache
+    (revocations); mỗi lần hit kiểm tra dấu đó nên worker khác cũng thấy ngay
+    nếu CACHES là cache dùng chung (Redis/Memcached). Với LocMemCache mặc định
+    dấu chỉ có trong process -> worker khác trễ tối đa TTL giây.
+    """
+
+    def __init__(self, ttl: float = 5, max_entries: int = 5000, enabled: bool = True, revocations=None):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.revocations = revocations
+        self._entries = OrderedDict()  # key -> (expires_at, user, token, verified_at)
+        self._keys_by_user = {}        # user_id -> key
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'revoked': 0}
+
+    @staticmethod
+    def _revoked_key(key: str) -> str:
+        return f'authtoken:revoked:{key}'
+
+    @staticmethod
+    def _user_revoked_key(user_id) -> str:
+        return f'authtoken:user_revoked:{user_id}'
+
+    def _is_revoked(self, key: str, user_id, verified_at: float) -> bool:
+        """Dấu thu hồi từ worker khác: token bị xoá, hoặc user bị invalidate sau lúc entry được xác thực"""
+        if self.revocations is None:
+            return False
+        try:
+            marks = self.revocations.get_many([self._revoked_key(key), self._user_revoked_key(user_id)])
+        except Exception as e:
+            # Cache dùng chung lỗi -> coi như miss, xác thực lại từ DB
+            logger.warning(f"Token revocation cache unavailable: {e}")
+            return True
+        if marks.get(self._revoked_key(key)):
+            return True
+        user_revoked_at = marks.get(self._user_revoked_key(user_id))
+        return user_revoked_at is not None and user_revoked_at >= verified_at
+
+    def _mark_revoked(self, cache_key: str, value):
+        if self.revocations is None:
+            return
+        try:
+            # Entry ở worker khác sống tối đa TTL -> dấu chỉ cần giữ chừng đó (+ dư 1s)
+            self.revocations.set(cache_key, value, timeout=self.ttl + 1)
+        except Exception as e:
+            logger.warning(f"Could not publish token revocation: {e}")
+
+    def get(self, key: str) -> Optional[Tuple[Any, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    self._drop(key)
+                self._stats['misses'] += 1
+                return None
+            user, token, verified_at = entry[1], entry[2], entry[3]
+
+        if self._is_revoked(key, user.pk, verified_at):
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    self._drop(key)
+                self._stats['revoked'] += 1
+                self._stats['misses'] += 1
+            return None
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+        # Mỗi request 1 bản copy: view sửa request.user không ảnh hưởng entry dùng chung
+        return copy.copy(user), token
+
+    def set(self, key: str, user, token, verified_at: Optional[float] = None):
+        """verified_at: thời điểm (time.time()) bắt đầu đọc DB - thu hồi sau mốc này sẽ thắng"""
+        verified_at = time.time() if verified_at is None else verified_at
+        with self._lock:
+            old_key = self._keys_by_user.get(user.pk)
+            if old_key is not None and old_key != key:
+                self._entries.pop(old_key, None)
+            self._entries[key] = (time.monotonic() + self.ttl, copy.copy(user), token, verified_at)
+            self._entries.move_to_end(key)
+            self._keys_by_user[user.pk] = key
+            while len(self._entries) > self.max_entries:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self._keys_by_user.pop(evicted[1].pk, None)
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None and self._keys_by_user.get(entry[1].pk) == key:
+            del self._keys_by_user[entry[1].pk]
+
+    def invalidate_key(self, key: str):
+        with self._lock:
+            self._drop(key)
+            self._stats['invalidations'] += 1
+        self._mark_revoked(self._revoked_key(key), 1)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            key = self._keys_by_user.get(user_id)
+            if key is not None:
+                self._drop(key)
+            self._stats['invalidations'] += 1
+        self._mark_revoked(self._user_revoked_key(user_id), time.time())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'ttl': self.ttl,
+                'shared_revocation': self.revocations is not None,
+                'hit_rate': round(self._stats['hits'] / lookups, 3) if lookups else 0.0,
+            }
+
+
+def _build_token_cache() -> TokenCache:
+    config = get_token_cache_config()
+    revocations = caches[config['REVOCATION_CACHE']] if config['REVOCATION_CACHE'] else None
+    return TokenCache(ttl=config['TTL'], max_entries=config['MAX_ENTRIES'], enabled=config['ENABLED'],
+                      revocations=revocations)
+
+
+# Global token cache instance
+token_cache = _build_token_cache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication + cache trong bộ nhớ: request có token đã xác thực
+    gần đây không query authtoken_token JOIN faculty nữa.
+    Giống login_view: tài khoản is_active=False hoặc is_active_faculty=False bị từ chối.
+    """
+
+    def authenticate_credentials(self, key):
+        if token_cache.enabled:
+            cached = token_cache.get(key)
+            if cached is not None:
+                return cached
+
+        verified_at = time.time()
+        user, token = super().authenticate_credentials(key)
+        if not getattr(user, 'is_active_faculty', True):
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        if token_cache.enabled:
+            token_cache.set(key, user, token, verified_at)
+        return (user, token)
@@ -0,0 +1,107 @@
+# authentication/context_cache.py
+
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def get_context_cache_config() -> Dict[str, Any]:
+    config = dict(getattr(settings, 'PERSONALIZATION_CACHE', {}))
+    config.setdefault('FACULTY_CONTEXT_TIMEOUT', 1800)
+    config.setdefault('SYSTEM_PROMPT_TIMEOUT', 1800)
+    config.setdefault('MAX_ENTRIES', 2000)
+    return config
+
+
+class FacultyContextCache:
+    """
+    Cache chatbot context + system prompt cá nhân hóa theo (user_id, version).
+
+    version = Faculty.preferences_version (updated_at), nên bản ghi đã lưu ở
+    worker khác cũng làm entry cũ hết hiệu lực khi request sau load lại user.
+    Faculty.save() gọi invalidate() để dọn entry trong process hiện tại.
+    """
+
+    def __init__(self, max_entries: int = 2000, context_ttl: float = 1800, prompt_ttl: float = 1800):
+        self.max_entries = max_entries
+        self.ttls = {'context': context_ttl, 'prompt': prompt_ttl}
+        self._entries = OrderedDict()  # user_id -> {'version': ..., kind: (expires_at, value)}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+
+    def _get(self, kind: str, user_id, version, builder: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry['version'] == version:
+                cached = entry.get(kind)
+                if cached and cached[0] > now:
+                    self._entries.move_to_end(user_id)
+                    self._stats['hits'] += 1
+                    return cached[1]
+            self._stats['misses'] += 1
+
+        value = builder()
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry['version'] != version:
+                entry = {'version': version}
+                self._entries[user_id] = entry
+            entry[kind] = (now + self.ttls[kind], value)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return value
+
+    def get_context(self, faculty) -> Dict[str, Any]:
+        """Bản copy của context đã cache (caller có thể sửa dict thoải mái)"""
+        context = self._get(
+            'context', faculty.pk, faculty.preferences_version,
+            lambda: copy.deepcopy(faculty.build_chatbot_context()),
+        )
+        return copy.deepcopy(context)
+
+    def get_system_prompt(self, faculty) -> str:
+        return self._get(
+            'prompt', faculty.pk, faculty.preferences_version,
+            faculty.build_personalized_system_prompt,
+        )
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+            self._stats['invalidations'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'entries': len(self._entries),
+                'hit_rate': round(self._stats['hits'] / lookups, 3) if lookups else 0.0,
+            }
+
+
+def _build_context_cache() -> FacultyContextCache:
+    config = get_context_cache_config()
+    return FacultyContextCache(
+        max_entries=config['MAX_ENTRIES'],
+        context_ttl=config['FACULTY_CONTEXT_TIMEOUT'],
+        prompt_ttl=config['SYSTEM_PROMPT_TIMEOUT'],
+    )
+
+
+# Global cache instance
+faculty_context_cache = _build_context_cache()
@@ -3,6 +3,10 @@ from django.db import models
 from django.utils import timezone
 import uuid
 
+from backend.http_cache import response_cache
+from .authentication import token_cache
+from .context_cache import faculty_context_cache
+
 class Faculty(AbstractUser):
     """
     Custom User model cho giảng viên
@@ -106,6 +110,12 @@ class Faculty(AbstractUser):
         # Auto set username = faculty_code (giữ nguyên)
         self.username = self.faculty_code
         super().save(*args, **kwargs)
+        # ✅ THÊM: Profile thay đổi -> bỏ context/system prompt đã cache
+        faculty_context_cache.invalidate(self.pk)
+        # ✅ THÊM: Đổi mật khẩu / khoá tài khoản -> token phải xác thực lại từ DB
+        token_cache.invalidate_user(self.pk)
+        # ✅ THÊM: Response cache theo user (context, gợi ý theo ngành)
+        response_cache.invalidate(f'user:{self.pk}')
     
     # ✅ THÊM: Các method hỗ trợ personalization
     def get_role_description(self):
@@ -114,8 +124,17 @@ class Faculty(AbstractUser):
         pos_name = self.get_position_display()
         return f"{pos_name} {dept_name}"
     
+    @property
+    def preferences_version(self):
+        """Version cho cache context - đổi mỗi lần profile/preferences được lưu"""
+        return self.updated_at.timestamp() if self.updated_at else None
+
     def get_chatbot_context(self):
-        """Lấy context cho chatbot dựa trên vai trò"""
+        """Lấy context cho chatbot dựa trên vai trò (cache theo preferences_version)"""
+        return faculty_context_cache.get_context(self)
+
+    def build_chatbot_context(self):
+        """Dựng context cho chatbot (không qua cache)"""
         return {
             'user_id': self.id,
             'faculty_code': self.faculty_code,
@@ -137,9 +156,14 @@ class Faculty(AbstractUser):
             self.chatbot_preferences = {}
         
         self.chatbot_preferences.update(preferences_data)
-        self.save(update_fields=['chatbot_preferences'])
+        # ✅ CHANGED: Lưu cả updated_at để preferences_version đổi ở mọi worker
+        self.save(update_fields=['chatbot_preferences', 'updated_at'])
     
     def get_personalized_system_prompt(self):
+        """System prompt cá nhân hóa (cache theo preferences_version)"""
+        return faculty_context_cache.get_system_prompt(self)
+
+    def build_personalized_system_prompt(self):
         """Tạo system prompt cá nhân hóa dựa trên vai trò"""
         base_prompt = f"""Bạn là AI assistant chuyên nghiệp của Đại học Bình Dương (BDU), được thiết kế ĐẶC BIỆT để hỗ trợ {self.get_role_description()}.
 
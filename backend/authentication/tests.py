@@ -1,3 +1,120 @@
-from django.test import TestCase
+import time
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase, TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .authentication import TokenCache, token_cache
+from .models import Faculty
+
+
+class TokenCacheTests(SimpleTestCase):
+    def setUp(self):
+        # 2 TokenCache dùng chung 1 cache thu hồi = 2 worker dùng chung Redis/Memcached
+        self.shared = LocMemCache('token-revocations-test', {})
+        self.shared.clear()
+        self.worker_a = TokenCache(ttl=60, revocations=self.shared)
+        self.worker_b = TokenCache(ttl=60, revocations=self.shared)
+        self.user = SimpleNamespace(pk=1)
+
+    def test_hit_returns_copy_of_user(self):
+        self.worker_a.set('key', self.user, 'token')
+        user, token = self.worker_a.get('key')
+        user.pk = 99
+        self.assertEqual(token, 'token')
+        self.assertEqual(self.worker_a.get('key')[0].pk, 1)
+        self.assertEqual(self.worker_a.get_stats()['hits'], 2)
+
+    def test_entry_expires_after_ttl(self):
+        cache = TokenCache(ttl=5)
+        with mock.patch('authentication.authentication.time.monotonic', return_value=100.0):
+            cache.set('key', self.user, 'token')
+        with mock.patch('authentication.authentication.time.monotonic', return_value=104.0):
+            self.assertIsNotNone(cache.get('key'))
+        with mock.patch('authentication.authentication.time.monotonic', return_value=105.0):
+            self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.get_stats()['entries'], 0)
+
+    def test_deleted_token_is_revoked_in_other_worker(self):
+        self.worker_b.set('key', self.user, 'token')
+        self.worker_a.invalidate_key('key')
+
+        self.assertIsNone(self.worker_b.get('key'))
+        self.assertEqual(self.worker_b.get_stats()['revoked'], 1)
+
+    def test_user_revocation_only_affects_older_entries(self):
+        self.worker_b.set('key', self.user, 'token', verified_at=time.time() - 1)
+        self.worker_a.invalidate_user(self.user.pk)
+        self.assertIsNone(self.worker_b.get('key'))
+
+        # Xác thực lại từ DB sau lúc thu hồi -> dùng được
+        self.worker_b.set('key', self.user, 'token', verified_at=time.time() + 1)
+        self.assertIsNotNone(self.worker_b.get('key'))
+
+    def test_unavailable_revocation_cache_forces_db_check(self):
+        self.worker_a.set('key', self.user, 'token')
+        with mock.patch.object(self.shared, 'get_many', side_effect=ConnectionError('down')):
+            self.assertIsNone(self.worker_a.get('key'))
+
+    def test_one_entry_per_user_and_lru_limit(self):
+        cache = TokenCache(ttl=60, max_entries=2)
+        cache.set('old', self.user, 'token')
+        cache.set('new', self.user, 'token')
+        self.assertIsNone(cache.get('old'))
+
+        cache.set('other', SimpleNamespace(pk=2), 'token')
+        cache.set('third', SimpleNamespace(pk=3), 'token')
+        self.assertIsNone(cache.get('new'))
+        self.assertEqual(cache.get_stats()['entries'], 2)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        caches['default'].clear()
+        self.faculty = Faculty.objects.create(
+            faculty_code='GV_CNTT_001', email='khoa.nv@bdu.edu.vn', full_name='Nguyễn Văn Khoa',
+            department='cntt', password=make_password('gv001@2024'),
+        )
+        self.token = Token.objects.create(user=self.faculty)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_profile(self):
+        return self.client.get('/api/auth/profile/')
+
+    def assertRejected(self, response):
+        # SessionAuthentication đứng đầu DEFAULT_AUTHENTICATION_CLASSES -> không có WWW-Authenticate, DRF trả 403
+        self.assertEqual(response.status_code, 403)
+
+    def test_second_request_served_from_cache(self):
+        self.assertEqual(self.get_profile().status_code, 200)
+        hits = token_cache.get_stats()['hits']
+        self.assertEqual(self.get_profile().status_code, 200)
+        self.assertEqual(token_cache.get_stats()['hits'], hits + 1)
+
+    def test_deleted_token_rejected(self):
+        self.assertEqual(self.get_profile().status_code, 200)
+        self.token.delete()
+        self.assertRejected(self.get_profile())
+
+    def test_inactive_faculty_rejected(self):
+        self.assertEqual(self.get_profile().status_code, 200)
+        self.faculty.is_active_faculty = False
+        self.faculty.save()
+        self.assertRejected(self.get_profile())
+
+    def test_revocation_seen_by_process_local_entry(self):
+        self.assertEqual(self.get_profile().status_code, 200)
+        # Worker khác đổi mật khẩu: chỉ ghi dấu vào cache dùng chung, entry ở đây vẫn còn
+        TokenCache(ttl=token_cache.ttl, revocations=caches['default']).invalidate_user(self.faculty.pk)
+        Faculty.objects.filter(pk=self.faculty.pk).update(is_active=False)
+        self.assertRejected(self.get_profile())
+
+    def test_unauthenticated_request(self):
+        self.assertRejected(APIClient().get('/api/auth/profile/'))
@@ -3,13 +3,17 @@ from django.contrib.auth.hashers import check_password
 from django.utils import timezone
 from django.conf import settings
 from rest_framework import status, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from datetime import timedelta
 import logging
 
 from .models import Faculty, PasswordResetToken, LoginAttempt
+from .authentication import token_cache
+from backend.http_cache import cache_response
+from backend.throttling import AuthThrottle
+from backend.utils import get_client_ip
 from .serializers import (
     LoginSerializer, FacultyProfileSerializer, 
     PasswordResetRequestSerializer, PasswordResetConfirmSerializer,
@@ -19,16 +23,6 @@ from .serializers import (
 logger = logging.getLogger(__name__)
 
 
-def get_client_ip(request):
-    """Lấy IP client"""
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
-
-
 def log_login_attempt(faculty_code, request, success, failure_reason=None):
     """Log lại các lần đăng nhập"""
     try:
@@ -45,6 +39,7 @@ def log_login_attempt(faculty_code, request, success, failure_reason=None):
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes([AuthThrottle])
 def login_view(request):
     """
     API đăng nhập cho giảng viên
@@ -144,6 +139,7 @@ def logout_view(request):
             token.delete()
         except Token.DoesNotExist:
             pass
+        token_cache.invalidate_user(request.user.pk)
         
         # Đăng xuất session
         logout(request)
@@ -184,6 +180,7 @@ def profile_view(request):
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes([AuthThrottle])
 def password_reset_request(request):
     """
     API yêu cầu reset password
@@ -242,6 +239,7 @@ def password_reset_request(request):
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes([AuthThrottle])
 def password_reset_confirm(request):
     """
     API xác nhận reset password
@@ -299,6 +297,7 @@ def password_reset_confirm(request):
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
+@throttle_classes([AuthThrottle])
 def change_password(request):
     """
     API đổi mật khẩu khi đã đăng nhập
@@ -513,6 +512,7 @@ def update_department_focus(request):
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@cache_response('department_suggestions', vary_on_user=True)
 def get_department_suggestions(request):
     """API lấy gợi ý theo ngành"""
     try:
@@ -0,0 +1,142 @@
+# backend/admission.py
+"""
+Admission control cho chat (settings.ADMISSION_CONTROL).
+
+Theo dõi số request chat đang xử lý (in-flight) và p95 latency gần đây:
+    < DEGRADE_*           xử lý đầy đủ
+    >= DEGRADE_*          degrade: bỏ Gemini, trả câu trả lời CSDL / câu trả lời đã cache
+    >= REJECT_IN_FLIGHT   từ chối ngay 503 + Retry-After
+để các request đã nhận vẫn kịp trong timeout 30s của frontend.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Dict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+ADMIT = 'admit'
+DEGRADE = 'degrade'
+REJECT = 'reject'
+
+
+def get_admission_config() -> Dict[str, Any]:
+    config = dict(getattr(settings, 'ADMISSION_CONTROL', {}))
+    config.setdefault('ENABLED', True)
+    config.setdefault('PATHS', ['/api/chat/', '/api/chat/batch/'])
+    config.setdefault('LATENCY_PATHS', ['/api/chat/'])
+    config.setdefault('DEGRADE_IN_FLIGHT', 8)
+    config.setdefault('DEGRADE_P95', 15.0)
+    config.setdefault('REJECT_IN_FLIGHT', 16)
+    config.setdefault('LATENCY_WINDOW', 60.0)
+    config.setdefault('LATENCY_SAMPLES', 200)
+    config.setdefault('MIN_SAMPLES', 20)
+    config.setdefault('RETRY_AFTER', 5)
+    return config
+
+
+class AdmissionController:
+    """Đếm in-flight + cửa sổ latency (theo thời gian và số mẫu) trong 1 worker"""
+
+    def __init__(self, degrade_in_flight: int = 8, degrade_p95: float = 15.0, reject_in_flight: int = 16,
+                 latency_window: float = 60.0, latency_samples: int = 200, min_samples: int = 20,
+                 retry_after: int = 5):
+        self.degrade_in_flight = degrade_in_flight
+        self.degrade_p95 = degrade_p95
+        self.reject_in_flight = reject_in_flight
+        self.latency_window = latency_window
+        self.min_samples = min_samples
+        self.retry_after = retry_after
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._latencies = deque(maxlen=latency_samples)  # (finished_at, seconds)
+        self._p95_cache = (0.0, None)  # (computed_at, p95)
+        self._stats = {ADMIT: 0, DEGRADE: 0, REJECT: 0}
+        self._max_in_flight = 0
+
+    def _p95(self, now: float):
+        """p95 của các mẫu trong cửa sổ; tính lại tối đa 1 lần/giây"""
+        computed_at, p95 = self._p95_cache
+        if now - computed_at < 1.0:
+            return p95
+
+        while self._latencies and now - self._latencies[0][0] > self.latency_window:
+            self._latencies.popleft()
+        if len(self._latencies) < self.min_samples:
+            p95 = None
+        else:
+            ordered = sorted(seconds for _, seconds in self._latencies)
+            p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+        self._p95_cache = (now, p95)
+        return p95
+
+    def try_admit(self) -> str:
+        """ADMIT / DEGRADE / REJECT; ADMIT và DEGRADE phải gọi release() khi xong"""
+        now = time.monotonic()
+        with self._lock:
+            if self.reject_in_flight and self._in_flight >= self.reject_in_flight:
+                decision = REJECT
+            else:
+                p95 = self._p95(now)
+                overloaded = (
+                    (self.degrade_in_flight and self._in_flight >= self.degrade_in_flight)
+                    or (self.degrade_p95 and p95 is not None and p95 >= self.degrade_p95)
+                )
+                decision = DEGRADE if overloaded else ADMIT
+                self._in_flight += 1
+                self._max_in_flight = max(self._max_in_flight, self._in_flight)
+            self._stats[decision] += 1
+        return decision
+
+    def release(self, latency: float, record_latency: bool = True):
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+            if record_latency:
+                self._latencies.append((time.monotonic(), latency))
+
+    def get_retry_after(self) -> int:
+        """Ước lượng: p95 hiện tại (request đang chạy sẽ xong trong khoảng đó), tối thiểu RETRY_AFTER"""
+        with self._lock:
+            p95 = self._p95(time.monotonic())
+        return max(self.retry_after, math.ceil(p95 or 0))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            p95 = self._p95(time.monotonic())
+            return {
+                'in_flight': self._in_flight,
+                'max_in_flight': self._max_in_flight,
+                'p95_latency': round(p95, 3) if p95 is not None else None,
+                'samples': len(self._latencies),
+                'admitted': self._stats[ADMIT],
+                'degraded': self._stats[DEGRADE],
+                'rejected': self._stats[REJECT],
+                'thresholds': {
+                    'degrade_in_flight': self.degrade_in_flight,
+                    'degrade_p95': self.degrade_p95,
+                    'reject_in_flight': self.reject_in_flight,
+                },
+            }
+
+
+def _build_admission_controller() -> AdmissionController:
+    config = get_admission_config()
+    return AdmissionController(
+        degrade_in_flight=config['DEGRADE_IN_FLIGHT'],
+        degrade_p95=config['DEGRADE_P95'],
+        reject_in_flight=config['REJECT_IN_FLIGHT'],
+        latency_window=config['LATENCY_WINDOW'],
+        latency_samples=config['LATENCY_SAMPLES'],
+        min_samples=config['MIN_SAMPLES'],
+        retry_after=config['RETRY_AFTER'],
+    )
+
+
+# Global admission controller
+admission_controller = _build_admission_controller()
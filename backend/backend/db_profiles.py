@@ -0,0 +1,103 @@
+# backend/db_profiles.py
+"""
+Cấu hình database theo profile (biến môi trường DB_PROFILE):
+
+    sqlite-basic  cấu hình cũ: journal rollback, mỗi request 1 connection mới
+    sqlite        (mặc định) WAL + synchronous=NORMAL + mmap/cache, giữ connection
+    postgres      PostgreSQL, connection giữ lâu theo thread (CONN_MAX_AGE) hoặc
+                  pool qua PgBouncer (DB_PGBOUNCER=true, deploy/pgbouncer/pgbouncer.ini)
+
+Django 4.2 không có connection pool built-in - pooling thật chỉ có khi đi qua PgBouncer.
+"""
+
+import logging
+import os
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE = 'sqlite'
+
+# PRAGMA cho mỗi connection SQLite mới (profile 'sqlite')
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',          # reader không chặn writer và ngược lại
+    'synchronous': 'NORMAL',        # an toàn với WAL, bỏ fsync mỗi commit
+    'busy_timeout': 20000,          # ms - chờ lock thay vì lỗi "database is locked" ngay
+    'cache_size': -64000,           # KB (số âm) - 64MB page cache mỗi connection
+    'mmap_size': 268435456,         # 256MB đọc qua mmap
+    'temp_store': 'MEMORY',
+}
+
+
+def _sqlite_path(base_dir) -> str:
+    return os.getenv('SQLITE_PATH', str(base_dir / 'db.sqlite3'))
+
+
+def build_database_settings(base_dir, profile: str = None) -> Dict[str, Any]:
+    """Trả về DATABASES['default'] cho profile đã chọn"""
+    profile = (profile or os.getenv('DB_PROFILE') or DEFAULT_PROFILE).lower()
+
+    if profile == 'sqlite-basic':
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': _sqlite_path(base_dir),
+            'OPTIONS': {
+                'timeout': 20,
+            },
+        }
+
+    if profile == 'sqlite':
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': _sqlite_path(base_dir),
+            'OPTIONS': {
+                'timeout': 20,
+            },
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            # Không phải key của Django - apply_sqlite_pragmas đọc khi mở connection
+            'PRAGMAS': dict(SQLITE_PRAGMAS),
+        }
+
+    if profile == 'postgres':
+        use_pgbouncer = os.getenv('DB_PGBOUNCER', 'False').lower() == 'true'
+        return {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'bdu_chatbot'),
+            'USER': os.getenv('POSTGRES_USER', 'bdu_chatbot'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', '127.0.0.1'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            # Django 4.2 chưa có pool built-in: giữ connection theo thread của worker;
+            # qua PgBouncer (transaction pooling) thì để pooler giữ connection
+            'CONN_MAX_AGE': 0 if use_pgbouncer else int(os.getenv('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'DISABLE_SERVER_SIDE_CURSORS': use_pgbouncer,
+            'OPTIONS': {
+                'connect_timeout': 5,
+                'application_name': 'bdu_chatbot',
+            },
+        }
+
+    raise ValueError(f"Unknown DB_PROFILE '{profile}' (sqlite-basic | sqlite | postgres)")
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Handler cho signal connection_created"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = connection.settings_dict.get('PRAGMAS')
+    if not pragmas:
+        return
+
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            try:
+                cursor.execute(f'PRAGMA {name}={value}')
+            except Exception as e:
+                logger.warning(f"SQLite PRAGMA {name}={value} failed: {e}")
+
+
+def install_connection_hooks():
+    from django.db.backends.signals import connection_created
+    connection_created.connect(apply_sqlite_pragmas, dispatch_uid='backend.db_profiles.sqlite_pragmas')
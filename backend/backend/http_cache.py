@@ -0,0 +1,194 @@
+# backend/http_cache.py
+"""
+Cache response cho các endpoint GET đọc nhiều (settings.HTTP_CACHE):
+
+    @method_decorator(cache_response('chat_info'), name='get')
+    @cache_response('department_suggestions', vary_on_user=True)
+
+- TTL theo tên endpoint (HTTP_CACHE['TTLS'])
+- vary_on_user: key gồm user id + preferences_version (Faculty.updated_at)
+- ETag / Last-Modified -> 304 Not Modified khi client gửi If-None-Match / If-Modified-Since
+- namespaces: invalidate('knowledge') khi KnowledgeBase thay đổi, invalidate('user:<id>') khi Faculty lưu
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def get_http_cache_config() -> Dict[str, Any]:
+    config = dict(getattr(settings, 'HTTP_CACHE', {}))
+    config.setdefault('ENABLED', True)
+    config.setdefault('MAX_ENTRIES', 1000)
+    config.setdefault('DEFAULT_TTL', 60)
+    config['TTLS'] = dict(config.get('TTLS', {}))
+    return config
+
+
+class CachedResponse:
+    __slots__ = ('data', 'etag', 'last_modified', 'expires_at')
+
+    def __init__(self, data, etag: str, last_modified: float, expires_at: float):
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """LRU cache response.data theo key; mỗi namespace có generation để invalidate O(1)"""
+
+    def __init__(self, max_entries: int = 1000, enabled: bool = True):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'invalidations': 0}
+
+    def generation(self, namespace: str) -> int:
+        return self._generations.get(namespace, 0)
+
+    def invalidate(self, namespace: str):
+        """Entry cũ không còn khớp key (theo generation) và sẽ bị LRU đẩy ra"""
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            self._stats['invalidations'] += 1
+
+    def get(self, key) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry
+
+    def set(self, key, entry: CachedResponse):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_not_modified(self):
+        with self._lock:
+            self._stats['not_modified'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'hit_rate': round(self._stats['hits'] / lookups, 3) if lookups else 0.0,
+            }
+
+
+def _build_response_cache() -> ResponseCache:
+    config = get_http_cache_config()
+    return ResponseCache(max_entries=config['MAX_ENTRIES'], enabled=config['ENABLED'])
+
+
+# Global response cache instance
+response_cache = _build_response_cache()
+
+
+def _compute_etag(data) -> str:
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return quote_etag(hashlib.md5(payload.encode('utf-8')).hexdigest())
+
+
+def _user_key(request):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return ('anon',)
+    return (user.pk, getattr(user, 'preferences_version', None))
+
+
+def _is_not_modified(request, entry: CachedResponse) -> bool:
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = [tag.strip() for tag in if_none_match.split(',')]
+        # So sánh weak (W/"...") theo RFC 7232 cho GET
+        return '*' in etags or entry.etag in etags or f'W/{entry.etag}' in etags
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE') or '')
+    return if_modified_since is not None and int(entry.last_modified) <= if_modified_since
+
+
+def _apply_headers(response, entry: CachedResponse, ttl: int, vary_on_user: bool):
+    response['ETag'] = entry.etag
+    response['Last-Modified'] = http_date(entry.last_modified)
+    response['Cache-Control'] = f"{'private' if vary_on_user else 'public'}, max-age={ttl}"
+    if vary_on_user:
+        patch_vary_headers(response, ('Authorization', 'Cookie'))
+    return response
+
+
+def cache_response(name: str, vary_on_user: bool = False, namespaces: Iterable[str] = (),
+                   bypass_params: Iterable[str] = ()):
+    """
+    Decorator cho view function nhận (request, *args, **kwargs) - với APIView dùng method_decorator.
+    Chỉ cache GET trả về 200; query param trong bypass_params -> không cache.
+    """
+    namespaces = tuple(namespaces)
+    bypass_params = tuple(bypass_params)
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            config = get_http_cache_config()
+            if (not response_cache.enabled or request.method != 'GET'
+                    or any(param in request.GET for param in bypass_params)):
+                return view_func(request, *args, **kwargs)
+
+            ttl = config['TTLS'].get(name, config['DEFAULT_TTL'])
+            user_key = _user_key(request) if vary_on_user else None
+            scopes = namespaces + ((f'user:{user_key[0]}',) if vary_on_user else ())
+            key = (
+                name,
+                user_key,
+                tuple(sorted(request.GET.lists())),
+                tuple(response_cache.generation(scope) for scope in scopes),
+                tuple(sorted(kwargs.items())),
+            )
+
+            response = None
+            entry = response_cache.get(key)
+            if entry is None:
+                response = view_func(request, *args, **kwargs)
+                if getattr(response, 'status_code', None) != status.HTTP_200_OK or not hasattr(response, 'data'):
+                    return response
+                now = time.time()
+                entry = CachedResponse(response.data, _compute_etag(response.data), now, now + ttl)
+                response_cache.set(key, entry)
+
+            # Hết TTL nhưng nội dung không đổi -> ETag vẫn khớp, client vẫn nhận 304
+            if _is_not_modified(request, entry):
+                response_cache.record_not_modified()
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            elif response is None:
+                response = Response(entry.data)
+            return _apply_headers(response, entry, ttl, vary_on_user)
+
+        return wrapper
+    return decorator
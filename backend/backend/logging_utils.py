@@ -0,0 +1,131 @@
+# backend/logging_utils.py
+"""
+Logging không chặn request thread + lấy mẫu log chẩn đoán (settings.LOGGING, settings.LOG_SAMPLING).
+
+- AsyncStreamHandler: request thread chỉ đưa record vào hàng đợi; format + ghi stdout
+  chạy ở thread QueueListener. Hàng đợi đầy -> bỏ record (đếm dropped) thay vì chờ.
+- log_sampler.sample(logger): True khi logger bật DEBUG và lượt này được lấy mẫu
+  (LOG_SAMPLING['RATES'][logger.name]); bọc cả khối log chẩn đoán để không format
+  dict/prompt khi không cần:
+
+    verbose = log_sampler.sample(logger)
+    if verbose:
+        logger.debug("Intent scores: %s", intent_scores)
+"""
+
+import copy
+import logging
+import os
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict
+
+
+def get_log_sampling_config() -> Dict[str, Any]:
+    from django.conf import settings
+    config = dict(getattr(settings, 'LOG_SAMPLING', {}))
+    config.setdefault('DEFAULT_RATE', 1.0)
+    config.setdefault('RATES', {})
+    return config
+
+
+class LogSampler:
+    """Tỉ lệ lấy mẫu theo tên logger (khớp tiền tố dài nhất, VD 'ai_models' áp cho 'ai_models.services')"""
+
+    def __init__(self, rates: Dict[str, float] = None, default_rate: float = 1.0):
+        self.rates = dict(rates or {})
+        self.default_rate = default_rate
+        self._resolved: Dict[str, float] = {}
+
+    def rate_for(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = self.default_rate
+            parts = name.split('.')
+            for i in range(len(parts), 0, -1):
+                prefix = '.'.join(parts[:i])
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+            self._resolved[name] = rate
+        return rate
+
+    def sample(self, logger: logging.Logger, level: int = logging.DEBUG) -> bool:
+        if not logger.isEnabledFor(level):
+            return False
+        rate = self.rate_for(logger.name)
+        return rate >= 1.0 or (rate > 0 and random.random() < rate)
+
+
+def _build_log_sampler() -> LogSampler:
+    try:
+        config = get_log_sampling_config()
+    except Exception:
+        # Dùng ngoài Django (benchmark/script) -> ghi hết
+        return LogSampler()
+    return LogSampler(rates=config['RATES'], default_rate=config['DEFAULT_RATE'])
+
+
+# Global sampler
+log_sampler = _build_log_sampler()
+
+
+class AsyncStreamHandler(QueueHandler):
+    """
+    Handler cho LOGGING['handlers']: 'class': 'backend.logging_utils.AsyncStreamHandler'.
+    formatter/level khai báo trong dictConfig được áp cho StreamHandler đích (chạy ở listener thread).
+    """
+
+    def __init__(self, stream=None, max_queue: int = 10000):
+        super().__init__(queue.Queue(max_queue))
+        self.target = logging.StreamHandler(stream)
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._start_listener()
+
+    def _start_listener(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # Sau fork (gunicorn --preload) thread listener của process cha không tồn tại ở process con
+            self.queue = queue.Queue(self.queue.maxsize)
+            self._listener = QueueListener(self.queue, self.target)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        """Chỉ ghép msg % args (giữ giá trị tại thời điểm log); format đầy đủ để listener làm"""
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._start_listener()
+        super().emit(record)
+
+    def flush(self):
+        self.target.flush()
+
+    def close(self):
+        with self._start_lock:
+            listener, self._listener = self._listener, None
+            if listener is not None and self._pid == os.getpid():
+                # stop() ghi nốt các record còn trong hàng đợi rồi mới dừng thread
+                listener.stop()
+        self.target.close()
+        super().close()
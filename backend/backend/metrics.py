@@ -0,0 +1,344 @@
+# backend/metrics.py
+"""
+Metrics dạng Prometheus text cho GET /api/metrics (settings.METRICS).
+
+    http_requests.inc('POST', 'api/chat/', 200)
+    gemini_request_duration.observe(elapsed)
+
+Counter/Histogram ghi vào shard riêng của từng thread (dict thường, không lock trên
+hot path); chỉ lúc scrape mới cộng dồn các shard. Gauge (session, hàng đợi, cache...)
+không ghi trên hot path - đọc từ get_stats() của các component qua collector lúc scrape.
+"""
+
+import bisect
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+DEFAULT_STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+
+
+def get_metrics_config() -> Dict[str, Any]:
+    config = dict(getattr(settings, 'METRICS', {}))
+    config.setdefault('ENABLED', True)
+    config.setdefault('PATHS', ['/api/'])
+    config.setdefault('TOKEN', '')
+    config.setdefault('LATENCY_BUCKETS', DEFAULT_LATENCY_BUCKETS)
+    config.setdefault('STAGE_BUCKETS', DEFAULT_STAGE_BUCKETS)
+    return config
+
+
+class _ThreadShards:
+    """
+    Mỗi thread 1 dict labels -> list[float]; chỉ thread đó ghi nên không cần lock.
+    Shard của thread đã kết thúc được gộp vào _retired (runserver tạo thread mỗi request).
+    """
+
+    COMPACT_EVERY = 64
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: List[Tuple[threading.Thread, Dict[tuple, List[float]]]] = []
+        self._retired: Dict[tuple, List[float]] = {}
+
+    def get(self) -> Dict[tuple, List[float]]:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+                if len(self._shards) % self.COMPACT_EVERY == 0:
+                    self._compact()
+        return shard
+
+    def _compact(self):
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                _merge(self._retired, shard)
+        self._shards = alive
+
+    def collect(self) -> Dict[tuple, List[float]]:
+        with self._lock:
+            self._compact()
+            totals = {key: list(cell) for key, cell in self._retired.items()}
+            shards = [shard for _, shard in self._shards]
+        for shard in shards:
+            # dict.copy()/list() là atomic dưới GIL - thread chủ có thể đang ghi
+            _merge(totals, shard.copy())
+        return totals
+
+
+def _merge(into: Dict[tuple, List[float]], shard: Dict[tuple, List[float]]):
+    for key, cell in shard.items():
+        cell = list(cell)
+        current = into.get(key)
+        if current is None:
+            into[key] = cell
+        else:
+            for i, value in enumerate(cell):
+                current[i] += value
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(labels: Sequence[Tuple[str, Any]]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._shards = _ThreadShards()
+
+    def inc(self, *labelvalues, amount: float = 1.0):
+        shard = self._shards.get()
+        cell = shard.get(labelvalues)
+        if cell is None:
+            shard[labelvalues] = [amount]
+        else:
+            cell[0] += amount
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, cell in sorted(self._shards.collect().items(), key=lambda item: tuple(map(str, item[0]))):
+            lines.append(f'{self.name}{_format_labels(list(zip(self.labelnames, key)))} {_format_value(cell[0])}')
+        return lines
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(float(bound) for bound in buckets))
+        self._shards = _ThreadShards()
+
+    def observe(self, value: float, *labelvalues):
+        shard = self._shards.get()
+        cell = shard.get(labelvalues)
+        if cell is None:
+            # [đếm theo từng bucket (không cộng dồn) ..., +Inf, sum, count]
+            cell = shard[labelvalues] = [0.0] * (len(self.buckets) + 3)
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = []
+        bounds = self.buckets + (float('inf'),)
+        for key, cell in sorted(self._shards.collect().items(), key=lambda item: tuple(map(str, item[0]))):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0.0
+            for bound, count in zip(bounds, cell):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(labels + [("le", _format_value(bound))])} '
+                             f'{_format_value(cumulative)}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(cell[-2])}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {_format_value(cell[-1])}')
+        return lines
+
+
+class MetricsRegistry:
+    """Counter/Histogram đăng ký lúc import + collector trả về gauge lúc scrape"""
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, list]]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, list]]]):
+        """collector() -> [(name, 'gauge'|'counter', help, [(labels dict, value), ...]), ...]"""
+        self._collectors.append(collector)
+        return collector
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                # 1 component lỗi không làm hỏng cả lần scrape
+                logger.warning(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    lines.append(f'{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _build_registry() -> MetricsRegistry:
+    return MetricsRegistry()
+
+
+# Global registry
+registry = _build_registry()
+
+_config = get_metrics_config()
+
+http_requests = registry.counter(
+    'bdu_http_requests_total', 'API requests by route and status', ('method', 'route', 'status'))
+http_request_duration = registry.histogram(
+    'bdu_http_request_duration_seconds', 'API request latency by route', ('method', 'route'),
+    buckets=_config['LATENCY_BUCKETS'])
+chat_responses = registry.counter(
+    'bdu_chat_responses_total', 'Chat answers by decision type and answer method', ('decision_type', 'method'))
+chat_response_duration = registry.histogram(
+    'bdu_chat_response_duration_seconds', 'Chat pipeline latency by decision type', ('decision_type',),
+    buckets=_config['LATENCY_BUCKETS'])
+stage_duration = registry.histogram(
+    'bdu_stage_duration_seconds', 'Time per pipeline stage per request (from tracing spans: encode, faiss, llm...)',
+    ('stage',), buckets=_config['STAGE_BUCKETS'])
+gemini_requests = registry.counter(
+    'bdu_gemini_requests_total', 'Gemini generateContent calls by outcome', ('outcome',))
+gemini_request_duration = registry.histogram(
+    'bdu_gemini_request_duration_seconds', 'Gemini generateContent HTTP latency',
+    buckets=_config['LATENCY_BUCKETS'])
+
+
+def observe_trace(trace):
+    """Span của 1 request -> bdu_stage_duration_seconds"""
+    for name, seconds in trace.stage_totals().items():
+        stage_duration.observe(seconds, name)
+
+
+def _cache_samples(caches: Dict[str, Callable[[], Optional[Dict[str, Any]]]]):
+    """Các cache dùng chung 1 metric family -> mỗi cache tự bắt lỗi, cache lỗi chỉ mất sample của nó"""
+    hits, misses, ratios, entries = [], [], [], []
+    for name, get_stats in caches.items():
+        try:
+            stats = get_stats()
+        except Exception as e:
+            logger.warning(f"Metrics: cache stats for {name} failed: {e}")
+            continue
+        if not stats:
+            continue
+        labels = {'cache': name}
+        lookups = stats.get('hits', 0) + stats.get('misses', 0)
+        hits.append((labels, stats.get('hits', 0)))
+        misses.append((labels, stats.get('misses', 0)))
+        ratios.append((labels, stats['hits'] / lookups if lookups else 0.0))
+        entries.append((labels, stats.get('entries')))
+    return [
+        ('bdu_cache_hits_total', 'counter', 'Cache hits', hits),
+        ('bdu_cache_misses_total', 'counter', 'Cache misses', misses),
+        ('bdu_cache_hit_ratio', 'gauge', 'Cache hit ratio since process start', ratios),
+        ('bdu_cache_entries', 'gauge', 'Entries currently cached', entries),
+    ]
+
+
+# ✅ CHANGED: Mỗi component 1 collector (import muộn - tránh vòng import lúc khởi động):
+# get_stats() của 1 component lỗi (VD Whisper đang load) chỉ làm mất metric family của nó
+
+@registry.register_collector
+def collect_session_metrics():
+    from ai_models.services import chatbot_ai
+    sessions = chatbot_ai.memory.get_stats()
+    return [
+        ('bdu_active_sessions', 'gauge', 'Conversation sessions held in memory',
+         [({}, sessions.get('active_sessions'))]),
+    ]
+
+
+@registry.register_collector
+def collect_llm_limiter_metrics():
+    from ai_models.llm_limiter import llm_limiter
+    limiter = llm_limiter.get_stats()
+    return [
+        ('bdu_gemini_breaker_open', 'gauge', '1 while Gemini calls are paused after a 429 (rate-limit backoff)',
+         [({}, 1 if limiter['paused_for'] > 0 else 0)]),
+        ('bdu_gemini_paused_seconds', 'gauge', 'Seconds left before Gemini calls resume',
+         [({}, limiter['paused_for'])]),
+        ('bdu_gemini_rate_limited_total', 'counter', 'Gemini 429 responses',
+         [({}, limiter['rate_limited'])]),
+        ('bdu_llm_queue_length', 'gauge', 'Requests waiting for a Gemini slot', [({}, limiter['queue_length'])]),
+        ('bdu_llm_in_flight', 'gauge', 'Gemini calls in progress', [({}, limiter['in_flight'])]),
+    ]
+
+
+@registry.register_collector
+def collect_whisper_metrics():
+    from ai_models.speech_service import speech_service
+    speech = speech_service.get_queue_stats()
+    return [
+        ('bdu_whisper_queue_depth', 'gauge', 'Transcriptions waiting or running',
+         [({}, speech['queue_depth'])]),
+        ('bdu_whisper_available', 'gauge', '1 if the Whisper model is loaded',
+         [({}, 1 if speech_service.is_available() else 0)]),
+    ]
+
+
+@registry.register_collector
+def collect_admission_metrics():
+    from .admission import admission_controller
+    return [
+        ('bdu_chat_in_flight', 'gauge', 'Chat requests admitted and in progress',
+         [({}, admission_controller.get_stats()['in_flight'])]),
+    ]
+
+
+@registry.register_collector
+def collect_cache_metrics():
+    from ai_models.answer_cache import recent_answers
+    from ai_models.topics import match_topics
+    from authentication.authentication import token_cache
+    from authentication.context_cache import faculty_context_cache
+    from .http_cache import response_cache
+
+    def topic_stats():
+        topics = match_topics.cache_info()
+        return {'hits': topics.hits, 'misses': topics.misses, 'entries': topics.currsize}
+
+    return _cache_samples({
+        'http_response': response_cache.get_stats,
+        'token_auth': token_cache.get_stats,
+        'faculty_context': faculty_context_cache.get_stats,
+        'recent_answers': recent_answers.get_stats,
+        'topics': topic_stats,
+    })
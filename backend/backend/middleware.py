@@ -1,6 +1,14 @@
+import cProfile
 import re
+import time
 from django.utils.deprecation import MiddlewareMixin
 from django.conf import settings
+from django.http import JsonResponse
+
+from .admission import DEGRADE, REJECT, admission_controller, get_admission_config
+from .metrics import get_metrics_config, http_request_duration, http_requests, observe_trace
+from .profiling import get_profiling_config, request_profiler
+from .tracing import current_trace, end_trace, get_tracing_config, slow_request_recorder, start_trace
 
 class CSRFExemptMiddleware(MiddlewareMixin):
     """
@@ -27,4 +35,145 @@ class CSRFExemptMiddleware(MiddlewareMixin):
                 setattr(request, '_dont_enforce_csrf_checks', True)
                 break
         
-        return None
\ No newline at end of file
+        return None
+
+class AdmissionControlMiddleware:
+    """
+    Load shedding cho POST chat (backend/admission.py):
+    quá tải nhẹ -> request.load_shed = True (ChatView / ChatBatchView bỏ Gemini), quá tải nặng -> 503 + Retry-After
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = get_admission_config()
+        self.enabled = config['ENABLED']
+        self.paths = set(config['PATHS'])
+        self.latency_paths = set(config['LATENCY_PATHS'])
+
+    def __call__(self, request):
+        if not self.enabled or request.method != 'POST' or request.path not in self.paths:
+            return self.get_response(request)
+
+        decision = admission_controller.try_admit()
+        if decision == REJECT:
+            retry_after = admission_controller.get_retry_after()
+            response = JsonResponse({
+                'error': 'Hệ thống đang quá tải, vui lòng thử lại sau ít phút',
+                'status': 'overloaded',
+                'retry_after': retry_after,
+            }, status=503, json_dumps_params={'ensure_ascii': False})
+            response['Retry-After'] = str(retry_after)
+            return response
+
+        request.load_shed = decision == DEGRADE
+        start = time.monotonic()
+        try:
+            return self.get_response(request)
+        finally:
+            admission_controller.release(time.monotonic() - start, request.path in self.latency_paths)
+
+
+class MetricsMiddleware:
+    """Đếm request + latency theo route (backend/metrics.py); span của request -> histogram theo stage"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = get_metrics_config()
+        self.enabled = config['ENABLED']
+        self.paths = tuple(config['PATHS'])
+
+    def __call__(self, request):
+        if not self.enabled or not request.path.startswith(self.paths):
+            return self.get_response(request)
+
+        start = time.monotonic()
+        response = self.get_response(request)
+        elapsed = time.monotonic() - start
+
+        # Dùng route pattern (VD 'api/history/<str:session_id>/') thay vì path để giới hạn số label
+        resolver_match = getattr(request, 'resolver_match', None)
+        route = resolver_match.route if resolver_match is not None else 'unmatched'
+        http_requests.inc(request.method, route, response.status_code)
+        http_request_duration.observe(elapsed, request.method, route)
+
+        trace = getattr(request, 'trace', None)
+        if trace is not None:
+            observe_trace(trace)
+        return response
+
+class TracingMiddleware:
+    """Mở trace cho request API (backend/tracing.py), trả header Server-Timing, ghi lại request chậm"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = get_tracing_config()
+        self.enabled = config['ENABLED']
+        self.paths = tuple(config['PATHS'])
+
+    def __call__(self, request):
+        if not self.enabled or not request.path.startswith(self.paths):
+            return self.get_response(request)
+
+        trace, tokens = start_trace('request', method=request.method, path=request.path)
+        request.trace = trace
+        try:
+            response = self.get_response(request)
+        finally:
+            end_trace(trace, tokens)
+
+        response['Server-Timing'] = trace.server_timing()
+        slow_request_recorder.maybe_record(
+            trace, method=request.method, path=request.path, status=response.status_code
+        )
+        return response
+
+class ProfilingMiddleware:
+    """
+    cProfile cả request khi staff yêu cầu (X-Profile / ?profile=1) hoặc được lấy mẫu (backend/profiling.py).
+    Đặt sau TracingMiddleware để gắn query, decision_type và timings của trace vào profile.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = get_profiling_config()
+        self.enabled = config['ENABLED']
+        self.paths = tuple(config['PATHS'])
+
+    def __call__(self, request):
+        if not self.enabled or not request.path.startswith(self.paths):
+            return self.get_response(request)
+
+        trigger = request_profiler.trigger(request)
+        if trigger is None or not request_profiler.acquire():
+            return self.get_response(request)
+
+        try:
+            profile = cProfile.Profile()
+            start = time.perf_counter()
+            profile.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profile.disable()
+            duration_ms = round((time.perf_counter() - start) * 1000, 2)
+
+            trace = current_trace()
+            root_attrs = trace.root.attrs if trace is not None else {}
+            user = getattr(request, 'user', None)
+            profile_id = request_profiler.save(profile, {
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'trigger': trigger,
+                'user': user.get_username() if user is not None and user.is_authenticated else None,
+                'query': root_attrs.get('query'),
+                'decision_type': root_attrs.get('decision_type'),
+                'duration_ms': duration_ms,
+                'timings': trace.timings() if trace is not None else {},
+            })
+        finally:
+            request_profiler.release()
+
+        if profile_id:
+            response['X-Profile-Id'] = profile_id
+        return response
@@ -0,0 +1,182 @@
+# backend/profiling.py
+"""
+Profile cProfile theo yêu cầu cho request chat (settings.PROFILING).
+
+Bật cho 1 request:
+- staff gửi header X-Profile: 1 hoặc query ?profile=1
+- hoặc lấy mẫu ngẫu nhiên SAMPLE_RATE phần lưu lượng (mặc định 0 - tắt)
+
+Mỗi profile ghi 2 file trong DIR: <id>.prof (pstats, mở bằng snakeviz / python -m pstats)
+và <id>.json (query, decision_type, timings từ tracing, top hàm theo cumtime).
+Mỗi process chỉ profile 1 request tại một thời điểm (cProfile 3.12+ không cho chạy song song);
+code chạy ở thread khác (ThreadPool của batch, singleflight leader) không nằm trong profile.
+"""
+
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ID_RE = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9a-f]{8}$')
+
+
+def get_profiling_config() -> Dict[str, Any]:
+    config = dict(getattr(settings, 'PROFILING', {}))
+    config.setdefault('ENABLED', True)
+    config.setdefault('PATHS', ['/api/chat/'])
+    config.setdefault('HEADER', 'X-Profile')
+    config.setdefault('QUERY_PARAM', 'profile')
+    config.setdefault('SAMPLE_RATE', 0.0)
+    config.setdefault('DIR', Path(settings.BASE_DIR) / 'profiles')
+    config.setdefault('MAX_PROFILES', 200)
+    config.setdefault('TOP_FUNCTIONS', 30)
+    return config
+
+
+def _is_staff(request) -> bool:
+    """Session user (AuthenticationMiddleware) hoặc token - DRF chưa xác thực ở tầng middleware"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    try:
+        from authentication.authentication import CachedTokenAuthentication
+        result = CachedTokenAuthentication().authenticate(request)
+    except Exception:
+        return False
+    return bool(result) and result[0].is_staff
+
+
+class RequestProfiler:
+    """Quyết định profile request nào, chạy cProfile và lưu kết quả"""
+
+    def __init__(self, directory, sample_rate: float = 0.0, max_profiles: int = 200, top_functions: int = 30,
+                 header: str = 'X-Profile', query_param: str = 'profile'):
+        self.directory = Path(directory)
+        self.sample_rate = sample_rate
+        self.max_profiles = max_profiles
+        self.top_functions = top_functions
+        self.header_key = 'HTTP_' + header.upper().replace('-', '_')
+        self.query_param = query_param
+        self._busy = threading.Lock()
+        self.stats = {'profiled': 0, 'skipped_busy': 0, 'errors': 0}
+
+    def trigger(self, request) -> Optional[str]:
+        """'header' / 'query' / 'sample' hoặc None (không profile)"""
+        if request.META.get(self.header_key, '').lower() in ('1', 'true', 'yes'):
+            return 'header' if _is_staff(request) else None
+        if request.GET.get(self.query_param, '').lower() in ('1', 'true', 'yes'):
+            return 'query' if _is_staff(request) else None
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def acquire(self) -> bool:
+        if self._busy.acquire(blocking=False):
+            return True
+        self.stats['skipped_busy'] += 1
+        return False
+
+    def release(self):
+        self._busy.release()
+
+    def save(self, profile: cProfile.Profile, info: Dict[str, Any]) -> Optional[str]:
+        now = timezone.localtime()
+        profile_id = f"{now.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            profile.dump_stats(str(self.directory / f'{profile_id}.prof'))
+            metadata = {
+                'id': profile_id,
+                'created_at': now.isoformat(),
+                **info,
+                'top_functions': self._top_functions(profile),
+            }
+            with open(self.directory / f'{profile_id}.json', 'w', encoding='utf-8') as f:
+                json.dump(metadata, f, ensure_ascii=False, indent=2, default=str)
+            self.stats['profiled'] += 1
+            self._prune()
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Could not save request profile: {e}")
+            return None
+        logger.info(f"🔬 Profile {profile_id} saved ({info.get('path')}, {info.get('duration_ms')}ms)")
+        return profile_id
+
+    def _top_functions(self, profile: cProfile.Profile) -> List[Dict[str, Any]]:
+        stats = pstats.Stats(profile, stream=io.StringIO())
+        rows = []
+        for (filename, line, name), (cc, ncalls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                'function': f'{os.path.basename(filename)}:{line}({name})',
+                'ncalls': ncalls,
+                'tottime_ms': round(tottime * 1000, 3),
+                'cumtime_ms': round(cumtime * 1000, 3),
+            })
+        rows.sort(key=lambda row: row['cumtime_ms'], reverse=True)
+        return rows[:self.top_functions]
+
+    def _prune(self):
+        """Giữ MAX_PROFILES profile mới nhất (id bắt đầu bằng timestamp -> sort theo tên)"""
+        metadata_files = sorted(self.directory.glob('*.json'), reverse=True)
+        for path in metadata_files[self.max_profiles:]:
+            path.unlink(missing_ok=True)
+            path.with_suffix('.prof').unlink(missing_ok=True)
+
+    def list_profiles(self, limit: int = 50) -> List[Dict[str, Any]]:
+        if not self.directory.exists():
+            return []
+        profiles = []
+        for path in sorted(self.directory.glob('*.json'), reverse=True)[:limit]:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    metadata = json.load(f)
+            except (OSError, ValueError):
+                continue
+            metadata.pop('top_functions', None)
+            profiles.append(metadata)
+        return profiles
+
+    def get_profile(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        if not PROFILE_ID_RE.match(profile_id or ''):
+            return None
+        path = self.directory / f'{profile_id}.json'
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def profile_path(self, profile_id: str) -> Optional[Path]:
+        if not PROFILE_ID_RE.match(profile_id or ''):
+            return None
+        path = self.directory / f'{profile_id}.prof'
+        return path if path.exists() else None
+
+
+def _build_request_profiler() -> RequestProfiler:
+    config = get_profiling_config()
+    return RequestProfiler(
+        directory=config['DIR'],
+        sample_rate=config['SAMPLE_RATE'],
+        max_profiles=config['MAX_PROFILES'],
+        top_functions=config['TOP_FUNCTIONS'],
+        header=config['HEADER'],
+        query_param=config['QUERY_PARAM'],
+    )
+
+
+# Global profiler
+request_profiler = _build_request_profiler()
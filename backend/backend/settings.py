@@ -77,6 +77,10 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'backend.middleware.CSRFExemptMiddleware',
+    'backend.middleware.MetricsMiddleware',  # ✅ THÊM: số liệu cho /api/metrics
+    'backend.middleware.TracingMiddleware',  # ✅ THÊM: span từng stage + Server-Timing
+    'backend.middleware.ProfilingMiddleware',  # ✅ THÊM: cProfile theo yêu cầu (staff) / lấy mẫu
+    'backend.middleware.AdmissionControlMiddleware',  # ✅ THÊM: load shedding cho /api/chat/
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -107,15 +111,14 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # CẤU HÌNH DATABASE
 # =============================================================================
 
-# Mặc định: SQLite cho development (dễ setup)
+# ✅ CHANGED: Chọn profile qua DB_PROFILE (xem backend/db_profiles.py)
+#   sqlite (mặc định): WAL + synchronous=NORMAL + mmap/cache, CONN_MAX_AGE
+#   sqlite-basic: cấu hình cũ  |  postgres: POSTGRES_DB/USER/PASSWORD/HOST/PORT
+from .db_profiles import build_database_settings
+
+DB_PROFILE = os.getenv('DB_PROFILE', 'sqlite')
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-        'OPTIONS': {
-            'timeout': 20,
-        }
-    }
+    'default': build_database_settings(BASE_DIR, DB_PROFILE)
 }
 
 # =============================================================================
@@ -184,8 +187,10 @@ SESSION_SAVE_EVERY_REQUEST = False
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        # Giữ thứ tự cũ: class đầu tiên quyết định 401/403 + WWW-Authenticate khi chưa đăng nhập
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        # ✅ CHANGED: TokenAuthentication + cache (user, token) theo token key
+        'authentication.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -200,6 +205,9 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # ✅ THÊM: Số reverse proxy tin cậy phía trước (ngrok/nginx) - chỉ khi > 0 mới đọc X-Forwarded-For
+    # (get_client_ip, throttle theo IP). Chạy trực tiếp không qua proxy: để 0.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 0)),
 }
 
 # =============================================================================
@@ -288,9 +296,11 @@ LOGGING = {
     'handlers': {
         'console': {
             'level': 'DEBUG' if DEBUG else 'INFO',
-            'class': 'logging.StreamHandler',
+            # ✅ CHANGED: Ghi stdout ở thread riêng (QueueListener) - request thread không chờ I/O console
+            'class': 'backend.logging_utils.AsyncStreamHandler',
             'formatter': 'console_safe',  # Dùng formatter an toàn
             'stream': sys.stdout,
+            'max_queue': 10000,  # đầy -> bỏ record thay vì chặn request
         },
     },
     'loggers': {
@@ -306,17 +316,30 @@ LOGGING = {
         },
         'chat': {
             'handlers': ['console'],
-            'level': 'INFO',
+            'level': os.getenv('LOG_LEVEL_CHAT', 'INFO'),  # DEBUG -> log chẩn đoán (lấy mẫu theo LOG_SAMPLING)
             'propagate': True,
         },
         'ai_models': {
             'handlers': ['console'],
-            'level': 'INFO',
+            'level': os.getenv('LOG_LEVEL_AI_MODELS', 'INFO'),
             'propagate': True,
         },
     },
 }
 
+# ✅ THÊM: Lấy mẫu log chẩn đoán DEBUG theo logger (backend/logging_utils.py: log_sampler.sample)
+# Chỉ có tác dụng khi logger bật DEBUG (LOG_LEVEL_AI_MODELS / LOG_LEVEL_CHAT=DEBUG); 0.1 = ghi chi tiết cho ~10% request
+LOG_SAMPLING = {
+    'DEFAULT_RATE': 1.0,
+    'RATES': {
+        'ai_models.phobert_service': float(os.getenv('LOG_SAMPLE_INTENT', 0.1)),
+        'ai_models.gemini_service': float(os.getenv('LOG_SAMPLE_GEMINI', 0.1)),
+        'ai_models.vietnamese_normalizer': float(os.getenv('LOG_SAMPLE_NORMALIZER', 0.1)),
+        'ai_models.services': float(os.getenv('LOG_SAMPLE_DECISION', 0.1)),
+        'chat.views': float(os.getenv('LOG_SAMPLE_CHAT', 0.1)),
+    },
+}
+
 # Đảm bảo các thư mục cần thiết tồn tại
 os.makedirs(BASE_DIR / 'static', exist_ok=True)
 os.makedirs(BASE_DIR / 'media', exist_ok=True)
@@ -327,6 +350,8 @@ os.makedirs(BASE_DIR / 'media', exist_ok=True)
 
 # Cấu hình Gemini API
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+# ✅ THÊM: Base URL của Gemini API - đặt http://127.0.0.1:8765/v1beta để dùng stub server (ai_models/gemini_stub_server.py)
+GEMINI_API_BASE_URL = os.getenv('GEMINI_API_BASE_URL', 'https://generativelanguage.googleapis.com/v1beta')
 
 # Cấu hình Speech-to-text
 SPEECH_RECOGNITION_ENABLED = os.getenv('SPEECH_RECOGNITION_ENABLED', 'True').lower() in ['true', '1', 'yes']
@@ -336,6 +361,196 @@ WHISPER_MODEL_SIZE = os.getenv('WHISPER_MODEL_SIZE', 'base')
 MAX_CHAT_HISTORY = int(os.getenv('MAX_CHAT_HISTORY', 50))
 CHAT_RESPONSE_TIMEOUT = int(os.getenv('CHAT_RESPONSE_TIMEOUT', 30))
 
+# ✅ THÊM: Deadline cho pipeline chat (budget = CHAT_RESPONSE_TIMEOUT - SAFETY_MARGIN)
+CHAT_DEADLINE = {
+    'SAFETY_MARGIN': int(os.getenv('CHAT_DEADLINE_SAFETY_MARGIN', 3)),  # giây - dành cho lưu DB, serialize, mạng
+    'STAGE_MIN_BUDGET': {
+        'intent': 0.5,  # PhoBERT
+        'llm': 3.0,     # Gemini - ít hơn thì trả luôn câu trả lời CSDL
+    },
+}
+
+# Token budget cho prompt Gemini (ước lượng ~3 ký tự/token)
+PROMPT_TOKEN_BUDGET = {
+    'HISTORY_TOKENS': int(os.getenv('PROMPT_HISTORY_TOKENS', 250)),      # Dòng chảy hội thoại
+    'REFERENCE_TOKENS': int(os.getenv('PROMPT_REFERENCE_TOKENS', 600)),  # Dữ liệu tham khảo từ CSDL
+    'STATS_LOG_EVERY': 100,  # Log tổng hợp kích thước prompt sau mỗi N lần gọi
+}
+
+# Single-flight: gộp các request Gemini giống hệt nhau đang chạy song song
+GEMINI_SINGLE_FLIGHT = {
+    'ENABLED': os.getenv('GEMINI_SINGLE_FLIGHT_ENABLED', 'True').lower() in ['true', '1', 'yes'],
+    'WAIT_TIMEOUT': 25,  # giây - request trùng chờ tối đa (> timeout 20s của Gemini)
+    # Thư mục lock file dùng chung giữa các worker (None = chỉ gộp trong cùng worker)
+    'SHARED_DIR': os.getenv('GEMINI_SINGLE_FLIGHT_DIR') or None,
+    'SHARED_RESULT_TTL': 15,  # giây - worker đến sau vẫn dùng lại kết quả vừa có
+}
+
+# Giới hạn lời gọi Gemini: token bucket + concurrency + hàng đợi ưu tiên
+# (giảng viên > ẩn danh > batch/test)
+GEMINI_RATE_LIMIT = {
+    'MAX_CONCURRENCY': int(os.getenv('GEMINI_MAX_CONCURRENCY', 4)),
+    'REQUESTS_PER_MINUTE': int(os.getenv('GEMINI_REQUESTS_PER_MINUTE', 60)),
+    'BURST': int(os.getenv('GEMINI_BURST', 10)),
+    'QUEUE_TIMEOUT': int(os.getenv('GEMINI_QUEUE_TIMEOUT', 8)),  # giây - quá hạn thì fallback câu trả lời CSDL
+    'MAX_QUEUE': 50,
+    'RATE_LIMIT_BACKOFF': 10,  # giây - tạm dừng khi nhận 429 không có Retry-After
+}
+
+# ✅ THÊM: Bộ nhớ hội thoại theo session (LRU + idle TTL)
+# IDLE_TTL mặc định = CHATBOT_PERSONALIZATION['FACULTY_SESSION_TIMEOUT']
+SESSION_MEMORY = {
+    'MAX_SESSIONS': int(os.getenv('SESSION_MEMORY_MAX_SESSIONS', 5000)),
+    'MAX_HISTORY': 10,  # số lượt giữ lại cho mỗi session
+    # Backend dùng chung giữa các worker: local (chỉ trong process) | sqlite | redis
+    'BACKEND': os.getenv('SESSION_MEMORY_BACKEND', 'local'),
+    'SQLITE_PATH': os.getenv('SESSION_MEMORY_SQLITE_PATH', str(BASE_DIR / 'session_memory.sqlite3')),
+    'REDIS_URL': os.getenv('SESSION_MEMORY_REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    'FLUSH_INTERVAL': 1.0,      # giây - write-behind xuống backend
+    'REVALIDATE_AFTER': 2.0,    # giây - đối chiếu lại session nóng với backend
+    'LOAD_FROM_CHAT_HISTORY': True,  # session lạnh -> dựng lại từ ChatHistory
+}
+
+# Cấu hình batch chat (/api/chat/batch/, HybridChatbotAI.process_batch)
+CHAT_BATCH = {
+    'MAX_ITEMS': int(os.getenv('CHAT_BATCH_MAX_ITEMS', 100)),  # câu hỏi tối đa mỗi request
+    'MAX_CONCURRENCY': int(os.getenv('CHAT_BATCH_CONCURRENCY', 4)),  # câu sinh câu trả lời song song
+    'ITEM_TIMEOUT': 60,         # giây - deadline cho mỗi câu (không bị giới hạn bởi timeout của frontend)
+    'ENCODE_BATCH_SIZE': 64,    # SBERT encode batch size
+}
+
+# Cache xác thực token (authentication.authentication.CachedTokenAuthentication)
+# Logout/đổi mật khẩu/khoá tài khoản: bỏ entry trong process + ghi dấu thu hồi vào
+# CACHES[REVOCATION_CACHE], mỗi lần hit đều kiểm tra dấu này.
+# Trade-off: CACHES chưa cấu hình = LocMemCache (mỗi process 1 bản) -> worker khác vẫn
+# chấp nhận token đã thu hồi tối đa TTL giây, nên TTL mặc định chỉ 5s (vẫn bỏ phần lớn
+# query khi frontend gửi nhiều request liên tiếp). CACHES dùng chung (Redis/Memcached)
+# thì thu hồi có hiệu lực ngay ở mọi worker và có thể tăng TTL.
+TOKEN_AUTH_CACHE = {
+    'ENABLED': os.getenv('TOKEN_AUTH_CACHE', 'True').lower() == 'true',
+    'TTL': int(os.getenv('TOKEN_AUTH_CACHE_TTL', 5)),  # giây
+    'MAX_ENTRIES': 5000,
+    'REVOCATION_CACHE': os.getenv('TOKEN_AUTH_REVOCATION_CACHE', 'default'),  # alias trong CACHES, '' = tắt
+}
+
+# Cache response cho các endpoint GET đọc nhiều (backend/http_cache.py) - hỗ trợ ETag/304
+HTTP_CACHE = {
+    'ENABLED': os.getenv('HTTP_CACHE_ENABLED', 'True').lower() == 'true',
+    'MAX_ENTRIES': 1000,
+    'DEFAULT_TTL': 60,
+    'TTLS': {  # giây, theo tên endpoint
+        'api_root': 30,
+        'chat_info': 30,
+        'speech_info': 60,
+        'speech_status': 60,
+        'ai_speech_status': 60,
+        'knowledge_categories': 300,
+        'personalized_context': 300,
+        'department_suggestions': 600,
+    },
+}
+
+# Token-bucket throttle (backend/throttling.py) - 429 + Retry-After khi hết token
+# RATE = tốc độ nạp lại, BURST = dung lượng bucket. Ngân sách chat theo IP giữ dưới
+# GEMINI_RATE_LIMIT['REQUESTS_PER_MINUTE'] để 1 client (hoặc URL ngrok công khai) không chiếm hết quota
+API_THROTTLE = {
+    'ENABLED': os.getenv('API_THROTTLE_ENABLED', 'True').lower() == 'true',
+    # local: mỗi worker 1 ngân sách riêng | redis: dùng chung giữa các worker
+    'BACKEND': os.getenv('API_THROTTLE_BACKEND', 'local'),
+    'REDIS_URL': os.getenv('API_THROTTLE_REDIS_URL', 'redis://127.0.0.1:6379/2'),
+    'SCOPES': {
+        'chat': {
+            'USER': os.getenv('THROTTLE_CHAT_USER', '20/min'), 'USER_BURST': 5,
+            'IP': os.getenv('THROTTLE_CHAT_IP', '30/min'), 'IP_BURST': 10,
+        },
+        # /api/chat/batch/: mỗi câu hỏi trong batch tính 1 token (burst >= CHAT_BATCH['MAX_ITEMS'])
+        'chat_batch': {
+            'USER': os.getenv('THROTTLE_CHAT_BATCH_USER', '200/hour'), 'USER_BURST': 100,
+            'IP': os.getenv('THROTTLE_CHAT_BATCH_IP', '300/hour'), 'IP_BURST': 100,
+        },
+        'speech': {
+            'USER': os.getenv('THROTTLE_SPEECH_USER', '6/min'), 'USER_BURST': 3,
+            'IP': os.getenv('THROTTLE_SPEECH_IP', '10/min'), 'IP_BURST': 4,
+        },
+        'auth': {
+            'USER': None,  # đăng nhập chưa có user - chỉ giới hạn theo IP
+            'IP': os.getenv('THROTTLE_AUTH_IP', '10/min'), 'IP_BURST': 5,
+        },
+    },
+}
+
+# Admission control cho POST /api/chat/ + /api/chat/batch/ (backend/admission.py) - số liệu theo từng worker
+ADMISSION_CONTROL = {
+    'ENABLED': os.getenv('ADMISSION_CONTROL_ENABLED', 'True').lower() == 'true',
+    'PATHS': ['/api/chat/', '/api/chat/batch/'],
+    # Chỉ latency của các path này vào p95 (1 batch chạy hàng phút sẽ kéo p95 lên, degrade cả chat thường)
+    'LATENCY_PATHS': ['/api/chat/'],
+    'DEGRADE_IN_FLIGHT': int(os.getenv('ADMISSION_DEGRADE_IN_FLIGHT', 8)),  # >= N request đang chạy -> bỏ Gemini
+    'DEGRADE_P95': float(os.getenv('ADMISSION_DEGRADE_P95', 15.0)),  # giây - p95 gần đây vượt -> bỏ Gemini
+    'REJECT_IN_FLIGHT': int(os.getenv('ADMISSION_REJECT_IN_FLIGHT', 16)),  # >= N -> 503 + Retry-After
+    'LATENCY_WINDOW': 60.0,     # giây - chỉ tính latency trong cửa sổ này
+    'LATENCY_SAMPLES': 200,
+    'MIN_SAMPLES': 20,          # ít mẫu hơn thì bỏ qua điều kiện p95
+    'RETRY_AFTER': 5,           # giây - tối thiểu
+    'ANSWER_CACHE_TTL': 600,    # giây - câu trả lời Gemini gần đây dùng khi bị degrade
+    'ANSWER_CACHE_SIZE': 2000,
+}
+
+# Tracing từng stage của pipeline chat (backend/tracing.py) - header Server-Timing, ?debug=timings
+TRACING = {
+    'ENABLED': os.getenv('TRACING_ENABLED', 'True').lower() == 'true',
+    'PATHS': ['/api/'],
+    'SLOW_THRESHOLD': float(os.getenv('TRACING_SLOW_THRESHOLD', 5.0)),  # giây - giữ trace đầy đủ cho request chậm hơn
+    'MAX_SLOW_TRACES': 50,
+}
+
+# Profile cProfile theo request (backend/profiling.py) - danh sách tại /api/debug/profiles/ (staff)
+PROFILING = {
+    'ENABLED': os.getenv('PROFILING_ENABLED', 'True').lower() == 'true',
+    'PATHS': ['/api/chat/'],
+    'HEADER': 'X-Profile',      # staff gửi X-Profile: 1
+    'QUERY_PARAM': 'profile',   # hoặc ?profile=1
+    'SAMPLE_RATE': float(os.getenv('PROFILING_SAMPLE_RATE', 0.0)),  # 0.01 = profile ~1% request
+    'DIR': Path(os.getenv('PROFILING_DIR', BASE_DIR / 'profiles')),
+    'MAX_PROFILES': 200,        # giữ N profile mới nhất
+    'TOP_FUNCTIONS': 30,        # số hàm (theo cumtime) ghi kèm metadata
+}
+
+# Metrics Prometheus tại GET /api/metrics (backend/metrics.py) - số liệu theo từng worker
+METRICS = {
+    'ENABLED': os.getenv('METRICS_ENABLED', 'True').lower() == 'true',
+    'PATHS': ['/api/'],
+    # Bearer token cho Prometheus (Authorization: Bearer <token>); để trống -> chỉ staff (hoặc ai cũng xem khi DEBUG)
+    'TOKEN': os.getenv('METRICS_TOKEN', ''),
+    'LATENCY_BUCKETS': (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0),  # giây
+    'STAGE_BUCKETS': (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0),
+}
+
+# Cấu hình Health check - probe chạy nền, endpoint chỉ đọc cache
+HEALTH_CHECK = {
+    'REFRESH_INTERVAL': int(os.getenv('HEALTH_REFRESH_INTERVAL', 60)),  # giây
+    'STALE_AFTER': int(os.getenv('HEALTH_STALE_AFTER', 180)),  # snapshot quá cũ -> not ready
+}
+
+# Cấu hình ghi ChatHistory - write-behind buffer, bulk_create theo batch
+CHAT_HISTORY_WRITER = {
+    'ENABLED': os.getenv('CHAT_HISTORY_WRITE_BEHIND', 'True').lower() == 'true',
+    'MAX_BATCH': int(os.getenv('CHAT_HISTORY_MAX_BATCH', 50)),  # record mỗi lần bulk_create
+    'FLUSH_INTERVAL': float(os.getenv('CHAT_HISTORY_FLUSH_INTERVAL', 1.0)),  # giây
+    'MAX_BUFFER': 5000,     # buffer đầy -> bỏ record mới (không chặn request)
+    'MAX_BACKOFF': 30.0,    # giây - lùi tối đa khi DB bị lock
+    # /api/feedback/ cho chat_id chưa có trong DB (còn trong buffer của worker khác):
+    # chờ tối đa FEEDBACK_WAIT giây rồi trả 409 + Retry-After để client gửi lại
+    'FEEDBACK_WAIT': float(os.getenv('CHAT_HISTORY_FEEDBACK_WAIT', 1.0)),
+}
+
+# Lưu trữ ChatHistory cũ ra file JSONL.gz theo ngày (manage.py archive_chat_history)
+CHAT_HISTORY_ARCHIVE = {
+    'DIR': os.getenv('CHAT_ARCHIVE_DIR', str(BASE_DIR / 'data' / 'chat_archive')),
+    'RETENTION_DAYS': int(os.getenv('CHAT_ARCHIVE_RETENTION_DAYS', 90)),  # giữ trong DB N ngày gần nhất
+    'BATCH_SIZE': 5000,
+}
+
 # =============================================================================
 # 🎯 CẤU HÌNH PERSONALIZATION CHO FACULTY
 # =============================================================================
@@ -455,24 +670,22 @@ RESPONSE_STYLES = {
 }
 
 # ✅ CẬP NHẬT: Logging configuration cho personalization
+# ✅ CHANGED: Không gắn thêm handler cho logger con - record đã propagate lên handler 'console'
+# của logger cha ('authentication', 'ai_models', 'django'), gắn thêm sẽ ghi mỗi dòng 2 lần
 LOGGING['loggers'].update({
     'authentication.models': {
-        'handlers': ['console'],
         'level': 'INFO',
         'propagate': True,
     },
     'authentication.views': {
-        'handlers': ['console'],
         'level': 'INFO',
         'propagate': True,
     },
     'ai_models.gemini_service': {
-        'handlers': ['console'],
-        'level': 'INFO',
+        'level': os.getenv('LOG_LEVEL_AI_MODELS', 'INFO'),
         'propagate': True,
     },
     'django.security': {
-        'handlers': ['console'],
         'level': 'DEBUG',
         'propagate': True,
     },
@@ -488,4 +701,5 @@ PERSONALIZATION_CACHE = {
     'FACULTY_CONTEXT_TIMEOUT': 1800,  # 30 minutes
     'DEPARTMENT_KEYWORDS_TIMEOUT': 3600,  # 1 hour
     'SYSTEM_PROMPT_TIMEOUT': 1800,  # 30 minutes
+    'MAX_ENTRIES': 2000,  # số faculty giữ context trong mỗi process (LRU)
 }
\ No newline at end of file
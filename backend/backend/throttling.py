@@ -0,0 +1,251 @@
+# backend/throttling.py
+"""
+Token-bucket throttle cho các endpoint tốn tài nguyên (settings.API_THROTTLE):
+
+    chat        /api/chat/ (Gemini + SBERT/FAISS)
+    chat_batch  /api/chat/batch/ (mỗi câu hỏi trong batch tính 1 token)
+    speech      /api/speech-to-text/ (Whisper)
+    auth        đăng nhập / reset / đổi mật khẩu (chống dò mật khẩu)
+
+Mỗi scope có 2 bucket: theo user (đã đăng nhập) và theo IP (get_client_ip).
+Bucket nằm trong process (mặc định) hoặc Redis để dùng chung giữa các worker.
+Bị chặn -> 429 + header Retry-After (DRF tự thêm từ wait()).
+"""
+
+import logging
+import math
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from .utils import get_client_ip
+
+# Redis là tùy chọn - chỉ cần khi API_THROTTLE['BACKEND'] = 'redis'
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+def get_throttle_config() -> Dict[str, Any]:
+    config = dict(getattr(settings, 'API_THROTTLE', {}))
+    config.setdefault('ENABLED', True)
+    config.setdefault('BACKEND', 'local')
+    config.setdefault('REDIS_URL', 'redis://127.0.0.1:6379/2')
+    config.setdefault('SCOPES', {})
+    return config
+
+
+def parse_rate(rate: Optional[str]) -> Optional[float]:
+    """'20/min' -> token mỗi giây; None = không giới hạn"""
+    if not rate:
+        return None
+    count, period = rate.split('/')
+    seconds = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period.strip()[0]]
+    return int(count) / seconds
+
+
+class LocalBucketBackend:
+    """Bucket trong bộ nhớ process - mỗi worker có ngân sách riêng"""
+
+    name = 'local'
+    PRUNE_EVERY = 1000
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def consume(self, buckets: List[Tuple[str, float, float, float]]) -> Tuple[bool, float]:
+        """
+        buckets: [(key, rate, capacity, cost), ...] - kiểm tra tất cả rồi mới trừ:
+        chỉ trừ token khi mọi bucket đều cho phép (bucket IP bị chặn không tiêu bucket user).
+        Trả về (allowed, wait) - wait là thời gian chờ lâu nhất trong các bucket thiếu token.
+        """
+        now = time.monotonic()
+        with self._lock:
+            refilled = []
+            wait = 0.0
+            for key, rate, capacity, cost in buckets:
+                tokens, updated_at = self._buckets.get(key, (capacity, now))
+                tokens = min(capacity, tokens + (now - updated_at) * rate)
+                if tokens < cost:
+                    wait = max(wait, (cost - tokens) / rate)
+                refilled.append((key, tokens - cost))
+
+            allowed = wait == 0.0
+            if allowed:
+                for key, tokens in refilled:
+                    self._buckets[key] = (tokens, now)
+
+            self._calls += 1
+            if self._calls % self.PRUNE_EVERY == 0:
+                self._prune(now)
+        return allowed, wait
+
+    def _prune(self, now: float):
+        """Bỏ bucket không dùng quá 1 giờ (đã nạp đầy lại, giống bucket mới)"""
+        idle = [key for key, (_, updated_at) in self._buckets.items() if now - updated_at > 3600]
+        for key in idle:
+            del self._buckets[key]
+
+    def size(self) -> int:
+        return len(self._buckets)
+
+
+class RedisBucketBackend:
+    """Bucket trong Redis - cập nhật atomic bằng Lua script, dùng chung giữa các worker"""
+
+    name = 'redis'
+
+    # KEYS = các bucket; ARGV = now, rồi (rate, capacity, cost) cho từng bucket.
+    # Kiểm tra + trừ trong 1 lần gọi script (atomic): chỉ trừ khi mọi bucket đủ token
+    SCRIPT = """
+local now = tonumber(ARGV[1])
+local remaining = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 3 - 1])
+    local capacity = tonumber(ARGV[i * 3])
+    local cost = tonumber(ARGV[i * 3 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    if tokens < cost then
+        wait = math.max(wait, (cost - tokens) / rate)
+    end
+    remaining[i] = tokens - cost
+end
+if wait > 0 then
+    return {0, tostring(wait)}
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 3 - 1])
+    local capacity = tonumber(ARGV[i * 3])
+    redis.call('HSET', key, 'tokens', remaining[i], 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return {1, '0'}
+"""
+
+    def __init__(self, url: str, prefix: str = 'bdu:throttle:'):
+        self.client = redis.Redis.from_url(url, socket_timeout=1)
+        self.prefix = prefix
+        self._script = self.client.register_script(self.SCRIPT)
+        self._fallback = LocalBucketBackend()
+
+    def consume(self, buckets):
+        keys = [f'{self.prefix}{key}' for key, _, _, _ in buckets]
+        args = [time.time()]
+        for _, rate, capacity, cost in buckets:
+            args.extend([rate, capacity, cost])
+        try:
+            allowed, wait = self._script(keys=keys, args=args)
+            return bool(int(allowed)), float(wait)
+        except Exception as e:
+            # Redis lỗi -> vẫn giới hạn theo process thay vì mở toang hoặc chặn hết
+            logger.warning(f"Throttle backend unavailable, using process-local buckets: {e}")
+            return self._fallback.consume(buckets)
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+def build_bucket_backend(config: Dict[str, Any]):
+    """Tạo backend theo API_THROTTLE['BACKEND'] (local | redis)"""
+    backend = (config.get('BACKEND') or 'local').lower()
+    if backend == 'redis':
+        if not REDIS_AVAILABLE:
+            logger.warning("redis package not installed - falling back to process-local throttle buckets")
+            return LocalBucketBackend()
+        try:
+            return RedisBucketBackend(config['REDIS_URL'])
+        except Exception as e:
+            logger.error(f"Could not initialise throttle backend '{backend}': {e}")
+    return LocalBucketBackend()
+
+
+# Global bucket backend
+bucket_backend = build_bucket_backend(get_throttle_config())
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttle theo scope: trừ 1 token ở bucket user (nếu đã đăng nhập) và bucket IP.
+    Cấu hình: API_THROTTLE['SCOPES'][scope] = {'USER': '10/min', 'USER_BURST': 5, 'IP': ..., 'IP_BURST': ...}
+    """
+
+    scope = None
+    methods = ('POST',)  # GET chỉ là thông tin (đã cache) - không tính
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def cost(self, request) -> float:
+        """Số token 1 request tiêu tốn"""
+        return 1.0
+
+    def _buckets(self, request):
+        scope_config = get_throttle_config()['SCOPES'].get(self.scope, {})
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            yield f'{self.scope}:user:{user.pk}', scope_config.get('USER'), scope_config.get('USER_BURST')
+        yield f'{self.scope}:ip:{get_client_ip(request)}', scope_config.get('IP'), scope_config.get('IP_BURST')
+
+    def allow_request(self, request, view):
+        if not get_throttle_config()['ENABLED'] or request.method not in self.methods:
+            return True
+
+        cost = self.cost(request)
+        buckets = []
+        for key, rate, burst in self._buckets(request):
+            per_second = parse_rate(rate)
+            if per_second is None:
+                continue
+            capacity = float(burst or max(1, math.ceil(per_second * 60)))
+            buckets.append((key, per_second, capacity, min(cost, capacity)))
+        if not buckets:
+            return True
+
+        # ✅ CHANGED: kiểm tra mọi bucket trước, chỉ trừ token khi tất cả cho phép
+        allowed, wait = bucket_backend.consume(buckets)
+        if not allowed:
+            self.wait_seconds = wait
+            logger.warning(f"🚦 Throttled {self.scope} request from {get_client_ip(request)} "
+                           f"(retry after {self.wait_seconds:.1f}s)")
+            return False
+        return True
+
+    def wait(self):
+        return math.ceil(self.wait_seconds) if self.wait_seconds else None
+
+
+class ChatThrottle(TokenBucketThrottle):
+    scope = 'chat'
+
+
+class ChatBatchThrottle(TokenBucketThrottle):
+    """Batch tối đa CHAT_BATCH['MAX_ITEMS'] câu - tính theo số câu, không theo số request"""
+    scope = 'chat_batch'
+
+    def cost(self, request) -> float:
+        try:
+            queries = request.data.get('queries')
+        except Exception:
+            return 1.0
+        return float(max(1, len(queries))) if isinstance(queries, list) else 1.0
+
+
+class SpeechThrottle(TokenBucketThrottle):
+    scope = 'speech'
+
+
+class AuthThrottle(TokenBucketThrottle):
+    scope = 'auth'
@@ -0,0 +1,177 @@
+# backend/tracing.py
+"""
+Span instrumentation nhẹ cho pipeline chat (settings.TRACING).
+
+    with span('retrieval'):
+        ...
+
+TracingMiddleware mở 1 trace cho mỗi request; ngoài trace (management command,
+batch thread, shell) span() không làm gì. Khi kết thúc request:
+- header Server-Timing: tổng thời gian theo tên span + total
+- request chậm hơn SLOW_THRESHOLD -> giữ toàn bộ cây span trong slow_request_recorder
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar('tracing_current_span', default=None)
+_current_trace = contextvars.ContextVar('tracing_current_trace', default=None)
+
+
+def get_tracing_config() -> Dict[str, Any]:
+    config = dict(getattr(settings, 'TRACING', {}))
+    config.setdefault('ENABLED', True)
+    config.setdefault('PATHS', ['/api/'])
+    config.setdefault('SLOW_THRESHOLD', 5.0)
+    config.setdefault('MAX_SLOW_TRACES', 50)
+    return config
+
+
+class Span:
+    __slots__ = ('name', 'attrs', 'start', 'end', 'children')
+
+    def __init__(self, name: str, attrs: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.start = time.perf_counter()
+        self.end = None
+        self.children: List['Span'] = []
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def as_dict(self, origin: float) -> Dict[str, Any]:
+        data = {
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 2),
+            'duration_ms': round(self.duration * 1000, 2),
+        }
+        if self.attrs:
+            data['attrs'] = self.attrs
+        if self.children:
+            data['children'] = [child.as_dict(origin) for child in self.children]
+        return data
+
+
+class Trace:
+    """Cây span của 1 request"""
+
+    def __init__(self, name: str, **attrs):
+        self.root = Span(name, attrs)
+        self.started_at = timezone.now()
+
+    @property
+    def duration(self) -> float:
+        return self.root.duration
+
+    def stage_totals(self) -> Dict[str, float]:
+        """Giây theo tên span (cộng dồn nếu 1 stage chạy nhiều lần), theo thứ tự bắt đầu"""
+        totals: Dict[str, float] = {}
+        stack = list(reversed(self.root.children))
+        while stack:
+            current = stack.pop()
+            totals[current.name] = totals.get(current.name, 0.0) + current.duration
+            stack.extend(reversed(current.children))
+        return totals
+
+    def timings(self) -> Dict[str, float]:
+        """ms theo tên span + total"""
+        result = {name: round(seconds * 1000, 2) for name, seconds in self.stage_totals().items()}
+        result['total'] = round(self.duration * 1000, 2)
+        return result
+
+    def server_timing(self) -> str:
+        return ', '.join(f'{name};dur={ms}' for name, ms in self.timings().items())
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'started_at': self.started_at.isoformat(),
+            'duration_ms': round(self.duration * 1000, 2),
+            'tree': self.root.as_dict(self.root.start),
+        }
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Đo 1 stage; không có trace đang mở thì chỉ yield None"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    current = Span(name, attrs)
+    parent.children.append(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def start_trace(name: str, **attrs):
+    """Mở trace cho request hiện tại; trả về (trace, tokens) để end_trace()"""
+    trace = Trace(name, **attrs)
+    tokens = (_current_trace.set(trace), _current_span.set(trace.root))
+    return trace, tokens
+
+
+def end_trace(trace: Trace, tokens):
+    trace.root.end = time.perf_counter()
+    _current_trace.reset(tokens[0])
+    _current_span.reset(tokens[1])
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+class SlowRequestRecorder:
+    """Flight recorder: giữ N trace gần nhất của các request chậm hơn threshold"""
+
+    def __init__(self, threshold: float = 5.0, max_traces: int = 50):
+        self.threshold = threshold
+        self._traces = deque(maxlen=max_traces)
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def maybe_record(self, trace: Trace, **info) -> bool:
+        if trace.duration < self.threshold:
+            return False
+        entry = {**info, **trace.as_dict()}
+        with self._lock:
+            self._traces.append(entry)
+            self.recorded += 1
+        logger.warning(f"🐢 Slow request {info.get('method', '')} {info.get('path', '')}: "
+                       f"{trace.duration:.2f}s {trace.timings()}")
+        return True
+
+    def recent(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            traces = list(self._traces)
+        traces.reverse()
+        return traces[:limit] if limit else traces
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'threshold': self.threshold, 'kept': len(self._traces), 'recorded': self.recorded}
+
+
+def _build_slow_request_recorder() -> SlowRequestRecorder:
+    config = get_tracing_config()
+    return SlowRequestRecorder(threshold=config['SLOW_THRESHOLD'], max_traces=config['MAX_SLOW_TRACES'])
+
+
+# Global flight recorder
+slow_request_recorder = _build_slow_request_recorder()
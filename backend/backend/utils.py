@@ -0,0 +1,20 @@
+# backend/utils.py
+
+from django.conf import settings
+
+
+def get_client_ip(request):
+    """
+    Lấy IP client.
+    REST_FRAMEWORK['NUM_PROXIES'] = N (số reverse proxy tin cậy phía trước, VD ngrok/nginx):
+    lấy địa chỉ thứ N tính từ cuối X-Forwarded-For để client không giả mạo được IP.
+    Không cấu hình (hoặc 0) -> bỏ qua X-Forwarded-For (client tự đặt được), dùng REMOTE_ADDR.
+    """
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    num_proxies = getattr(settings, 'REST_FRAMEWORK', {}).get('NUM_PROXIES')
+
+    if x_forwarded_for and num_proxies:
+        addresses = [address.strip() for address in x_forwarded_for.split(',') if address.strip()]
+        if addresses:
+            return addresses[-min(num_proxies, len(addresses))]
+    return request.META.get('REMOTE_ADDR')
@@ -0,0 +1,188 @@
+"""
+Benchmark ghi/đọc ChatHistory đồng thời theo từng DB_PROFILE (backend/db_profiles.py).
+
+Mỗi profile chạy trong 1 process riêng (settings Django cố định theo process):
+writer thread ghi từng dòng như ChatView (1 INSERT / request), reader thread
+đọc lịch sử 1 session như ChatHistoryView.
+
+    python benchmarks/db_concurrency_bench.py                       # sqlite-basic vs sqlite
+    python benchmarks/db_concurrency_bench.py --profiles postgres --database bench_bdu_chatbot
+
+SQLite chạy trên file tạm. Benchmark xoá sạch bảng chat_history trước khi chạy nên
+postgres chỉ chạy trên database riêng tên bắt đầu bằng 'bench_' (tạo trước bằng
+createdb; POSTGRES_HOST/USER/PASSWORD lấy từ env như app), không bao giờ trên POSTGRES_DB của app.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DATABASE_PREFIX = 'bench_'
+
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_worker(args):
+    """Chạy trong process con: DB_PROFILE / SQLITE_PATH đã được set qua env"""
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    from django.db import OperationalError, connection, connections
+    from knowledge.models import ChatHistory
+
+    # Chốt chặn cuối: chỉ xoá dữ liệu trên file SQLite tạm hoặc database bench_*
+    database = connection.settings_dict['NAME']
+    if connection.vendor != 'sqlite' and not str(database).startswith(BENCH_DATABASE_PREFIX):
+        raise SystemExit(f"Refusing to benchmark database '{database}': name must start with '{BENCH_DATABASE_PREFIX}'")
+    if connection.vendor == 'sqlite' and os.path.abspath(database) == os.path.join(BACKEND_DIR, 'db.sqlite3'):
+        raise SystemExit('Refusing to benchmark the app database db.sqlite3')
+
+    call_command('migrate', 'knowledge', skip_checks=True, verbosity=0)
+    ChatHistory.objects.all().delete()
+
+    # Dữ liệu sẵn để reader có gì đọc
+    sessions = [f'bench_{i}' for i in range(args.sessions)]
+    ChatHistory.objects.bulk_create(
+        [ChatHistory(session_id=sessions[i % len(sessions)], user_message=f'seed {i}', bot_response='a' * 200)
+         for i in range(args.seed_rows)],
+        batch_size=1000,
+    )
+    journal_mode = None
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+    connections.close_all()
+
+    stop = threading.Event()
+    results = {'write': [], 'read': [], 'write_errors': 0, 'read_errors': 0}
+    lock = threading.Lock()
+
+    def writer(seed):
+        rng = random.Random(seed)
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                ChatHistory.objects.create(
+                    session_id=rng.choice(sessions), user_message='benchmark question',
+                    bot_response='b' * 400, confidence_score=rng.random(), response_time=rng.random(),
+                )
+                elapsed = time.perf_counter() - start
+                with lock:
+                    results['write'].append(elapsed)
+            except OperationalError:
+                with lock:
+                    results['write_errors'] += 1
+            # Django request_finished tương đương: đóng connection nếu hết CONN_MAX_AGE
+            connections['default'].close_if_unusable_or_obsolete()
+        connections.close_all()
+
+    def reader(seed):
+        rng = random.Random(seed)
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                list(ChatHistory.objects.filter(session_id=rng.choice(sessions)).order_by('timestamp', 'id')[:50])
+                elapsed = time.perf_counter() - start
+                with lock:
+                    results['read'].append(elapsed)
+            except OperationalError:
+                with lock:
+                    results['read_errors'] += 1
+            connections['default'].close_if_unusable_or_obsolete()
+        connections.close_all()
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(1000 + i,)) for i in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    summary = {'journal_mode': journal_mode}
+    for kind in ('write', 'read'):
+        samples = results[kind]
+        summary[kind] = {
+            'ops_per_sec': round(len(samples) / args.duration, 1),
+            'p50_ms': round(percentile(samples, 0.50) * 1000, 2) if samples else None,
+            'p95_ms': round(percentile(samples, 0.95) * 1000, 2) if samples else None,
+            'p99_ms': round(percentile(samples, 0.99) * 1000, 2) if samples else None,
+            'mean_ms': round(statistics.mean(samples) * 1000, 2) if samples else None,
+            'errors': results[f'{kind}_errors'],
+        }
+    print(json.dumps(summary))
+
+
+def run_profile(profile, args, workdir):
+    env = dict(os.environ, DB_PROFILE=profile, PYTHONUNBUFFERED='1')
+    if profile.startswith('sqlite'):
+        env['SQLITE_PATH'] = os.path.join(workdir, f'{profile}.sqlite3')
+    else:
+        if not args.database or not args.database.startswith(BENCH_DATABASE_PREFIX):
+            print(f"[{profile}] skipped: pass --database {BENCH_DATABASE_PREFIX}<name> "
+                  f"(a throwaway database - its chat_history table is wiped)\n")
+            return None
+        env['POSTGRES_DB'] = args.database
+
+    command = [sys.executable, os.path.abspath(__file__), '--worker',
+               '--writers', str(args.writers), '--readers', str(args.readers),
+               '--duration', str(args.duration), '--sessions', str(args.sessions),
+               '--seed-rows', str(args.seed_rows)]
+    proc = subprocess.run(command, env=env, cwd=BACKEND_DIR, capture_output=True, text=True)
+    lines = [line for line in proc.stdout.splitlines() if line.startswith('{')]
+    if proc.returncode != 0 or not lines:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f'exit code {proc.returncode}'
+        print(f'[{profile}] skipped: {error}\n')
+        return None
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', default='sqlite-basic,sqlite')
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0, help='giây')
+    parser.add_argument('--sessions', type=int, default=500)
+    parser.add_argument('--seed-rows', type=int, default=20000)
+    parser.add_argument('--database', help=f"database riêng cho profile postgres (tên bắt đầu bằng '{BENCH_DATABASE_PREFIX}')")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    print(f'{args.writers} writers + {args.readers} readers, {args.duration}s per profile\n')
+    with tempfile.TemporaryDirectory() as workdir:
+        for profile in args.profiles.split(','):
+            summary = run_profile(profile.strip(), args, workdir)
+            if not summary:
+                continue
+            print(f"[{profile}] journal_mode={summary['journal_mode']}")
+            for kind in ('write', 'read'):
+                row = summary[kind]
+                print(f"  {kind:<6} {row['ops_per_sec']:>9} ops/s  p50 {row['p50_ms']} ms  "
+                      f"p95 {row['p95_ms']} ms  p99 {row['p99_ms']} ms  errors {row['errors']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Benchmark truy vấn lịch sử chat trên bảng chat_history tổng hợp (mặc định 3 triệu dòng).
+
+So sánh:
+  - không index vs index (session_id, timestamp) + (timestamp)
+  - OFFSET (PageNumberPagination) vs keyset (CursorPagination) khi lật sâu
+
+Chỉ dùng sqlite3 của stdlib, không cần Django:
+    python benchmarks/history_pagination_bench.py --rows 3000000 --db /tmp/chat_bench.sqlite3
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import time
+
+SCHEMA = """
+CREATE TABLE chat_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_uuid CHAR(32) NOT NULL UNIQUE,
+    session_id VARCHAR(100) NOT NULL,
+    user_message TEXT NOT NULL,
+    bot_response TEXT NOT NULL,
+    confidence_score REAL NOT NULL,
+    response_time REAL NOT NULL,
+    timestamp DATETIME NOT NULL
+)
+"""
+
+INDEXES = (
+    'CREATE INDEX chat_history_session_ts_idx ON chat_history (session_id, timestamp)',
+    'CREATE INDEX chat_history_ts_idx ON chat_history (timestamp)',
+)
+
+PAGE_SIZE = 50
+
+
+def build_table(path, rows, sessions, seed):
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute(SCHEMA)
+
+    start = time.perf_counter()
+    base = 1_700_000_000.0
+    batch = []
+    for i in range(rows):
+        ts = base + i * 0.5 + rng.random() * 0.4
+        batch.append((
+            '%032x' % rng.getrandbits(128),
+            f'session_{rng.randrange(sessions)}',
+            f'câu hỏi {i}',
+            'câu trả lời ' * 8,
+            rng.random(),
+            rng.random() * 3,
+            time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts)) + '.%06d' % int((ts % 1) * 1e6),
+        ))
+        if len(batch) >= 50_000:
+            conn.executemany('INSERT INTO chat_history (chat_uuid, session_id, user_message, bot_response, '
+                             'confidence_score, response_time, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)', batch)
+            batch.clear()
+    if batch:
+        conn.executemany('INSERT INTO chat_history (chat_uuid, session_id, user_message, bot_response, '
+                         'confidence_score, response_time, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)', batch)
+    conn.commit()
+    print(f'built {rows:,} rows / {sessions:,} sessions in {time.perf_counter() - start:.1f}s')
+    return conn
+
+
+def timed(conn, sql, params=(), repeat=5):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def run_queries(conn, label, sessions, rows, seed):
+    rng = random.Random(seed)
+    session_ids = [f'session_{rng.randrange(sessions)}' for _ in range(5)]
+    deep_offset = max(0, rows - PAGE_SIZE * 10)
+
+    # Cursor của trang sâu tương ứng với deep_offset (lấy 1 lần, không tính giờ)
+    cursor_row = conn.execute(
+        'SELECT timestamp FROM chat_history ORDER BY timestamp DESC, id DESC LIMIT 1 OFFSET ?',
+        (deep_offset,)
+    ).fetchone()
+
+    results = {
+        'latest 50 (ChatHistoryView)': timed(
+            conn, 'SELECT * FROM chat_history ORDER BY timestamp DESC, id DESC LIMIT ?', (PAGE_SIZE,)),
+        'session history': statistics.median(
+            timed(conn, 'SELECT * FROM chat_history WHERE session_id = ? ORDER BY timestamp, id LIMIT ?',
+                  (sid, PAGE_SIZE)) for sid in session_ids),
+        f'OFFSET page (offset={deep_offset:,})': timed(
+            conn, 'SELECT * FROM chat_history ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?',
+            (PAGE_SIZE, deep_offset), repeat=3),
+        'OFFSET page COUNT(*)': timed(conn, 'SELECT COUNT(*) FROM chat_history', repeat=3),
+        # Cùng dạng query CursorPagination của DRF sinh ra (lọc theo field đầu tiên của ordering)
+        'keyset page (same depth)': timed(
+            conn, 'SELECT * FROM chat_history WHERE timestamp < ? ORDER BY timestamp DESC, id DESC LIMIT ?',
+            (cursor_row[0], PAGE_SIZE)),
+    }
+
+    print(f'\n[{label}]')
+    for name, ms in results.items():
+        print(f'  {name:<40} {ms:10.2f} ms')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=3_000_000)
+    parser.add_argument('--sessions', type=int, default=200_000)
+    parser.add_argument('--db', default='/tmp/chat_history_bench.sqlite3')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--keep', action='store_true', help='giữ lại file DB sau khi chạy')
+    args = parser.parse_args()
+
+    conn = build_table(args.db, args.rows, args.sessions, args.seed)
+    try:
+        before = run_queries(conn, 'no index', args.sessions, args.rows, args.seed)
+
+        start = time.perf_counter()
+        for statement in INDEXES:
+            conn.execute(statement)
+        conn.execute('ANALYZE')
+        print(f'\ncreated indexes in {time.perf_counter() - start:.1f}s')
+
+        after = run_queries(conn, 'indexed', args.sessions, args.rows, args.seed)
+
+        print('\n[speedup]')
+        for name in before:
+            print(f'  {name:<40} {before[name] / max(after[name], 1e-6):10.1f}x')
+    finally:
+        conn.close()
+        if not args.keep:
+            os.remove(args.db)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+Benchmark chi phí logging trên request thread cho 1 lượt chat.
+
+So sánh:
+  before   ~20 print() + 9 logger.info (f-string) mỗi request, StreamHandler ghi đồng bộ
+  after    log chẩn đoán ở DEBUG (tắt, chỉ còn isEnabledFor) + 1 dòng INFO tóm tắt
+           qua AsyncStreamHandler (ghi ở thread QueueListener)
+  sampled  như after nhưng bật DEBUG, lấy mẫu 10% (LOG_SAMPLING)
+
+Stdout được giả lập bằng sink có độ trễ mỗi lần write (console/pipe chậm), nhiều thread
+gửi request song song như runserver/gunicorn threads:
+    python benchmarks/logging_overhead_bench.py --requests 2000 --threads 8 --write-us 50
+"""
+
+import argparse
+import io
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.logging_utils import AsyncStreamHandler, LogSampler  # noqa: E402
+
+FORMAT = '[{levelname}] {asctime} - {name} - {message}'
+
+QUERY = 'cho em hỏi học phí ngành công nghệ thông tin năm nay là bao nhiêu ạ'
+VARIANTS = [QUERY, 'cho em hoi hoc phi nganh cong nghe thong tin nam nay la bao nhieu a', QUERY.lower()]
+INTENT_SCORES = {f'intent_{i}': (i % 4) * 0.137 for i in range(15)}
+CONTEXT_SUMMARY = 'Giảng viên đang hỏi về học phí, trước đó hỏi lịch giảng dạy và ngân hàng đề thi. ' * 3
+
+
+class SlowSink(io.TextIOBase):
+    """Stream giả lập console: mỗi write tốn write_us micro giây (sleep - nhả GIL như I/O thật)"""
+
+    def __init__(self, write_us: float):
+        self.delay = write_us / 1_000_000
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def setup_logger(name, handler, level):
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
+    handler.setFormatter(logging.Formatter(FORMAT, style='{'))
+    return logger
+
+
+def request_before(logger, sink, session_id):
+    """Lượng output mỗi request của code cũ (print + INFO f-string)"""
+    print(f"🔍 CHAT DEBUG: user_id = 2, session_id = {session_id}", file=sink)
+    print(f"🔍 CHAT DEBUG: User message = {QUERY}", file=sink)
+    print(f"👤 USER CONTEXT: Giảng viên Khoa Công nghệ thông tin", file=sink)
+    logger.info(f"💬 Processing: {QUERY[:50]}... (User: GV001)")
+    logger.info(f"👨‍🏫 Processing lecturer query: '{QUERY}' (session: {session_id})")
+    print(f"🔍 LECTURER INTENT DEBUG: Original = '{QUERY}'", file=sink)
+    print(f"🔍 LECTURER INTENT DEBUG: Normalized = '{QUERY.lower()}'", file=sink)
+    print(f"🔍 LECTURER INTENT DEBUG: Variants = {VARIANTS}", file=sink)
+    print(f"🔍 LECTURER INTENT DEBUG: Intent scores = {INTENT_SCORES}", file=sink)
+    print(f"🔍 LECTURER INTENT DEBUG: After lecturer boosting = {INTENT_SCORES}", file=sink)
+    print(f"🔍 LECTURER INTENT DEBUG: Best intent = intent_3, confidence = 0.411", file=sink)
+    print(f"🔍 LECTURER INTENT DEBUG: Threshold = 0.18, base = 0.6", file=sink)
+    print(f"🔍 LECTURER INTENT DEBUG: INTENT MATCHED!", file=sink)
+    logger.info(f"🔍 Retrieval result: confidence={0.71234:.3f}")
+    logger.info(f"🎓 Education check: '{QUERY}' -> keywords:{['học phí', 'ngành']} -> True")
+    logger.info(f"❓ Clarification check: vague:0, words:14, conf:{0.71234:.3f} -> False")
+    logger.info(f"🤖 Decision inputs: education=True, context_override=False, similarity={0.71234:.3f}, level=medium_trust, clarify=False")
+    logger.info(f"🎯 Decision made: enhance_db_answer")
+    logger.info(f"🎯 Executing lecturer decision: enhance_db_answer")
+    print(f"\n--- LECTURER REQUEST (Session: {session_id}) ---", file=sink)
+    print(f"🧠 MEMORY DEBUG: Total active sessions = 120", file=sink)
+    print(f"🧠 MEMORY DEBUG: History length = 4", file=sink)
+    print(f"🧠 MEMORY DEBUG: Context summary = {CONTEXT_SUMMARY}", file=sink)
+    print(f"🔍 LECTURER STRATEGY DEBUG: has_real_history = True", file=sink)
+    print(f"🔍 LECTURER STRATEGY DEBUG: last_query = '{QUERY[:50]}...'", file=sink)
+    print(f"🔍 LECTURER STRATEGY DEBUG: current_query = '{QUERY[:50]}...'", file=sink)
+    print(f"💡 LECTURER STRATEGY SELECTED: → balanced (default)", file=sink)
+    print(f"🔍 CHAT DEBUG: AI response method = enhance_db_answer", file=sink)
+    logger.info(f"🧠 Memory updated for session {session_id}")
+    logger.info(f"✅ Chat queued: {session_id}")
+
+
+def request_after(logger, sampler, session_id):
+    """Code mới: DEBUG lười + khối chẩn đoán lấy mẫu + 1 dòng INFO"""
+    logger.debug("💬 Processing: %r (user_id=%s, session=%s, role=%s)", QUERY[:50], 2, session_id, 'GV')
+    logger.debug("👨‍🏫 Processing lecturer query: %r (session: %s)", QUERY, session_id)
+    if sampler.sample(logger):
+        logger.debug("🔍 Intent scoring: query=%r normalized=%r variants=%s keyword_scores=%s boosted=%s",
+                     QUERY, QUERY.lower(), VARIANTS, dict(INTENT_SCORES), INTENT_SCORES)
+    logger.debug("🔍 Best intent %s confidence=%.3f threshold=%.3f matched=%s", 'intent_3', 0.411, 0.18, True)
+    logger.debug("🔍 Retrieval result: confidence=%.3f", 0.71234)
+    logger.debug("🎓 Education check: %r -> keywords:%s -> %s", QUERY, ['học phí', 'ngành'], True)
+    logger.debug("❓ Clarification check: vague:%d, words:%d, conf:%.3f -> %s", 0, 14, 0.71234, False)
+    logger.debug("🤖 Decision inputs: education=%s, context_override=%s, similarity=%.3f, level=%s, clarify=%s",
+                 True, False, 0.71234, 'medium_trust', False)
+    logger.debug("🎯 Decision made: %s", 'enhance_db_answer')
+    logger.debug("🎯 Executing lecturer decision: %s", 'enhance_db_answer')
+    if sampler.sample(logger):
+        logger.debug("🧠 Lecturer request session=%s active_sessions=%d history=%d summary=%r",
+                     session_id, 120, 4, CONTEXT_SUMMARY)
+        logger.debug("🔍 Strategy inputs: last_query=%r current_query=%r ...", QUERY[:50], QUERY[:50])
+    logger.debug("💡 Lecturer strategy selected: %s", 'balanced')
+    logger.debug("🧠 Memory updated for session %s", session_id)
+    logger.info("✅ Chat %s: method=%s, %.2fs, user=%s", session_id, 'enhance_db_answer', 1.234, 'GV001')
+
+
+def run(mode, requests, threads, write_us):
+    sink = SlowSink(write_us)
+    if mode == 'before':
+        logger = setup_logger(f'bench.{mode}', logging.StreamHandler(sink), logging.INFO)
+        handler = None
+    else:
+        handler = AsyncStreamHandler(sink, max_queue=100_000)
+        logger = setup_logger(f'bench.{mode}', handler, logging.DEBUG if mode == 'sampled' else logging.INFO)
+    sampler = LogSampler(rates={f'bench.{mode}': 0.1})
+
+    per_thread = requests // threads
+    samples = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads)
+
+    def worker(index):
+        barrier.wait()
+        out = samples[index]
+        for i in range(per_thread):
+            session_id = f'session-{index}-{i}'
+            start = time.perf_counter()
+            if mode == 'before':
+                request_before(logger, sink, session_id)
+            else:
+                request_after(logger, sampler, session_id)
+            out.append((time.perf_counter() - start) * 1_000_000)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    wall = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    wall = time.perf_counter() - wall
+
+    drain = time.perf_counter()
+    if handler is not None:
+        handler.close()  # chờ listener ghi nốt
+    drain = time.perf_counter() - drain
+
+    flat = sorted(value for chunk in samples for value in chunk)
+    return {
+        'mean': statistics.fmean(flat),
+        'p50': flat[len(flat) // 2],
+        'p99': flat[int(len(flat) * 0.99)],
+        'wall': wall,
+        'drain': drain,
+        'writes': sink.writes,
+        'dropped': getattr(handler, 'dropped', 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--write-us', type=float, default=50.0, help='độ trễ mỗi lần ghi stdout (micro giây)')
+    args = parser.parse_args()
+
+    print(f'{args.requests} requests, {args.threads} threads, {args.write_us:.0f}us per stdout write')
+    print(f"{'mode':<8} {'mean us':>10} {'p50 us':>10} {'p99 us':>10} {'wall s':>8} {'drain s':>8} {'writes':>8} {'dropped':>8}")
+    for mode in ('before', 'after', 'sampled'):
+        r = run(mode, args.requests, args.threads, args.write_us)
+        print(f"{mode:<8} {r['mean']:>10.1f} {r['p50']:>10.1f} {r['p99']:>10.1f} {r['wall']:>8.2f} "
+              f"{r['drain']:>8.2f} {r['writes']:>8} {r['dropped']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,310 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+
+from authentication.models import Faculty
+from backend.admission import ADMIT, DEGRADE, REJECT, AdmissionController
+from backend.http_cache import ResponseCache, cache_response, response_cache
+from backend.metrics import MetricsRegistry, _cache_samples
+from backend.throttling import ChatBatchThrottle, ChatThrottle, LocalBucketBackend
+from backend.utils import get_client_ip
+from knowledge.archive import ChatHistoryArchive
+from knowledge.history_writer import ChatHistoryWriter
+from knowledge.models import ChatHistory, UserFeedback
+
+THROTTLE_SCOPES = {
+    'chat': {'USER': '60/min', 'USER_BURST': 5, 'IP': '60/min', 'IP_BURST': 2},
+    'chat_batch': {'USER': '60/min', 'USER_BURST': 100, 'IP': '60/min', 'IP_BURST': 10},
+}
+
+
+class FeedbackViewTests(TestCase):
+    def setUp(self):
+        self.writer = ChatHistoryWriter(max_batch=2)
+        self.writer.start = lambda: None  # flush tay, không chạy thread nền
+        patcher = mock.patch('chat.views.chat_history_writer', self.writer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = Faculty.objects.create(
+            faculty_code='TEST', email='test@bdu.edu.vn', full_name='Tài Khoản Test',
+            password=make_password('123456'),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post_feedback(self, chat_id):
+        return self.client.post('/api/feedback/', {'chat_id': chat_id, 'feedback_type': 'like'}, format='json')
+
+    def test_feedback_for_buffered_chat(self):
+        older = self.writer.submit(session_id='s1', user_message='Câu 1', bot_response='Trả lời 1')
+        chat_id = self.writer.submit(session_id='s1', user_message='Câu 2', bot_response='Trả lời 2')
+        self.assertFalse(ChatHistory.objects.filter(chat_uuid=chat_id).exists())
+
+        response = self.post_feedback(chat_id)
+
+        self.assertEqual(response.status_code, 200)
+        feedback = UserFeedback.objects.get(id=response.data['feedback_id'])
+        self.assertEqual(str(feedback.chat_history.chat_uuid), chat_id)
+        self.assertTrue(ChatHistory.objects.filter(chat_uuid=older).exists())
+        self.assertEqual(self.writer.pending(), 0)
+
+    @override_settings(CHAT_HISTORY_WRITER={'FEEDBACK_WAIT': 0})
+    def test_feedback_flushes_at_most_one_batch(self):
+        for index in range(2):
+            self.writer.submit(session_id='s1', user_message=f'Câu {index}', bot_response='...')
+        chat_id = self.writer.submit(session_id='s1', user_message='Câu 3', bot_response='...')
+
+        # Không xả cả buffer trong request: record ngoài batch đầu -> 409, client gửi lại
+        response = self.post_feedback(chat_id)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.writer.pending(), 1)
+        self.assertEqual(ChatHistory.objects.count(), 2)
+
+    def test_feedback_by_numeric_id(self):
+        chat = ChatHistory.objects.create(session_id='s1', user_message='Câu', bot_response='Trả lời')
+        response = self.post_feedback(chat.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(chat.feedbacks.count(), 1)
+
+    @override_settings(CHAT_HISTORY_WRITER={'FEEDBACK_WAIT': 0})
+    def test_unknown_chat_uuid_is_retryable(self):
+        response = self.post_feedback(str(uuid.uuid4()))
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertTrue(response.data['retryable'])
+        self.assertEqual(UserFeedback.objects.count(), 0)
+
+    def test_invalid_chat_id(self):
+        self.assertEqual(self.post_feedback('not-a-uuid').status_code, 404)
+        self.assertEqual(self.post_feedback('999999').status_code, 404)
+
+
+class ChatHistoryViewTests(TestCase):
+    def setUp(self):
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir, ignore_errors=True)
+        self.archive = ChatHistoryArchive(root=archive_dir)
+        patcher = mock.patch('chat.views.chat_archive', self.archive)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        old = timezone.now() - timedelta(days=120)
+        for index in range(2):
+            ChatHistory.objects.create(session_id='s1', user_message=f'Cũ {index}', bot_response='...',
+                                       timestamp=old + timedelta(minutes=index))
+        ChatHistory.objects.create(session_id='other', user_message='Khác', bot_response='...', timestamp=old)
+        self.archive.archive(older_than_days=90)
+
+        now = timezone.now()
+        for index in range(3):
+            ChatHistory.objects.create(session_id='s1', user_message=f'Mới {index}', bot_response='...',
+                                       timestamp=now + timedelta(seconds=index))
+        self.client = APIClient()
+
+    def test_session_history_includes_archived_turns(self):
+        response = self.client.get('/api/history/s1/?page_size=2')
+
+        self.assertEqual(response.status_code, 200)
+        messages = [item['user_message'] for item in response.data['results']]
+        self.assertEqual(messages, ['Cũ 0', 'Cũ 1', 'Mới 0', 'Mới 1'])
+        self.assertEqual([item.get('archived', False) for item in response.data['results']],
+                         [True, True, False, False])
+
+        # Trang sau chỉ đọc DB, không lặp lại lượt đã archive
+        next_page = self.client.get(response.data['next'])
+        self.assertEqual([item['user_message'] for item in next_page.data['results']], ['Mới 2'])
+        self.assertIsNone(next_page.data['next'])
+
+    def test_all_history_is_newest_first_without_archive(self):
+        response = self.client.get('/api/history/?page_size=10')
+        self.assertEqual([item['user_message'] for item in response.data['results']],
+                         ['Mới 2', 'Mới 1', 'Mới 0'])
+
+
+@override_settings(API_THROTTLE={'ENABLED': True, 'SCOPES': THROTTLE_SCOPES})
+class TokenBucketThrottleTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = LocalBucketBackend()
+        patcher = mock.patch('backend.throttling.bucket_backend', self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.factory = APIRequestFactory()
+
+    def make_request(self, data=None, user=None, **extra):
+        request = Request(self.factory.post('/api/chat/', data or {}, format='json', **extra),
+                          parsers=[JSONParser()])
+        request.user = user or SimpleNamespace(pk=None, is_authenticated=False)
+        return request
+
+    def test_rejected_request_does_not_debit_other_buckets(self):
+        buckets = [('user', 1.0, 5.0, 1.0), ('ip', 1.0, 1.0, 1.0)]
+        self.assertEqual(self.backend.consume(buckets), (True, 0.0))
+
+        allowed, wait = self.backend.consume(buckets)
+        self.assertFalse(allowed)
+        self.assertGreater(wait, 0)
+        self.assertAlmostEqual(self.backend._buckets['user'][0], 4.0, places=2)
+
+    def test_ip_bucket_blocks_user_without_spending_user_tokens(self):
+        user = SimpleNamespace(pk=7, is_authenticated=True)
+        throttle = ChatThrottle()
+        results = [throttle.allow_request(self.make_request(user=user), None) for _ in range(3)]
+
+        self.assertEqual(results, [True, True, False])
+        self.assertGreaterEqual(throttle.wait(), 1)
+        self.assertAlmostEqual(self.backend._buckets['chat:user:7'][0], 3.0, places=1)
+
+    def test_get_requests_are_not_counted(self):
+        request = Request(self.factory.get('/api/chat/'))
+        self.assertTrue(ChatThrottle().allow_request(request, None))
+        self.assertEqual(self.backend.size(), 0)
+
+    def test_batch_costs_one_token_per_query(self):
+        throttle = ChatBatchThrottle()
+        batch = {'queries': ['Học phí?', 'Tuyển sinh?', 'Lịch thi?', 'Ký túc xá?']}
+        self.assertEqual(throttle.cost(self.make_request(batch)), 4.0)
+
+        results = [throttle.allow_request(self.make_request(batch), None) for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+
+    def test_forwarded_for_ignored_without_trusted_proxy(self):
+        throttle = ChatThrottle()
+        for index in range(2):
+            self.assertTrue(throttle.allow_request(
+                self.make_request(HTTP_X_FORWARDED_FOR=f'10.0.0.{index}'), None))
+        self.assertFalse(throttle.allow_request(self.make_request(HTTP_X_FORWARDED_FOR='10.0.0.9'), None))
+
+
+class ClientIPTests(SimpleTestCase):
+    def make_request(self, forwarded_for):
+        return APIRequestFactory().get('/', HTTP_X_FORWARDED_FOR=forwarded_for, REMOTE_ADDR='192.0.2.1')
+
+    def test_forwarded_for_ignored_by_default(self):
+        self.assertEqual(get_client_ip(self.make_request('203.0.113.5')), '192.0.2.1')
+
+    def test_trusted_proxy_hop(self):
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            # Client tự thêm 1.1.1.1 vào đầu - chỉ địa chỉ do proxy gắn vào được tin
+            self.assertEqual(get_client_ip(self.make_request('1.1.1.1, 203.0.113.5')), '203.0.113.5')
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    def test_degrade_then_reject_by_in_flight(self):
+        controller = AdmissionController(degrade_in_flight=1, reject_in_flight=2, degrade_p95=0)
+
+        self.assertEqual(controller.try_admit(), ADMIT)
+        self.assertEqual(controller.try_admit(), DEGRADE)
+        self.assertEqual(controller.try_admit(), REJECT)
+        self.assertEqual(controller.get_stats()['in_flight'], 2)
+
+        controller.release(0.1)
+        self.assertEqual(controller.try_admit(), DEGRADE)
+
+    def test_degrade_on_p95(self):
+        controller = AdmissionController(degrade_in_flight=0, reject_in_flight=0, degrade_p95=2.0, min_samples=5)
+        for _ in range(5):
+            self.assertEqual(controller.try_admit(), ADMIT)
+            controller.release(3.0)
+
+        controller._p95_cache = (0.0, None)  # p95 chỉ tính lại mỗi giây
+        self.assertEqual(controller.try_admit(), DEGRADE)
+        self.assertEqual(controller.get_retry_after(), 5)
+
+    def test_unrecorded_latency_is_not_sampled(self):
+        controller = AdmissionController()
+        controller.try_admit()
+        controller.release(120.0, record_latency=False)
+        self.assertEqual(controller.get_stats()['samples'], 0)
+        self.assertEqual(controller.get_stats()['in_flight'], 0)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_failing_collector_only_drops_its_families(self):
+        registry = MetricsRegistry()
+        registry.counter('bdu_test_total', 'Test counter').inc()
+
+        @registry.register_collector
+        def broken():
+            raise RuntimeError('Whisper loading')
+
+        registry.register_collector(lambda: [('bdu_test_gauge', 'gauge', 'Test gauge', [({'a': 'b'}, 2)])])
+        output = registry.render()
+
+        self.assertIn('bdu_test_total 1', output)
+        self.assertIn('bdu_test_gauge{a="b"} 2', output)
+
+    def test_failing_cache_stats_keep_other_caches(self):
+        def broken():
+            raise RuntimeError('boom')
+
+        families = dict((name, samples) for name, _, _, samples in _cache_samples({
+            'ok': lambda: {'hits': 3, 'misses': 1, 'entries': 2},
+            'broken': broken,
+            'empty': lambda: None,
+        }))
+        self.assertEqual(families['bdu_cache_hits_total'], [({'cache': 'ok'}, 3)])
+        self.assertEqual(families['bdu_cache_hit_ratio'], [({'cache': 'ok'}, 0.75)])
+
+    def test_metrics_endpoint_renders_component_collectors(self):
+        with override_settings(DEBUG=True, METRICS={**settings.METRICS, 'TOKEN': ''}):
+            response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        for family in ('bdu_chat_in_flight', 'bdu_llm_queue_length', 'bdu_cache_hits_total'):
+            self.assertIn(family, body)
+
+    def test_metrics_endpoint_requires_token(self):
+        with override_settings(METRICS={**settings.METRICS, 'TOKEN': 'secret'}):
+            self.assertEqual(self.client.get('/api/metrics').status_code, 403)
+            response = self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        response_cache.clear()
+        self.calls = 0
+
+        @cache_response('test_endpoint', namespaces=('test',))
+        def view(request):
+            self.calls += 1
+            return Response({'calls': self.calls})
+
+        self.view = view
+        self.factory = APIRequestFactory()
+
+    def test_cached_until_namespace_invalidated(self):
+        first = self.view(self.factory.get('/x/'))
+        second = self.view(self.factory.get('/x/'))
+        self.assertEqual(second.data, {'calls': 1})
+        self.assertEqual(second['ETag'], first['ETag'])
+
+        response_cache.invalidate('test')
+        self.assertEqual(self.view(self.factory.get('/x/')).data, {'calls': 2})
+
+    def test_not_modified(self):
+        etag = self.view(self.factory.get('/x/'))['ETag']
+        response = self.view(self.factory.get('/x/', HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.calls, 1)
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_entries=2)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, mock.Mock(expires_at=float('inf')))
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
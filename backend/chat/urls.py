@@ -4,10 +4,17 @@ from . import views
 urlpatterns = [
     path('', views.APIRootView.as_view(), name='api-root'),  # ← API root
     path('chat/', views.ChatView.as_view(), name='chat'),
+    path('chat/batch/', views.ChatBatchView.as_view(), name='chat-batch'),
     path('history/', views.ChatHistoryView.as_view(), name='chat-history'),
     path('history/<str:session_id>/', views.ChatHistoryView.as_view(), name='chat-history-session'),
     path('feedback/', views.FeedbackView.as_view(), name='feedback'),
     path('health/', views.HealthCheckView.as_view(), name='health-check'),
+    path('health/live/', views.LivenessView.as_view(), name='health-live'),
+    path('health/ready/', views.ReadinessView.as_view(), name='health-ready'),
+    path('metrics', views.MetricsView.as_view(), name='metrics'),  # Prometheus scrape (không có dấu / cuối)
+    path('debug/slow-requests/', views.SlowRequestsView.as_view(), name='slow-requests'),
+    path('debug/profiles/', views.ProfileListView.as_view(), name='profile-list'),
+    path('debug/profiles/<str:profile_id>/', views.ProfileDetailView.as_view(), name='profile-detail'),
     
     # Speech-to-Text
     path('speech-to-text/', views.SpeechToTextView.as_view(), name='speech-to-text'),
@@ -1,10 +1,26 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
-from django.http import JsonResponse
+from rest_framework import status, permissions
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, JsonResponse
+from django.utils.decorators import method_decorator
+from backend.http_cache import cache_response
+from backend.throttling import ChatBatchThrottle, ChatThrottle, SpeechThrottle
+from backend.utils import get_client_ip
+from backend.admission import admission_controller
+from backend.tracing import current_trace, slow_request_recorder, span
+from backend.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, get_metrics_config, registry as metrics_registry
+from backend.profiling import request_profiler
 from knowledge.models import ChatHistory, UserFeedback
-from ai_models.services import chatbot_ai
+from knowledge.history_writer import chat_history_writer, get_history_writer_config
+from knowledge.pagination import ChatHistoryCursorPagination, SessionHistoryCursorPagination
+from knowledge.archive import chat_archive
+from ai_models.services import chatbot_ai, get_batch_config
 from ai_models.speech_service import speech_service  # ← THÊM IMPORT
+from ai_models.health_monitor import health_monitor
+from ai_models.llm_limiter import resolve_priority
+from ai_models.deadline import Deadline
+import hmac
 import uuid
 import time
 import logging
@@ -16,17 +32,9 @@ from django.core.files.base import ContentFile
 
 logger = logging.getLogger(__name__)
 
-def get_client_ip(request):
-    """Get client IP address"""
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
-
 class APIRootView(APIView):
     """API Root - Hiển thị danh sách endpoints"""
+    @method_decorator(cache_response('api_root', bypass_params=('test_memory',)))
     def get(self, request):
         
         test_memory = request.GET.get('test_memory')
@@ -45,10 +53,12 @@ class APIRootView(APIView):
                     'error': str(e)
                 })
         
-        system_status = chatbot_ai.get_system_status()
+        # ✅ Status lấy từ cache của HealthMonitor (không gọi Gemini trên request)
+        health = health_monitor.get_snapshot()
+        system_status = health['system_status']
         
         # ✅ THÊM: Speech service status
-        speech_status = speech_service.get_system_status()
+        speech_status = health['speech_status']
         
         return Response({
             'message': 'Chatbot API - Đại học Bình Dương',
@@ -58,7 +68,10 @@ class APIRootView(APIView):
             'speech_status': speech_status,  # ← THÊM
             'endpoints': {
                 'chat': '/api/chat/',
+                'chat_batch': '/api/chat/batch/',
                 'health': '/api/health/',
+                'health_live': '/api/health/live/',
+                'health_ready': '/api/health/ready/',
                 'history': '/api/history/',
                 'feedback': '/api/feedback/',
                 'speech_to_text': '/api/speech-to-text/',  # ← THÊM
@@ -76,11 +89,14 @@ class APIRootView(APIView):
 
 class ChatView(APIView):
     """Enhanced Chat API with Natural Responses"""
+    throttle_classes = [ChatThrottle]  # ✅ THÊM: token bucket theo user + IP
     
+    @method_decorator(cache_response('chat_info'))
     def get(self, request):
         """GET method - API information"""
-        system_status = chatbot_ai.get_system_status()
-        speech_status = speech_service.get_system_status()  # ← THÊM
+        health = health_monitor.get_snapshot()
+        system_status = health['system_status']
+        speech_status = health['speech_status']  # ← THÊM
         
         return Response({
             'message': 'Natural Language Chat API',
@@ -99,6 +115,11 @@ class ChatView(APIView):
     def post(self, request):
         """POST method - Process chat with personalization support"""
         start_time = time.time()
+        # ✅ THÊM: Deadline cho cả request, truyền qua mọi stage của pipeline
+        deadline = Deadline.for_chat_request()
+        # ✅ THÊM: AdmissionControlMiddleware báo quá tải -> bỏ Gemini, trả lời từ CSDL/cache
+        if getattr(request, 'load_shed', False):
+            deadline.shed('llm')
         
         try:
             # Get and validate input
@@ -108,9 +129,6 @@ class ChatView(APIView):
             # ✅ THÊM: Lấy user_id để personalization
             user_id = request.user.id if request.user.is_authenticated else None
             
-            print(f"🔍 CHAT DEBUG: user_id = {user_id}, session_id = {session_id}")
-            print(f"🔍 CHAT DEBUG: User message = {user_message}")
-            
             if not user_message:
                 return Response(
                     {'error': 'Tin nhắn không được để trống'}, 
@@ -134,21 +152,22 @@ class ChatView(APIView):
             if user_id and request.user.is_authenticated:
                 try:
                     user_context = request.user.get_chatbot_context()
-                    print(f"👤 USER CONTEXT: {user_context.get('role_description', 'Unknown')}")
                 except Exception as e:
                     logger.warning(f"Could not get user context: {e}")
             
-            logger.info(f"💬 Processing: {user_message[:50]}... (User: {user_context.get('faculty_code') if user_context else 'Anonymous'})")
+            # ✅ CHANGED: print()/INFO theo từng bước -> DEBUG lười; mỗi request chỉ 1 dòng INFO tóm tắt ở cuối
+            logger.debug("💬 Processing: %r (user_id=%s, session=%s, role=%s)", user_message[:50], user_id, session_id,
+                         user_context.get('role_description') if user_context else 'Anonymous')
             
             # ✅ THÊM: Process với user context
             if user_context:
                 # Sử dụng personalized processing
-                ai_response = self._process_with_personalization(user_message, session_id, user_context)
+                ai_response = self._process_with_personalization(user_message, session_id, user_context, deadline)
             else:
                 # Sử dụng processing thông thường
-                ai_response = chatbot_ai.process_query(user_message, session_id)
-            
-            print(f"🔍 CHAT DEBUG: AI response method = {ai_response.get('method', 'unknown')}")
+                ai_response = chatbot_ai.process_query(
+                    user_message, session_id, priority=resolve_priority(), deadline=deadline
+                )
             
             # ENSURE UTF-8 safe response
             response_text = ai_response['response']
@@ -163,26 +182,32 @@ class ChatView(APIView):
             processing_time = time.time() - start_time
             
             # Save chat history với user context
+            # ✅ CHANGED: Ghi qua write-behind buffer (bulk_create ở background), không chặn request
+            chat_id = None
             try:
-                chat_record = ChatHistory.objects.create(
-                    session_id=session_id,
-                    user_message=user_message,
-                    bot_response=response_text,
-                    confidence_score=ai_response.get('confidence', 0.7),
-                    response_time=processing_time,
-                    user_ip=get_client_ip(request),
-                    # ✅ THÊM: Lưu user context vào entities
-                    entities=json.dumps({
-                        'user_context': user_context,
-                        'personalized': bool(user_context)
-                    }) if user_context else None
-                )
-                logger.info(f"✅ Chat saved: {chat_record.id}")
+                with span('db_save'):
+                    chat_id = chat_history_writer.submit(
+                        session_id=session_id,
+                        user_message=user_message,
+                        bot_response=response_text,
+                        confidence_score=ai_response.get('confidence', 0.7),
+                        response_time=processing_time,
+                        user_ip=get_client_ip(request),
+                        intent=ai_response.get('intent', {}).get('intent'),
+                        method=(ai_response.get('method') or '')[:50] or None,
+                        # ✅ THÊM: Lưu user context vào entities
+                        entities=json.dumps({
+                            'user_context': user_context,
+                            'personalized': bool(user_context)
+                        }) if user_context else None
+                    )
+                logger.info("✅ Chat %s: method=%s, %.2fs, user=%s", chat_id, ai_response.get('method', 'unknown'),
+                            processing_time, user_context.get('faculty_code') if user_context else 'Anonymous')
             except Exception as e:
                 logger.error(f"Error saving chat: {str(e)}")
             
             # Return enhanced response
-            return Response({
+            response_data = {
                 'session_id': session_id,
                 'response': response_text,
                 'confidence': ai_response['confidence'],
@@ -192,6 +217,9 @@ class ChatView(APIView):
                 'response_time': processing_time,
                 'status': 'success',
                 'encoding': 'utf-8',
+                # ✅ THÊM: Các stage bị bỏ qua do hết thời gian
+                'skipped_stages': ai_response.get('skipped_stages', []),
+                'degraded': ai_response.get('degraded', False),
                 # ✅ THÊM: Personalization info
                 'personalized': bool(user_context),
                 'user_context': {
@@ -199,7 +227,18 @@ class ChatView(APIView):
                     'position': user_context.get('position_name') if user_context else None,
                     'faculty_code': user_context.get('faculty_code') if user_context else None
                 } if user_context else None
-            }, status=status.HTTP_200_OK)
+            }
+            # ✅ THÊM: chat_id dùng cho /api/feedback/ - không có nếu record không được lưu
+            if chat_id:
+                response_data['chat_id'] = chat_id
+            # ✅ THÊM: ?debug=timings -> thời gian từng stage (giống header Server-Timing)
+            trace = current_trace()
+            if trace is not None:
+                trace.root.attrs['query'] = user_message[:200]
+                trace.root.attrs['decision_type'] = ai_response.get('decision_type')
+                if request.query_params.get('debug') == 'timings':
+                    response_data['debug'] = {'timings': trace.timings()}
+            return Response(response_data, status=status.HTTP_200_OK)
             
         except Exception as e:
             logger.error(f"❌ Chat error: {str(e)}")
@@ -242,33 +281,22 @@ Cảm ơn {personal_address} đã kiên nhẫn! 😊"""
         return self._get_safe_fallback_response(user_message)
     
     # ✅ THÊM: Method mới để xử lý personalization
-    def _process_with_personalization(self, message, session_id, user_context):
+    def _process_with_personalization(self, message, session_id, user_context, deadline=None):
         """Process message với personalization"""
-        try:
-            # Sử dụng gemini service với personalization
-            from ai_models.gemini_service import GeminiResponseGenerator
-            
-            # Tạo enhanced context
-            enhanced_context = {
-                'user_context': user_context,
-                'force_education_response': True,
-                'personalized': True
-            }
-            
-            # Gọi generate_response_personalized nếu có
-            gemini_generator = GeminiResponseGenerator()
-            base_response = chatbot_ai.process_query(message, session_id)
+        # ✅ CHANGED: Dùng generator dùng chung của chatbot_ai (chung ConversationMemory,
+        # rate limiter) thay vì tạo GeminiResponseGenerator mới cho mỗi tin nhắn
+        base_response = chatbot_ai.process_query(
+            message, session_id, priority=resolve_priority(user_context), deadline=deadline
+        )
 
-            # Sau đó enhance với personalization
-            if hasattr(gemini_generator, 'enhance_with_personalization'):
+        # Sau đó enhance với personalization
+        gemini_generator = chatbot_ai.response_generator
+        if hasattr(gemini_generator, 'enhance_with_personalization'):
+            try:
                 return gemini_generator.enhance_with_personalization(base_response, user_context)
-            else:
-                return base_response
-                
-        except Exception as e:
-            logger.error(f"Personalized processing error: {e}")
-            # Fallback to regular processing
-            return chatbot_ai.process_query(message, session_id)
+            except Exception as e:
+                logger.error(f"Personalized processing error: {e}")
+        return base_response
     
     def _clean_response_text(self, text):
         """Clean and ensure safe UTF-8 text"""
@@ -332,9 +360,77 @@ Hiện tại hệ thống đang được cải thiện để phục vụ bạn t
 
 Cảm ơn bạn đã kiên nhẫn! 😊"""
 
+class ChatBatchView(APIView):
+    """✅ THÊM: Xử lý nhiều câu hỏi trong 1 request (vd. trả lời lại FAQ của khoa)"""
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [ChatBatchThrottle]  # ✅ THÊM: mỗi câu hỏi trong batch tính 1 token
+    
+    def post(self, request):
+        config = get_batch_config()
+        queries = request.data.get('queries')
+        
+        if not isinstance(queries, list) or not queries:
+            return Response(
+                {'error': 'queries phải là danh sách câu hỏi'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if len(queries) > config['MAX_ITEMS']:
+            return Response(
+                {'error': f"Tối đa {config['MAX_ITEMS']} câu hỏi mỗi batch"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if any(not isinstance(query, str) or len(query) > 1000 for query in queries):
+            return Response(
+                {'error': 'Mỗi câu hỏi phải là chuỗi (tối đa 1000 ký tự)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            max_concurrency = int(request.data.get('max_concurrency') or config['MAX_CONCURRENCY'])
+        except (TypeError, ValueError):
+            max_concurrency = config['MAX_CONCURRENCY']
+        max_concurrency = max(1, min(max_concurrency, config['MAX_CONCURRENCY']))
+        
+        logger.info(f"📦 Batch chat: {len(queries)} queries (user: {request.user.username})")
+        
+        try:
+            batch = chatbot_ai.process_batch(
+                queries, priority=resolve_priority(batch=True), max_concurrency=max_concurrency,
+                load_shed=getattr(request, 'load_shed', False)  # ✅ THÊM: AdmissionControlMiddleware
+            )
+        except Exception as e:
+            logger.error(f"Batch chat error: {str(e)}")
+            return Response(
+                {'error': 'Không thể xử lý batch'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        
+        return Response({
+            'count': batch['count'],
+            'unique_queries': batch['unique_queries'],
+            'timings': batch['timings'],
+            'results': [{
+                'index': item['index'],
+                'query': item['query'],
+                'response': item['response'],
+                'confidence': item.get('confidence', 0),
+                'method': item.get('method'),
+                'decision_type': item.get('decision_type'),
+                'intent': (item.get('intent') or {}).get('intent'),
+                'sources': item.get('sources', []),
+                'processing_time': round(item.get('processing_time', 0), 4),
+                'degraded': item.get('degraded', False),
+                'skipped_stages': item.get('skipped_stages', []),
+                'error': item.get('error')
+            } for item in batch['results']]
+        })
+
 class PersonalizedChatContextView(APIView):
     """Lấy context cá nhân hóa cho chat"""
     
+    @method_decorator(cache_response('personalized_context', vary_on_user=True))
     def get(self, request):
         """GET method - Lấy personalized context"""
         try:
@@ -380,9 +476,10 @@ class PersonalizedSystemStatusView(APIView):
     def get(self, request):
         """GET method - System status với personalization"""
         try:
-            # Lấy system status cơ bản
-            status_data = chatbot_ai.get_system_status()
-            speech_status = speech_service.get_system_status()
+            # Lấy system status cơ bản (từ cache của HealthMonitor)
+            health = health_monitor.get_snapshot()
+            status_data = dict(health['system_status'])
+            speech_status = health['speech_status']
             
             # Thêm thông tin personalization
             personalization_status = {
@@ -461,7 +558,9 @@ class SpeechToTextView(APIView):
     API endpoint for Speech-to-Text conversion
     Accepts audio file upload and returns transcribed text
     """
+    throttle_classes = [SpeechThrottle]  # ✅ THÊM: Whisper tốn vài giây CPU mỗi request
     
+    @method_decorator(cache_response('speech_info'))
     def get(self, request):
         """GET method - Service information"""
         speech_status = speech_service.get_system_status()
@@ -624,6 +723,7 @@ class SpeechStatusView(APIView):
     Get Speech-to-Text service status and capabilities
     """
     
+    @method_decorator(cache_response('speech_status'))
     def get(self, request):
         """GET method - Service status"""
         try:
@@ -665,13 +765,18 @@ class SpeechStatusView(APIView):
 class ChatHistoryView(APIView):
     def get(self, request, session_id=None):
         try:
+            # ✅ CHANGED: cursor pagination (?cursor=...&page_size=...) trên index (session_id, timestamp)
             if session_id:
-                history = ChatHistory.objects.filter(session_id=session_id).order_by('timestamp')
+                paginator = SessionHistoryCursorPagination()
+                queryset = ChatHistory.objects.filter(session_id=session_id)
             else:
-                history = ChatHistory.objects.all().order_by('-timestamp')[:50]
+                paginator = ChatHistoryCursorPagination()
+                queryset = ChatHistory.objects.all()
+            history = paginator.paginate_queryset(queryset, request, view=self)
             
             data = [{
                 'id': chat.id,
+                'chat_id': str(chat.chat_uuid),
                 'session_id': chat.session_id,
                 'user_message': chat.user_message,
                 'bot_response': chat.bot_response,
@@ -680,8 +785,24 @@ class ChatHistoryView(APIView):
                 'response_time': chat.response_time
             } for chat in history]
             
+            # ✅ THÊM: Lượt cũ đã archive luôn cũ hơn mọi dòng trong DB -> ghép vào đầu trang đầu tiên
+            if session_id and not request.query_params.get(paginator.cursor_query_param):
+                data = [{
+                    'id': record['id'],
+                    'chat_id': record['chat_uuid'],
+                    'session_id': record['session_id'],
+                    'user_message': record['user_message'],
+                    'bot_response': record['bot_response'],
+                    'timestamp': record['timestamp'],
+                    'confidence': record['confidence_score'],
+                    'response_time': record['response_time'],
+                    'archived': True
+                } for record in chat_archive.session_records(session_id)] + data
+            
             return Response({
                 'count': len(data),
+                'next': paginator.get_next_link(),
+                'previous': paginator.get_previous_link(),
                 'results': data
             })
             
@@ -706,12 +827,20 @@ class FeedbackView(APIView):
                 )
             
             try:
-                chat_history = ChatHistory.objects.get(id=chat_id)
-            except ChatHistory.DoesNotExist:
+                chat_history = self._get_chat_history(chat_id)
+            except (ChatHistory.DoesNotExist, ValueError):
                 return Response(
                     {'error': 'Không tìm thấy cuộc trò chuyện'}, 
                     status=status.HTTP_404_NOT_FOUND
                 )
+            if chat_history is None:
+                # ✅ THÊM: Record có thể còn trong write-behind buffer của worker khác -> client gửi lại
+                response = Response(
+                    {'error': 'Cuộc trò chuyện đang được lưu, vui lòng thử lại', 'retryable': True},
+                    status=status.HTTP_409_CONFLICT
+                )
+                response['Retry-After'] = '1'
+                return response
             
             feedback = UserFeedback.objects.create(
                 chat_history=chat_history,
@@ -731,23 +860,136 @@ class FeedbackView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    def _get_chat_history(self, chat_id):
+        """
+        chat_id là chat_uuid (trả về từ /api/chat/) hoặc id số (client cũ).
+        None: chat_uuid chưa có trong DB sau FEEDBACK_WAIT giây (có thể còn trong buffer của worker khác).
+        """
+        chat_id = str(chat_id)
+        if chat_id.isdigit():
+            return ChatHistory.objects.get(id=int(chat_id))
+        
+        chat_uuid = uuid.UUID(chat_id)
+        # Record có thể vẫn nằm trong write-behind buffer của worker này: ghi 1 batch, không xả cả buffer
+        if chat_history_writer.is_pending(chat_uuid):
+            chat_history_writer.flush(max_batches=1)
+        
+        deadline = time.monotonic() + get_history_writer_config().get('FEEDBACK_WAIT', 1.0)
+        while True:
+            chat_history = ChatHistory.objects.filter(chat_uuid=chat_uuid).first()
+            if chat_history is not None or time.monotonic() >= deadline:
+                return chat_history
+            time.sleep(0.2)
+
 class HealthCheckView(APIView):
     def get(self, request):
         try:
-            system_status = chatbot_ai.get_system_status()
-            speech_status = speech_service.get_system_status()  # ← THÊM
+            # ✅ Chỉ đọc snapshot đã cache - probe chạy ở background thread
+            health = health_monitor.get_snapshot()
             
             return Response({
-                'status': 'healthy',
+                'status': 'healthy' if health.get('ready') else health.get('status', 'starting'),
                 'message': 'Natural Language Chatbot with Speech-to-Text is running! 🚀',
-                'database': 'connected',
+                'database': 'connected' if health['components'].get('database', {}).get('available') else 'unknown',
                 'encoding': 'utf-8',
-                'system_status': system_status,
-                'speech_status': speech_status,  # ← THÊM
+                'system_status': health['system_status'],
+                'speech_status': health['speech_status'],  # ← THÊM
+                'components': health['components'],
+                'admission': admission_controller.get_stats(),  # ✅ THÊM: load shedding của worker này
+                'checked_at': health.get('checked_at'),
+                'stale': health.get('stale'),
                 'version': '3.1.0'  # ← Tăng version
             })
         except Exception as e:
             return Response({
                 'status': 'unhealthy',
                 'error': str(e)
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class SlowRequestsView(APIView):
+    """Trace của các request chậm gần đây (flight recorder) - chỉ staff"""
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            limit = 20
+        return Response({
+            'stats': slow_request_recorder.get_stats(),
+            'traces': slow_request_recorder.recent(limit),
+        })
+
+class ProfileListView(APIView):
+    """Danh sách profile gần đây (ProfilingMiddleware) - chỉ staff"""
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 50))
+        except ValueError:
+            limit = 50
+        return Response({
+            'stats': request_profiler.stats,
+            'profiles': request_profiler.list_profiles(limit),
+        })
+
+class ProfileDetailView(APIView):
+    """Metadata + top hàm của 1 profile; ?download=1 trả file .prof (snakeviz / python -m pstats)"""
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request, profile_id):
+        if request.query_params.get('download'):
+            path = request_profiler.profile_path(profile_id)
+            if path is None:
+                return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+            return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)
+        
+        profile = request_profiler.get_profile(profile_id)
+        if profile is None:
+            return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(profile)
+
+class MetricsView(APIView):
+    """Prometheus scrape endpoint - Bearer METRICS['TOKEN'] hoặc staff (DEBUG + chưa đặt token: mở)"""
+    permission_classes = []
+    
+    def get(self, request):
+        token = get_metrics_config()['TOKEN']
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        if token:
+            allowed = hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+        else:
+            allowed = settings.DEBUG
+        if not allowed and not request.user.is_staff:
+            return Response({'error': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
+        
+        return HttpResponse(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+class LivenessView(APIView):
+    """Liveness probe - process còn phục vụ request, không chạm tới dependency nào"""
+    authentication_classes = []
+    permission_classes = []
+    
+    def get(self, request):
+        return Response({'status': 'alive'})
+
+class ReadinessView(APIView):
+    """Readiness probe - dựa trên snapshot cache của HealthMonitor"""
+    authentication_classes = []
+    permission_classes = []
+    
+    def get(self, request):
+        health = health_monitor.get_snapshot()
+        ready = bool(health.get('ready')) and not health.get('stale')
+        
+        return Response({
+            'status': 'ready' if ready else 'not_ready',
+            'components': {
+                name: component.get('available', False)
+                for name, component in health['components'].items()
+            },
+            'checked_at': health.get('checked_at'),
+            'age': health.get('age'),
+            'stale': health.get('stale')
+        }, status=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE)
@@ -22,6 +22,7 @@ django.setup()
 
 # Import your chatbot services
 from ai_models.services import HybridChatbotAI  # Fixed: ai_models instead of ai_services
+from ai_models.llm_limiter import PRIORITY_BATCH
 
 class ChatBotTester:
     """Comprehensive Testing Suite for ChatBot"""
@@ -204,47 +205,9 @@ class ChatBotTester:
                 return result
             
             # Get chatbot response
-            response_data = self.chatbot.process_query(query, session_id=self.session_id)
+            response_data = self.chatbot.process_query(query, session_id=self.session_id, priority=PRIORITY_BATCH)
             
-            # Analyze response
-            analysis = self.analyze_response(query, response_data)
-            
-            # Categorize query
-            detected_category = self.categorize_query(query)
-            
-            # Check if query should be education-related
-            is_education_query = self.chatbot.decision_engine.is_education_related(query)
-            
-            result = {
-                'query': query,
-                'expected_category': expected_category or detected_category,
-                'detected_category': detected_category,
-                'is_education_query': is_education_query,
-                'response': response_data.get('response', ''),
-                'confidence': response_data.get('confidence', 0),
-                'method': response_data.get('method', ''),
-                'decision_type': response_data.get('decision_type', ''),
-                'processing_time': time.time() - start_time,
-                'analysis': analysis,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            # ✅ CLASSIFY SUCCESS/FAILURE
-            if analysis['response_type'] == 'rejected' and is_education_query:
-                result['test_result'] = 'FAILED - Education query was rejected'
-                self.failed_queries.append(result)
-            elif analysis['response_type'] == 'answered' and not is_education_query:
-                result['test_result'] = 'WARNING - Non-education query was answered'
-            elif analysis['response_type'] == 'unknown':
-                result['test_result'] = 'FAILED - Unknown response type'
-                self.failed_queries.append(result)
-            else:
-                result['test_result'] = 'PASSED'
-            
-            print(f"   📊 Result: {result['test_result']}")
-            print(f"   📈 Confidence: {result['confidence']:.3f}")
-            print(f"   🤖 Response Type: {analysis['response_type']}")
-            print(f"   ⚡ Time: {result['processing_time']:.3f}s")
+            result = self._evaluate_response(query, expected_category, response_data, time.time() - start_time)
             
         except Exception as e:
             result = {
@@ -259,7 +222,64 @@ class ChatBotTester:
         self.test_results.append(result)
         return result
     
-    def run_comprehensive_test(self, csv_path=None, output_dir='test_results'):
+    def _evaluate_response(self, query, expected_category, response_data, processing_time):
+        """Phân tích + phân loại PASSED/FAILED cho 1 câu trả lời"""
+        # Analyze response
+        analysis = self.analyze_response(query, response_data)
+        
+        # Categorize query
+        detected_category = self.categorize_query(query)
+        
+        # Check if query should be education-related
+        is_education_query = self.chatbot.decision_engine.is_education_related(query)
+        
+        result = {
+            'query': query,
+            'expected_category': expected_category or detected_category,
+            'detected_category': detected_category,
+            'is_education_query': is_education_query,
+            'response': response_data.get('response', ''),
+            'confidence': response_data.get('confidence', 0),
+            'method': response_data.get('method', ''),
+            'decision_type': response_data.get('decision_type', ''),
+            'processing_time': processing_time,
+            'analysis': analysis,
+            'timestamp': datetime.now().isoformat()
+        }
+        
+        # ✅ CLASSIFY SUCCESS/FAILURE
+        if analysis['response_type'] == 'rejected' and is_education_query:
+            result['test_result'] = 'FAILED - Education query was rejected'
+            self.failed_queries.append(result)
+        elif analysis['response_type'] == 'answered' and not is_education_query:
+            result['test_result'] = 'WARNING - Non-education query was answered'
+        elif analysis['response_type'] == 'unknown':
+            result['test_result'] = 'FAILED - Unknown response type'
+            self.failed_queries.append(result)
+        else:
+            result['test_result'] = 'PASSED'
+        
+        print(f"   📊 Result: {result['test_result']}")
+        print(f"   📈 Confidence: {result['confidence']:.3f}")
+        print(f"   🤖 Response Type: {analysis['response_type']}")
+        print(f"   ⚡ Time: {result['processing_time']:.3f}s")
+        return result
+    
+    def test_batch(self, queries, categories):
+        """✅ THÊM: Test nhiều câu qua process_batch (không dùng memory của session)"""
+        valid = [(query, category) for query, category in zip(queries, categories) if query and query.strip()]
+        if not valid:
+            return
+        
+        batch = self.chatbot.process_batch([query for query, _ in valid], priority=PRIORITY_BATCH)
+        print(f"\n📦 Batch of {batch['count']} ({batch['unique_queries']} unique): {batch['timings']}")
+        
+        for (query, category), response_data in zip(valid, batch['results']):
+            print(f"\n🔍 Testing: '{query[:50]}{'...' if len(query) > 50 else ''}'")
+            result = self._evaluate_response(query, category, response_data, response_data.get('processing_time', 0))
+            self.test_results.append(result)
+    
+    def run_comprehensive_test(self, csv_path=None, output_dir='test_results', batch_size=None):
         """Run comprehensive test suite"""
         print("🚀 Starting Comprehensive ChatBot Test...")
         
@@ -271,6 +291,14 @@ class ChatBotTester:
         
         print(f"📝 Loaded {len(test_queries)} test queries")
         
+        # ✅ THÊM: --batch N -> mỗi lần gửi N câu qua process_batch
+        if batch_size:
+            for start in range(0, len(test_queries), batch_size):
+                self.test_batch(test_queries[start:start + batch_size], categories[start:start + batch_size])
+            self.generate_comprehensive_report(output_dir)
+            print(f"\n✅ Test completed! Results saved to {output_dir}/")
+            return
+        
         # Run tests
         for i, (query, expected, category) in enumerate(zip(test_queries, expected_answers, categories)):
             print(f"\n[{i+1}/{len(test_queries)}]", end="")
@@ -460,7 +488,7 @@ class ChatBotTester:
         
         for i, query in enumerate(queries):
             print(f"\n[Memory Test {i+1}] {query}")
-            result = self.chatbot.process_query(query, session_id=memory_test_session)
+            result = self.chatbot.process_query(query, session_id=memory_test_session, priority=PRIORITY_BATCH)
             
             print(f"Response: {result['response'][:100]}...")
             print(f"Decision: {result.get('decision_type', 'unknown')}")
@@ -497,6 +525,7 @@ def main():
     parser.add_argument('--output', default='test_results', help='Output directory for results')
     parser.add_argument('--category', help='Test specific category only')
     parser.add_argument('--memory', action='store_true', help='Test memory functionality')
+    parser.add_argument('--batch', type=int, help='Process N queries per process_batch call')
     
     args = parser.parse_args()
     
@@ -507,7 +536,7 @@ def main():
     elif args.category:
         tester.run_specific_category_test(args.category)
     else:
-        tester.run_comprehensive_test(csv_path=args.csv, output_dir=args.output)
+        tester.run_comprehensive_test(csv_path=args.csv, output_dir=args.output, batch_size=args.batch)
 
 
 if __name__ == "__main__":
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import KnowledgeBase, ChatHistory, UserFeedback
+from .models import KnowledgeBase, ChatHistory, UserFeedback, ChatStatsRollup
 
 @admin.register(KnowledgeBase)
 class KnowledgeBaseAdmin(admin.ModelAdmin):
@@ -18,6 +18,8 @@ class ChatHistoryAdmin(admin.ModelAdmin):
     list_filter = ['timestamp', 'confidence_score']
     search_fields = ['session_id', 'user_message', 'bot_response']
     readonly_fields = ['timestamp']
+    # Bảng lớn: bỏ COUNT(*) toàn bảng khi lọc/tìm kiếm
+    show_full_result_count = False
     
     def user_message_short(self, obj):
         return obj.user_message[:30] + "..." if len(obj.user_message) > 30 else obj.user_message
@@ -26,4 +28,13 @@ class ChatHistoryAdmin(admin.ModelAdmin):
 @admin.register(UserFeedback)
 class UserFeedbackAdmin(admin.ModelAdmin):
     list_display = ['feedback_type', 'chat_history', 'created_at']
-    list_filter = ['feedback_type', 'created_at']
\ No newline at end of file
+    list_filter = ['feedback_type', 'created_at']
+
+
+@admin.register(ChatStatsRollup)
+class ChatStatsRollupAdmin(admin.ModelAdmin):
+    list_display = ['period', 'bucket_start', 'chat_count', 'updated_at']
+    list_filter = ['period']
+    date_hierarchy = 'bucket_start'
+    readonly_fields = ['period', 'bucket_start', 'chat_count', 'confidence_sum', 'response_time_sum',
+                       'latency_histogram', 'method_counts', 'intent_counts', 'updated_at']
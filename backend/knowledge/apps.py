@@ -3,4 +3,27 @@ from django.apps import AppConfig
 class KnowledgeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'knowledge'
-    verbose_name = 'Cơ sở tri thức'
\ No newline at end of file
+    verbose_name = 'Cơ sở tri thức'
+
+    def ready(self):
+        # ✅ THÊM: PRAGMA cho connection SQLite (profile 'sqlite' trong backend/db_profiles.py)
+        from backend.db_profiles import install_connection_hooks
+        install_connection_hooks()
+        
+        # ✅ THÊM: Cập nhật rollup thống kê mỗi khi 1 batch ChatHistory được ghi
+        from .history_writer import chat_history_writer
+        from .rollups import record_chats
+        chat_history_writer.add_flush_listener(record_chats)
+        
+        # ✅ THÊM: KnowledgeBase thay đổi -> bỏ response cache của các endpoint knowledge
+        from django.db.models.signals import post_delete, post_save
+        from backend.http_cache import response_cache
+        from .models import KnowledgeBase
+
+        def _invalidate_knowledge(sender, **kwargs):
+            response_cache.invalidate('knowledge')
+
+        post_save.connect(_invalidate_knowledge, sender=KnowledgeBase, weak=False,
+                          dispatch_uid='knowledge.http_cache.save')
+        post_delete.connect(_invalidate_knowledge, sender=KnowledgeBase, weak=False,
+                            dispatch_uid='knowledge.http_cache.delete')
@@ -0,0 +1,281 @@
+# knowledge/archive.py
+
+import gzip
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ChatHistory
+
+# fcntl chỉ có trên Unix - trên Windows không khoá chống chạy chồng
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+def get_archive_config() -> Dict[str, Any]:
+    config = dict(getattr(settings, 'CHAT_HISTORY_ARCHIVE', {}))
+    config.setdefault('DIR', os.path.join(settings.BASE_DIR, 'data', 'chat_archive'))
+    config.setdefault('RETENTION_DAYS', 90)
+    config.setdefault('BATCH_SIZE', 5000)
+    return config
+
+
+def _record_from_chat(chat: ChatHistory) -> Dict[str, Any]:
+    return {
+        'id': chat.id,
+        'chat_uuid': str(chat.chat_uuid),
+        'session_id': chat.session_id,
+        'user_message': chat.user_message,
+        'bot_response': chat.bot_response,
+        'confidence_score': chat.confidence_score,
+        'response_time': chat.response_time,
+        'timestamp': chat.timestamp.isoformat(),
+        'user_ip': chat.user_ip,
+        'intent': chat.intent,
+        'method': chat.method,
+        'strategy': chat.strategy,
+        'entities': chat.entities,
+        # UserFeedback bị xoá theo (CASCADE) nên lưu kèm record
+        'feedbacks': [
+            {
+                'feedback_type': feedback.feedback_type,
+                'comment': feedback.comment,
+                'created_at': feedback.created_at.isoformat(),
+            }
+            for feedback in chat.feedbacks.all()
+        ],
+    }
+
+
+def chat_from_record(record: Dict[str, Any]) -> ChatHistory:
+    """Dựng ChatHistory (chưa lưu) từ record archive - dùng cho rollup/analytics"""
+    return ChatHistory(
+        id=record['id'],
+        chat_uuid=uuid.UUID(record['chat_uuid']),
+        session_id=record['session_id'],
+        user_message=record['user_message'],
+        bot_response=record['bot_response'],
+        confidence_score=record['confidence_score'],
+        response_time=record['response_time'],
+        timestamp=datetime.fromisoformat(record['timestamp']),
+        user_ip=record['user_ip'],
+        intent=record['intent'],
+        method=record['method'],
+        strategy=record['strategy'],
+        entities=record['entities'],
+    )
+
+
+class ChatHistoryArchive:
+    """
+    Lưu trữ ChatHistory cũ ra file JSONL.gz chia partition theo ngày:
+
+        <DIR>/manifest.json
+        <DIR>/date=YYYY-MM-DD/part-<run>.jsonl.gz
+
+    manifest.json liệt kê mọi file (số dòng, khoảng thời gian, các session_id)
+    để đọc lại lịch sử 1 session mà không phải quét toàn bộ archive.
+    """
+
+    def __init__(self, root: str, retention_days: int = 90, batch_size: int = 5000):
+        self.root = str(root)
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._manifest_cache = None  # (mtime, manifest, session_index)
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.root, 'manifest.json')
+
+    # ---------- manifest ----------
+
+    def load_manifest(self) -> Dict[str, Any]:
+        return self._load()[0]
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return {'version': MANIFEST_VERSION, 'files': []}, {}
+
+        with self._lock:
+            if self._manifest_cache and self._manifest_cache[0] == mtime:
+                return self._manifest_cache[1], self._manifest_cache[2]
+
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            session_index = defaultdict(list)
+            for entry in manifest['files']:
+                for session_id in entry['sessions']:
+                    session_index[session_id].append(entry['path'])
+            self._manifest_cache = (mtime, manifest, session_index)
+            return manifest, session_index
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        tmp_path = f'{self.manifest_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+    @contextmanager
+    def _exclusive(self):
+        """Chặn 2 lần archive chạy chồng (cron + chạy tay, nhiều worker)"""
+        os.makedirs(self.root, exist_ok=True)
+        if not FCNTL_AVAILABLE:
+            yield
+            return
+        with open(os.path.join(self.root, '.archive.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    # ---------- ghi ----------
+
+    def _write_partition(self, day: date, run_id: str, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        relative = os.path.join(f'date={day.isoformat()}', f'part-{run_id}.jsonl.gz')
+        path = os.path.join(self.root, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp_path = f'{path}.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False))
+                f.write('\n')
+        os.replace(tmp_path, path)
+
+        return {
+            'path': relative,
+            'date': day.isoformat(),
+            'rows': len(records),
+            'min_timestamp': records[0]['timestamp'],
+            'max_timestamp': records[-1]['timestamp'],
+            'sessions': sorted({record['session_id'] for record in records}),
+        }
+
+    def archive(self, older_than_days: Optional[int] = None, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Chuyển các dòng cũ hơn N ngày ra archive rồi xoá khỏi chat_history.
+        File + manifest được ghi xong (atomic rename) trước khi xoá dòng trong DB.
+        """
+        days = self.retention_days if older_than_days is None else older_than_days
+        cutoff = timezone.now() - timedelta(days=days)
+        queryset = ChatHistory.objects.filter(timestamp__lt=cutoff)
+        result = {'cutoff': cutoff.isoformat(), 'archived': 0, 'files': 0}
+
+        if dry_run:
+            result['archived'] = queryset.count()
+            return result
+
+        with self._exclusive():
+            run_id = timezone.now().strftime('%Y%m%dT%H%M%S')
+            batch_number = 0
+            while True:
+                chats = list(
+                    queryset.order_by('timestamp', 'id').prefetch_related('feedbacks')[:self.batch_size]
+                )
+                if not chats:
+                    break
+
+                partitions = defaultdict(list)
+                for chat in chats:
+                    partitions[timezone.localtime(chat.timestamp).date()].append(_record_from_chat(chat))
+
+                current = self.load_manifest()
+                manifest = {'version': MANIFEST_VERSION, 'files': list(current['files'])}
+                for day, records in sorted(partitions.items()):
+                    manifest['files'].append(
+                        self._write_partition(day, f'{run_id}-{batch_number:04d}', records)
+                    )
+                self._write_manifest(manifest)
+
+                with transaction.atomic():
+                    ChatHistory.objects.filter(id__in=[chat.id for chat in chats]).delete()
+
+                result['archived'] += len(chats)
+                result['files'] += len(partitions)
+                batch_number += 1
+                logger.info(f"🗄️ Archived {len(chats)} chat records into {len(partitions)} partition(s)")
+
+        return result
+
+    # ---------- đọc ----------
+
+    def _read_file(self, relative: str) -> Iterator[Dict[str, Any]]:
+        with gzip.open(os.path.join(self.root, relative), 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def iter_records(self, start: Optional[date] = None, end: Optional[date] = None) -> Iterator[Dict[str, Any]]:
+        """Quét archive theo partition ngày [start, end] (cho analytics / rebuild rollup)"""
+        seen = set()
+        for entry in self.load_manifest()['files']:
+            day = date.fromisoformat(entry['date'])
+            if (start and day < start) or (end and day > end):
+                continue
+            for record in self._read_file(entry['path']):
+                # Chạy lại sau khi ghi file mà chưa kịp xoá DB có thể tạo bản trùng
+                if record['chat_uuid'] in seen:
+                    continue
+                seen.add(record['chat_uuid'])
+                yield record
+
+    def has_session(self, session_id: str) -> bool:
+        return session_id in self._load()[1]
+
+    def session_records(self, session_id: str) -> List[Dict[str, Any]]:
+        """Các lượt đã archive của 1 session, cũ -> mới"""
+        paths = self._load()[1].get(session_id)
+        if not paths:
+            return []
+
+        records = {}
+        for relative in paths:
+            for record in self._read_file(relative):
+                if record['session_id'] == session_id:
+                    records[record['chat_uuid']] = record
+        return sorted(records.values(), key=lambda record: (record['timestamp'], record['id']))
+
+    def get_stats(self) -> Dict[str, Any]:
+        manifest, session_index = self._load()
+        return {
+            'files': len(manifest['files']),
+            'rows': sum(entry['rows'] for entry in manifest['files']),
+            'sessions': len(session_index),
+            'retention_days': self.retention_days,
+        }
+
+
+def _build_archive() -> ChatHistoryArchive:
+    config = get_archive_config()
+    return ChatHistoryArchive(
+        root=config['DIR'],
+        retention_days=config['RETENTION_DAYS'],
+        batch_size=config['BATCH_SIZE'],
+    )
+
+
+# Global archive instance
+chat_archive = _build_archive()
@@ -0,0 +1,223 @@
+# knowledge/history_writer.py
+
+import atexit
+import logging
+import threading
+import uuid
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import OperationalError, close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+def get_history_writer_config() -> Dict[str, Any]:
+    return getattr(settings, 'CHAT_HISTORY_WRITER', {})
+
+
+class ChatHistoryWriter:
+    """
+    Write-behind buffer cho ChatHistory: request path chỉ append vào buffer,
+    thread nền ghi theo batch bằng bulk_create khi đủ MAX_BATCH record hoặc
+    sau FLUSH_INTERVAL giây, và flush nốt lúc tắt process.
+
+    Backpressure: buffer đầy (MAX_BUFFER) thì bỏ record mới và đếm lại thay vì
+    chặn request; DB bị lock thì lùi thời gian flush (exponential backoff).
+    bulk_create lỗi vì dữ liệu thì ghi lại từng record, chỉ bỏ record lỗi.
+    """
+
+    def __init__(self, enabled: bool = True, max_batch: int = 50, flush_interval: float = 1.0,
+                 max_buffer: int = 5000, max_backoff: float = 30.0):
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.max_backoff = max_backoff
+
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._backoff = 0.0
+        self._flush_listeners = []
+
+        self.stats = {'submitted': 0, 'written': 0, 'dropped': 0, 'batches': 0,
+                      'lock_retries': 0, 'errors': 0, 'listener_errors': 0}
+
+    def start(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='chat-history-writer', daemon=True)
+            self._thread.start()
+        atexit.register(self.shutdown)
+        logger.info(f"📝 ChatHistory writer started (batch={self.max_batch}, interval={self.flush_interval}s)")
+
+    def add_flush_listener(self, listener):
+        """listener(records) được gọi sau mỗi batch ghi thành công (vd. cập nhật rollup)"""
+        if listener not in self._flush_listeners:
+            self._flush_listeners.append(listener)
+
+    def _notify(self, records):
+        for listener in self._flush_listeners:
+            try:
+                listener(records)
+            except Exception as e:
+                self.stats['listener_errors'] += 1
+                logger.error(f"📝 ChatHistory flush listener {getattr(listener, '__name__', listener)} failed: {e}")
+
+    def submit(self, **fields) -> Optional[str]:
+        """
+        Đưa 1 record vào buffer, trả về chat_uuid (dùng làm chat_id cho client).
+        None nếu record bị bỏ do buffer đầy - không có bản ghi nào để gửi feedback.
+        """
+        from .models import ChatHistory
+
+        fields.setdefault('chat_uuid', uuid.uuid4())
+        record = ChatHistory(**fields)
+
+        if not self.enabled:
+            record.save()
+            self._notify([record])
+            return str(record.chat_uuid)
+
+        self.start()
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self.stats['dropped'] += 1
+                dropped = True
+            else:
+                self._buffer.append(record)
+                self.stats['submitted'] += 1
+                dropped = False
+                should_wake = len(self._buffer) >= self.max_batch
+
+        if dropped:
+            logger.warning(f"📝 ChatHistory buffer full ({self.max_buffer}), dropping record")
+            return None
+        if should_wake:
+            self._wakeup.set()
+        return str(record.chat_uuid)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._buffer)
+
+    def is_pending(self, chat_uuid) -> bool:
+        chat_uuid = str(chat_uuid)
+        with self._lock:
+            return any(str(record.chat_uuid) == chat_uuid for record in self._buffer)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval + self._backoff)
+            self._wakeup.clear()
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception as e:
+                logger.error(f"ChatHistory writer loop error: {e}")
+
+    def flush(self, max_batches: Optional[int] = None) -> int:
+        """Ghi các record trong buffer xuống DB theo batch; trả về số record đã ghi"""
+        written = 0
+        batches = 0
+        with self._flush_lock:
+            while max_batches is None or batches < max_batches:
+                with self._lock:
+                    batch = [self._buffer.popleft() for _ in range(min(self.max_batch, len(self._buffer)))]
+                if not batch:
+                    break
+
+                saved = self._write_batch(batch)
+                if saved is None:
+                    break
+                written += len(saved)
+                batches += 1
+        return written
+
+    def _defer(self, records: List[Any], error: Exception):
+        """SQLite "database is locked": trả record về đầu buffer, lùi lần flush sau"""
+        with self._lock:
+            self._buffer.extendleft(reversed(records))
+        self.stats['lock_retries'] += 1
+        self._backoff = min(self.max_backoff, (self._backoff * 2) or self.flush_interval)
+        logger.warning(f"📝 ChatHistory flush deferred {self._backoff:.1f}s: {error}")
+
+    def _write_batch(self, batch: List[Any]) -> Optional[List[Any]]:
+        """Trả về các record đã ghi, None nếu DB bị lock (batch đã được trả về buffer)"""
+        from .models import ChatHistory
+        try:
+            ChatHistory.objects.bulk_create(batch)
+            saved = batch
+        except OperationalError as e:
+            self._defer(batch, e)
+            return None
+        except Exception as e:
+            # 1 record hỏng (intent quá dài, uuid sai...) không được kéo cả batch theo
+            logger.warning(f"📝 ChatHistory bulk insert of {len(batch)} failed ({e}), retrying one by one")
+            saved = self._write_individually(batch)
+            if saved is None:
+                return None
+
+        self._backoff = 0.0
+        self.stats['written'] += len(saved)
+        self.stats['batches'] += 1
+        if saved:
+            self._notify(saved)
+        return saved
+
+    def _write_individually(self, batch: List[Any]) -> Optional[List[Any]]:
+        saved = []
+        for index, record in enumerate(batch):
+            try:
+                record.save(force_insert=True)
+            except OperationalError as e:
+                if saved:
+                    self.stats['written'] += len(saved)
+                    self._notify(saved)
+                self._defer(batch[index:], e)
+                return None
+            except Exception as e:
+                self.stats['errors'] += 1
+                self.stats['dropped'] += 1
+                logger.error(f"📝 ChatHistory record {record.chat_uuid} dropped: {e}")
+            else:
+                saved.append(record)
+        return saved
+
+    def shutdown(self):
+        """Flush toàn bộ buffer lúc tắt process"""
+        remaining = self.pending()
+        if not remaining:
+            return
+        written = self.flush()
+        logger.info(f"📝 ChatHistory writer shutdown: flushed {written}/{remaining} pending records")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'pending': self.pending(),
+            'backoff': self._backoff,
+            **self.stats,
+        }
+
+
+def _build_history_writer() -> ChatHistoryWriter:
+    config = get_history_writer_config()
+    return ChatHistoryWriter(
+        enabled=config.get('ENABLED', True),
+        max_batch=config.get('MAX_BATCH', 50),
+        flush_interval=config.get('FLUSH_INTERVAL', 1.0),
+        max_buffer=config.get('MAX_BUFFER', 5000),
+        max_backoff=config.get('MAX_BACKOFF', 30.0),
+    )
+
+
+# Global writer instance
+chat_history_writer = _build_history_writer()
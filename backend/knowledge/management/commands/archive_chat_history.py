@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from knowledge.archive import chat_archive
+
+
+class Command(BaseCommand):
+    help = 'Chuyển ChatHistory cũ ra file JSONL.gz theo ngày (chạy định kỳ bằng cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=None,
+                            help=f'Số ngày giữ lại trong DB (mặc định {chat_archive.retention_days})')
+        parser.add_argument('--dry-run', action='store_true', help='Chỉ đếm số dòng sẽ được archive')
+        parser.add_argument('--vacuum', action='store_true', help='VACUUM SQLite sau khi xoá để thu hồi dung lượng')
+
+    def handle(self, *args, **options):
+        try:
+            result = chat_archive.archive(older_than_days=options['older_than'], dry_run=options['dry_run'])
+        except BlockingIOError:
+            raise CommandError('Another archive run is in progress')
+
+        if options['dry_run']:
+            self.stdout.write(f"{result['archived']} chat records older than {result['cutoff']} would be archived")
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {result['archived']} chat records into {result['files']} file(s) under {chat_archive.root}"
+        ))
+
+        if options['vacuum'] and result['archived'] and connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM')
+            self.stdout.write('SQLite database vacuumed')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from knowledge.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Tính lại bảng thống kê chat (ChatStatsRollup) từ chat_history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--skip-archive', action='store_true', help='Không quét các file archive')
+
+    def handle(self, *args, **options):
+        scanned = rebuild_rollups(
+            chunk_size=options['chunk_size'], include_archive=not options['skip_archive']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt chat stats rollups from {scanned} chat records'))
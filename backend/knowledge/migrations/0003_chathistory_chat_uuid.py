@@ -0,0 +1,36 @@
+import uuid
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def populate_chat_uuid(apps, schema_editor):
+    ChatHistory = apps.get_model('knowledge', 'ChatHistory')
+    for chat in ChatHistory.objects.filter(chat_uuid__isnull=True).only('id').iterator():
+        ChatHistory.objects.filter(id=chat.id).update(chat_uuid=uuid.uuid4())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0002_chathistory_entities_chathistory_intent_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chathistory',
+            name='chat_uuid',
+            field=models.UUIDField(editable=False, null=True, verbose_name='Chat ID'),
+        ),
+        migrations.RunPython(populate_chat_uuid, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='chathistory',
+            name='chat_uuid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True, verbose_name='Chat ID'),
+        ),
+        migrations.AlterField(
+            model_name='chathistory',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Thời gian'),
+        ),
+    ]
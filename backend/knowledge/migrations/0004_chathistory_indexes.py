@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-19 04:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0003_chathistory_chat_uuid'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chathistory',
+            index=models.Index(fields=['session_id', 'timestamp'], name='chat_history_session_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chathistory',
+            index=models.Index(fields=['timestamp'], name='chat_history_ts_idx'),
+        ),
+    ]
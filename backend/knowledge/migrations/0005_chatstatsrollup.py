@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-19 04:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0004_chathistory_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatStatsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Giờ'), ('day', 'Ngày'), ('total', 'Toàn bộ')], max_length=10)),
+                ('bucket_start', models.DateTimeField(verbose_name='Bắt đầu')),
+                ('chat_count', models.PositiveIntegerField(default=0, verbose_name='Số lượt chat')),
+                ('confidence_sum', models.FloatField(default=0.0)),
+                ('response_time_sum', models.FloatField(default=0.0)),
+                ('latency_histogram', models.JSONField(default=list)),
+                ('method_counts', models.JSONField(default=dict)),
+                ('intent_counts', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Thống kê chat',
+                'verbose_name_plural': 'Thống kê chat',
+                'db_table': 'chat_stats_rollup',
+                'ordering': ['period', 'bucket_start'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='chatstatsrollup',
+            constraint=models.UniqueConstraint(fields=('period', 'bucket_start'), name='chat_stats_rollup_bucket_uniq'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-19 12:30
+
+from django.db import migrations
+
+
+def backfill_rollups(apps, schema_editor):
+    """Dựng rollup từ chat_history (+ archive) có sẵn - không thì thống kê về 0 sau khi deploy"""
+    from knowledge.rollups import rebuild_rollups
+    rebuild_rollups(
+        chat_model=apps.get_model('knowledge', 'ChatHistory'),
+        rollup_model=apps.get_model('knowledge', 'ChatStatsRollup'),
+    )
+
+
+def clear_rollups(apps, schema_editor):
+    apps.get_model('knowledge', 'ChatStatsRollup').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0005_chatstatsrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, clear_rollups),
+    ]
@@ -1,3 +1,4 @@
+import uuid
 from django.db import models
 from django.utils import timezone
 
@@ -20,12 +21,15 @@ class KnowledgeBase(models.Model):
         return f"Q: {self.question[:50]}..."
 
 class ChatHistory(models.Model):
+    # ✅ THÊM: ID công khai trả về cho client ngay khi trả lời (row được ghi theo batch, chưa có pk)
+    chat_uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False, verbose_name="Chat ID")
     session_id = models.CharField(max_length=100, verbose_name="ID phiên")
     user_message = models.TextField(verbose_name="Tin nhắn người dùng")
     bot_response = models.TextField(verbose_name="Phản hồi bot")
     confidence_score = models.FloatField(default=0.0, verbose_name="Điểm tin cậy")
     response_time = models.FloatField(default=0.0, verbose_name="Thời gian phản hồi (s)")
-    timestamp = models.DateTimeField(auto_now_add=True, verbose_name="Thời gian")
+    # Thời điểm của lượt chat (gán lúc request, không phải lúc batch được ghi xuống DB)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False, verbose_name="Thời gian")
     user_ip = models.GenericIPAddressField(null=True, blank=True, verbose_name="IP người dùng")
     intent = models.CharField(max_length=50, blank=True, null=True, help_text="Detected intent")
     method = models.CharField(max_length=50, blank=True, null=True, help_text="Response generation method")
@@ -38,6 +42,11 @@ class ChatHistory(models.Model):
         verbose_name = "Lịch sử chat"
         verbose_name_plural = "Lịch sử chat"
         ordering = ['-timestamp']
+        # ✅ THÊM: history API/admin lọc theo session và sắp theo thời gian
+        indexes = [
+            models.Index(fields=['session_id', 'timestamp'], name='chat_history_session_ts_idx'),
+            models.Index(fields=['timestamp'], name='chat_history_ts_idx'),
+        ]
         
     
     def __str__(self):
@@ -62,3 +71,34 @@ class UserFeedback(models.Model):
     
     def __str__(self):
         return f"{self.feedback_type} - {self.created_at}"
+
+class ChatStatsRollup(models.Model):
+    """Thống kê chat cộng dồn theo giờ/ngày (cập nhật khi ChatHistory được ghi)"""
+    PERIOD_CHOICES = [
+        ('hour', 'Giờ'),
+        ('day', 'Ngày'),
+        ('total', 'Toàn bộ'),
+    ]
+    
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    bucket_start = models.DateTimeField(verbose_name="Bắt đầu")
+    chat_count = models.PositiveIntegerField(default=0, verbose_name="Số lượt chat")
+    confidence_sum = models.FloatField(default=0.0)
+    response_time_sum = models.FloatField(default=0.0)
+    # Số lượt theo bucket của knowledge.rollups.LATENCY_BUCKETS
+    latency_histogram = models.JSONField(default=list)
+    method_counts = models.JSONField(default=dict)
+    intent_counts = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'chat_stats_rollup'
+        verbose_name = "Thống kê chat"
+        verbose_name_plural = "Thống kê chat"
+        ordering = ['period', 'bucket_start']
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket_start'], name='chat_stats_rollup_bucket_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.period} {self.bucket_start} - {self.chat_count}"
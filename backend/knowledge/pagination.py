@@ -0,0 +1,21 @@
+# knowledge/pagination.py
+
+from rest_framework.pagination import CursorPagination
+
+
+class ChatHistoryCursorPagination(CursorPagination):
+    """
+    Keyset pagination cho lịch sử chat: mỗi trang là 1 range scan trên index
+    (session_id, timestamp) / (timestamp), không OFFSET và không COUNT(*)
+    trên toàn bảng như PageNumberPagination.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    # id để phân định các lượt cùng timestamp (SQLite: rowid đã nằm sẵn trong index)
+    ordering = ('-timestamp', '-id')
+
+
+class SessionHistoryCursorPagination(ChatHistoryCursorPagination):
+    """Lịch sử 1 session: đọc theo thứ tự hội thoại (cũ -> mới)"""
+    ordering = ('timestamp', 'id')
@@ -0,0 +1,226 @@
+# knowledge/rollups.py
+
+import logging
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ChatHistory, ChatStatsRollup
+
+logger = logging.getLogger(__name__)
+
+# Cận trên (giây) của các bucket latency; bucket cuối cùng là "> 30s"
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 20.0, 30.0)
+PERCENTILES = (('p50', 0.50), ('p95', 0.95), ('p99', 0.99))
+
+# Khoá cố định cho bucket 'total'
+TOTAL_BUCKET_START = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+PERIODS = ('hour', 'day')
+
+
+def latency_bucket(seconds: float) -> int:
+    return bisect_left(LATENCY_BUCKETS, seconds or 0.0)
+
+
+def histogram_percentile(histogram: List[int], q: float) -> Optional[float]:
+    """Ước lượng percentile từ histogram (nội suy tuyến tính trong bucket)"""
+    total = sum(histogram)
+    if not total:
+        return None
+
+    rank = q * total
+    cumulative = 0
+    for index, count in enumerate(histogram):
+        if count and cumulative + count >= rank:
+            lower = LATENCY_BUCKETS[index - 1] if index > 0 else 0.0
+            # Bucket tràn (> 30s): không có cận trên, trả về cận dưới
+            upper = LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else lower
+            return round(lower + (upper - lower) * (rank - cumulative) / count, 3)
+        cumulative += count
+    return LATENCY_BUCKETS[-1]
+
+
+def bucket_start(period: str, moment: datetime) -> datetime:
+    """Đầu giờ / đầu ngày theo TIME_ZONE của project"""
+    if period == 'total':
+        return TOTAL_BUCKET_START
+    local = timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+    if period == 'day':
+        local = local.replace(hour=0)
+    return local
+
+
+class RollupAccumulator:
+    """Cộng dồn số liệu của nhiều lượt chat hoặc nhiều bucket rollup"""
+
+    __slots__ = ('chat_count', 'confidence_sum', 'response_time_sum', 'latency_histogram',
+                 'method_counts', 'intent_counts')
+
+    def __init__(self):
+        self.chat_count = 0
+        self.confidence_sum = 0.0
+        self.response_time_sum = 0.0
+        self.latency_histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.method_counts = Counter()
+        self.intent_counts = Counter()
+
+    def add_chat(self, chat):
+        self.chat_count += 1
+        self.confidence_sum += chat.confidence_score or 0.0
+        self.response_time_sum += chat.response_time or 0.0
+        self.latency_histogram[latency_bucket(chat.response_time)] += 1
+        self.method_counts[chat.method or 'unknown'] += 1
+        self.intent_counts[chat.intent or 'unknown'] += 1
+
+    def add_rollup(self, rollup: ChatStatsRollup):
+        self.chat_count += rollup.chat_count
+        self.confidence_sum += rollup.confidence_sum
+        self.response_time_sum += rollup.response_time_sum
+        for index, count in enumerate(rollup.latency_histogram[:len(self.latency_histogram)]):
+            self.latency_histogram[index] += count
+        self.method_counts.update(rollup.method_counts)
+        self.intent_counts.update(rollup.intent_counts)
+
+    def merge_json_into(self, rollup: ChatStatsRollup):
+        """Cộng histogram/method/intent của delta này vào 1 dòng rollup (chưa save)"""
+        histogram = list(rollup.latency_histogram or [])
+        histogram += [0] * (len(self.latency_histogram) - len(histogram))
+        for index, count in enumerate(self.latency_histogram):
+            histogram[index] += count
+        method_counts = Counter(rollup.method_counts or {})
+        method_counts.update(self.method_counts)
+        intent_counts = Counter(rollup.intent_counts or {})
+        intent_counts.update(self.intent_counts)
+
+        rollup.latency_histogram = histogram
+        rollup.method_counts = dict(method_counts)
+        rollup.intent_counts = dict(intent_counts)
+
+    def as_dict(self) -> Dict[str, Any]:
+        count = self.chat_count
+        return {
+            'total_chats': count,
+            'average_confidence': round(self.confidence_sum / count, 2) if count else 0,
+            'average_response_time': round(self.response_time_sum / count, 3) if count else 0,
+            'latency': {name: histogram_percentile(self.latency_histogram, q) for name, q in PERCENTILES},
+            'methods': dict(self.method_counts.most_common()),
+            'intents': dict(self.intent_counts.most_common()),
+        }
+
+
+def record_chats(chats: Iterable[ChatHistory], rollup_model=None):
+    """
+    Cộng các lượt chat vừa ghi vào rollup giờ/ngày/total.
+    Được ChatHistoryWriter gọi sau mỗi batch (mỗi batch chỉ chạm vài dòng rollup).
+
+    An toàn khi nhiều worker cùng flush: câu lệnh đầu tiên của transaction là INSERT
+    (SQLite giữ write lock tới lúc commit, các writer khác chờ busy timeout), các cột
+    đếm/tổng cộng bằng F() trong UPDATE (PostgreSQL khoá dòng), rồi mới đọc và gộp
+    các cột JSON trên dòng đã bị khoá.
+    rollup_model: model lịch sử khi gọi từ migration.
+    """
+    rollup_model = rollup_model or ChatStatsRollup
+    deltas: Dict[tuple, RollupAccumulator] = {}
+    for chat in chats:
+        for period in PERIODS + ('total',):
+            key = (period, bucket_start(period, chat.timestamp))
+            deltas.setdefault(key, RollupAccumulator()).add_chat(chat)
+
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        rollup_model.objects.bulk_create(
+            [rollup_model(period=period, bucket_start=start) for period, start in deltas],
+            ignore_conflicts=True,
+        )
+        for (period, start), delta in deltas.items():
+            rollup_model.objects.filter(period=period, bucket_start=start).update(
+                chat_count=F('chat_count') + delta.chat_count,
+                confidence_sum=F('confidence_sum') + delta.confidence_sum,
+                response_time_sum=F('response_time_sum') + delta.response_time_sum,
+                updated_at=timezone.now(),
+            )
+            rollup = rollup_model.objects.select_for_update().get(period=period, bucket_start=start)
+            delta.merge_json_into(rollup)
+            rollup.save(update_fields=['latency_histogram', 'method_counts', 'intent_counts', 'updated_at'])
+
+
+def get_chat_stats(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                   granularity: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Không có khoảng thời gian: đọc 1 dòng 'total'.
+    Có khoảng thời gian: gộp các bucket giờ/ngày trong [start, end)
+    (start được làm tròn xuống đầu bucket).
+    """
+    if start is None and end is None:
+        total = ChatStatsRollup.objects.filter(period='total', bucket_start=TOTAL_BUCKET_START).first()
+        summary = RollupAccumulator()
+        if total:
+            summary.add_rollup(total)
+        return summary.as_dict()
+
+    end = end or timezone.now()
+    start = start or end - timedelta(days=1)
+    if granularity not in PERIODS:
+        granularity = 'hour' if end - start <= timedelta(days=2) else 'day'
+
+    rollups = ChatStatsRollup.objects.filter(
+        period=granularity,
+        bucket_start__gte=bucket_start(granularity, start),
+        bucket_start__lt=end,
+    ).order_by('bucket_start')
+
+    summary = RollupAccumulator()
+    series = []
+    for rollup in rollups:
+        summary.add_rollup(rollup)
+        bucket = RollupAccumulator()
+        bucket.add_rollup(rollup)
+        series.append({'bucket_start': rollup.bucket_start.isoformat(), **bucket.as_dict()})
+
+    return {
+        **summary.as_dict(),
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'granularity': granularity,
+        'series': series,
+    }
+
+
+def rebuild_rollups(chunk_size: int = 2000, include_archive: bool = True,
+                    chat_model=None, rollup_model=None) -> int:
+    """
+    Tính lại toàn bộ rollup từ chat_history (+ archive); trả về số lượt chat đã quét.
+    chat_model/rollup_model: model lịch sử khi gọi từ migration.
+    """
+    from itertools import chain
+    from .archive import chat_archive, chat_from_record
+
+    chat_model = chat_model or ChatHistory
+    rollup_model = rollup_model or ChatStatsRollup
+
+    fields = ('timestamp', 'confidence_score', 'response_time', 'method', 'intent')
+    hot = chat_model.objects.only(*fields).order_by('id').iterator(chunk_size=chunk_size)
+    archived = (chat_from_record(record) for record in chat_archive.iter_records()) if include_archive else ()
+
+    scanned = 0
+    with transaction.atomic():
+        rollup_model.objects.all().delete()
+        chunk = []
+        for chat in chain(archived, hot):
+            chunk.append(chat)
+            if len(chunk) >= chunk_size:
+                record_chats(chunk, rollup_model)
+                scanned += len(chunk)
+                chunk = []
+        if chunk:
+            record_chats(chunk, rollup_model)
+            scanned += len(chunk)
+    return scanned
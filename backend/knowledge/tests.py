@@ -1,3 +1,289 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.db import OperationalError
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .archive import ChatHistoryArchive, chat_from_record
+from .history_writer import ChatHistoryWriter
+from .models import ChatHistory, ChatStatsRollup, UserFeedback
+from .rollups import get_chat_stats, rebuild_rollups, record_chats
+
+
+def make_chat(**fields):
+    """ChatHistory chưa lưu với giá trị mặc định cho test"""
+    fields.setdefault('session_id', 'session-test')
+    fields.setdefault('user_message', 'Học phí CNTT bao nhiêu?')
+    fields.setdefault('bot_response', 'Học phí ...')
+    return ChatHistory(**fields)
+
+
+def rollup_snapshot():
+    return sorted(
+        (rollup.period, rollup.bucket_start, rollup.chat_count, rollup.confidence_sum,
+         rollup.response_time_sum, list(rollup.latency_histogram), rollup.method_counts, rollup.intent_counts)
+        for rollup in ChatStatsRollup.objects.all()
+    )
+
+
+class ChatHistoryWriterTests(TransactionTestCase):
+    """Writer chạy trong autocommit giống thread nền (không bọc trong transaction của TestCase)"""
+
+    def make_writer(self, **kwargs):
+        writer = ChatHistoryWriter(**kwargs)
+        writer.start = lambda: None  # flush tay, không chạy thread nền
+        return writer
+
+    def submit(self, writer, **fields):
+        fields.setdefault('session_id', 'session-test')
+        fields.setdefault('user_message', 'Xin chào')
+        fields.setdefault('bot_response', 'Chào bạn')
+        return writer.submit(**fields)
+
+    def test_submit_buffers_until_flush(self):
+        writer = self.make_writer(max_batch=2)
+        chat_ids = [self.submit(writer) for _ in range(5)]
+
+        self.assertEqual(ChatHistory.objects.count(), 0)
+        self.assertEqual(writer.pending(), 5)
+        self.assertTrue(writer.is_pending(chat_ids[0]))
+
+        self.assertEqual(writer.flush(), 5)
+        self.assertEqual(writer.pending(), 0)
+        self.assertEqual(writer.stats['batches'], 3)
+        self.assertEqual(
+            sorted(str(value) for value in ChatHistory.objects.values_list('chat_uuid', flat=True)),
+            sorted(chat_ids),
+        )
+
+    def test_flush_max_batches(self):
+        writer = self.make_writer(max_batch=2)
+        for _ in range(5):
+            self.submit(writer)
+
+        self.assertEqual(writer.flush(max_batches=1), 2)
+        self.assertEqual(writer.pending(), 3)
+        self.assertEqual(ChatHistory.objects.count(), 2)
+
+    def test_full_buffer_drops_new_records(self):
+        writer = self.make_writer(max_buffer=2)
+        self.assertIsNotNone(self.submit(writer))
+        self.assertIsNotNone(self.submit(writer))
+        self.assertIsNone(self.submit(writer))
+
+        self.assertEqual(writer.stats['dropped'], 1)
+        self.assertEqual(writer.pending(), 2)
+
+    def test_disabled_writer_saves_immediately(self):
+        writer = self.make_writer(enabled=False)
+        chat_id = self.submit(writer)
+        self.assertTrue(ChatHistory.objects.filter(chat_uuid=chat_id).exists())
+
+    def test_locked_database_defers_batch(self):
+        writer = self.make_writer(max_batch=10, flush_interval=1.0, max_backoff=3.0)
+        chat_ids = [self.submit(writer) for _ in range(3)]
+
+        with mock.patch.object(ChatHistory.objects, 'bulk_create',
+                               side_effect=OperationalError('database is locked')):
+            self.assertEqual(writer.flush(), 0)
+            self.assertEqual(writer._backoff, 1.0)
+            writer.flush()
+            writer.flush()
+            self.assertEqual(writer._backoff, 3.0)  # bị chặn bởi max_backoff
+
+        # Batch quay lại đầu buffer, giữ nguyên thứ tự
+        self.assertEqual(writer.pending(), 3)
+        self.assertEqual(writer.stats['lock_retries'], 3)
+        self.assertEqual([str(record.chat_uuid) for record in writer._buffer], chat_ids)
+
+        self.assertEqual(writer.flush(), 3)
+        self.assertEqual(writer._backoff, 0.0)
+        self.assertEqual(ChatHistory.objects.count(), 3)
+
+    def test_bad_record_is_dropped_individually(self):
+        existing = make_chat()
+        existing.save()
+
+        writer = self.make_writer(max_batch=10)
+        good_before = self.submit(writer)
+        self.submit(writer, chat_uuid=existing.chat_uuid)  # trùng unique chat_uuid
+        good_after = self.submit(writer)
+
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(writer.stats['errors'], 1)
+        self.assertEqual(writer.stats['dropped'], 1)
+        self.assertTrue(ChatHistory.objects.filter(chat_uuid=good_before).exists())
+        self.assertTrue(ChatHistory.objects.filter(chat_uuid=good_after).exists())
+        self.assertEqual(ChatHistory.objects.count(), 3)
+
+    def test_lock_during_individual_retry_defers_rest(self):
+        writer = self.make_writer(max_batch=10)
+        chat_ids = [self.submit(writer) for _ in range(3)]
+        notified = []
+        writer.add_flush_listener(notified.extend)
+
+        original_save = ChatHistory.save
+
+        def save(record, *args, **kwargs):
+            if str(record.chat_uuid) == chat_ids[1]:
+                raise OperationalError('database is locked')
+            return original_save(record, *args, **kwargs)
+
+        with mock.patch.object(ChatHistory.objects, 'bulk_create', side_effect=ValueError('bad row')), \
+                mock.patch.object(ChatHistory, 'save', save):
+            self.assertEqual(writer.flush(), 0)
+
+        # Record đầu đã ghi (và đã báo listener), phần còn lại chờ lần flush sau
+        self.assertEqual([str(record.chat_uuid) for record in notified], chat_ids[:1])
+        self.assertEqual([str(record.chat_uuid) for record in writer._buffer], chat_ids[1:])
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(ChatHistory.objects.count(), 3)
+
+    def test_flush_listener_updates_rollups(self):
+        writer = self.make_writer(max_batch=2)
+        writer.add_flush_listener(record_chats)
+        for index in range(3):
+            self.submit(writer, response_time=0.5, confidence_score=0.75, method='faq')
+
+        writer.flush()
+        stats = get_chat_stats()
+        self.assertEqual(stats['total_chats'], 3)
+        self.assertEqual(stats['methods'], {'faq': 3})
+        self.assertEqual(stats['average_response_time'], 0.5)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        chats = []
+        # Giá trị nhị phân chính xác (x/4) để tổng float không phụ thuộc thứ tự cộng
+        for index in range(12):
+            chats.append(make_chat(
+                timestamp=now - timedelta(hours=index * 5),
+                confidence_score=(index % 4) / 4,
+                response_time=(index % 5) * 2.25,
+                method=('faq', 'gemini', None)[index % 3],
+                intent=('hoc_phi', 'tuyen_sinh')[index % 2],
+            ))
+        self.chats = ChatHistory.objects.bulk_create(chats)
+
+    def test_incremental_matches_rebuild(self):
+        record_chats(self.chats[:5])
+        record_chats(self.chats[5:9])
+        record_chats(self.chats[9:])
+        incremental = rollup_snapshot()
+
+        self.assertEqual(rebuild_rollups(chunk_size=5, include_archive=False), 12)
+        self.assertEqual(rollup_snapshot(), incremental)
+
+    def test_total_and_range_stats(self):
+        record_chats(self.chats)
+        total = get_chat_stats()
+        self.assertEqual(total['total_chats'], 12)
+        self.assertEqual(total['methods'], {'faq': 4, 'gemini': 4, 'unknown': 4})
+
+        now = timezone.now()
+        recent = get_chat_stats(now - timedelta(hours=12), now + timedelta(hours=1), 'hour')
+        # timestamp 0h, 5h, 10h trước
+        self.assertEqual(recent['total_chats'], 3)
+        self.assertEqual(sum(point['total_chats'] for point in recent['series']), 3)
+
+    def test_rebuild_includes_archive(self):
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir, ignore_errors=True)
+        archive = ChatHistoryArchive(root=archive_dir)
+        ChatHistory.objects.filter(id=self.chats[0].id).update(timestamp=timezone.now() - timedelta(days=200))
+
+        self.assertEqual(archive.archive(older_than_days=90)['archived'], 1)
+        with mock.patch('knowledge.archive.chat_archive', archive):
+            self.assertEqual(rebuild_rollups(), 12)
+        self.assertEqual(get_chat_stats()['total_chats'], 12)
+
+
+class ChatHistoryArchiveTests(TestCase):
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir, ignore_errors=True)
+        self.archive = ChatHistoryArchive(root=self.archive_dir, retention_days=90, batch_size=2)
+
+        old = timezone.now() - timedelta(days=120)
+        self.old_chats = [
+            make_chat(session_id='old-session', timestamp=old + timedelta(days=index),
+                      user_message=f'Câu hỏi {index}', entities={'nganh': 'cntt'}, method='faq')
+            for index in range(3)
+        ]
+        for chat in self.old_chats:
+            chat.save()
+        UserFeedback.objects.create(chat_history=self.old_chats[0], feedback_type='like', comment='Hay')
+        self.recent = make_chat(session_id='old-session')
+        self.recent.save()
+
+    def test_dry_run_only_counts(self):
+        result = self.archive.archive(dry_run=True)
+        self.assertEqual(result['archived'], 3)
+        self.assertEqual(ChatHistory.objects.count(), 4)
+        self.assertEqual(self.archive.load_manifest()['files'], [])
+
+    def test_round_trip(self):
+        result = self.archive.archive()
+        self.assertEqual(result['archived'], 3)
+        self.assertEqual(list(ChatHistory.objects.all()), [self.recent])
+        self.assertEqual(UserFeedback.objects.count(), 0)
+
+        records = self.archive.session_records('old-session')
+        self.assertEqual([record['chat_uuid'] for record in records],
+                         [str(chat.chat_uuid) for chat in self.old_chats])
+        self.assertEqual(records[0]['feedbacks'][0]['feedback_type'], 'like')
+        self.assertEqual(self.archive.session_records('missing'), [])
+        self.assertEqual(self.archive.get_stats()['rows'], 3)
+
+        restored = chat_from_record(records[1])
+        original = self.old_chats[1]
+        for field in ('id', 'chat_uuid', 'session_id', 'user_message', 'timestamp', 'entities', 'method'):
+            self.assertEqual(getattr(restored, field), getattr(original, field), field)
+
+    def test_rerun_does_not_duplicate_records(self):
+        self.archive.archive()
+        # Lần chạy bị ngắt sau khi ghi file nhưng trước khi xoá DB
+        self.old_chats[0].save(force_insert=True)
+        self.archive.archive()
+
+        uuids = [record['chat_uuid'] for record in self.archive.iter_records()]
+        self.assertEqual(len(uuids), 3)
+        self.assertEqual(len(self.archive.session_records('old-session')), 3)
+
+
+class ChatHistoryCursorPaginationTests(TestCase):
+    def setUp(self):
+        moment = timezone.now()
+        chats = []
+        for index in range(7):
+            # 2 lượt cùng timestamp -> thứ tự phân định bằng id
+            chats.append(make_chat(session_id=f's{index % 2}', timestamp=moment - timedelta(minutes=index // 2)))
+        ChatHistory.objects.bulk_create(chats)
+        self.client = APIClient()
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)  # không COUNT(*) toàn bảng
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_pages_follow_timestamp_then_id_descending(self):
+        ids = self.walk('/api/knowledge/history/?page_size=2')
+        expected = list(ChatHistory.objects.order_by('-timestamp', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_session_filter(self):
+        ids = self.walk('/api/knowledge/history/?session_id=s1&page_size=2')
+        expected = list(ChatHistory.objects.filter(session_id='s1')
+                        .order_by('-timestamp', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
@@ -3,11 +3,17 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.http import JsonResponse
-from django.db.models import Avg
+from django.utils.decorators import method_decorator
+from django.utils.dateparse import parse_datetime, parse_date
+from django.utils import timezone
+from datetime import datetime
 import pandas as pd
 import io
 from .models import KnowledgeBase, ChatHistory, UserFeedback
 from .serializers import KnowledgeBaseSerializer, ChatHistorySerializer
+from .pagination import ChatHistoryCursorPagination
+from .rollups import get_chat_stats
+from backend.http_cache import cache_response
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,6 +23,7 @@ class KnowledgeBaseViewSet(viewsets.ModelViewSet):
     serializer_class = KnowledgeBaseSerializer
     
     @action(detail=False, methods=['get'])
+    @method_decorator(cache_response('knowledge_categories', namespaces=('knowledge',)))
     def categories(self, request):
         categories = KnowledgeBase.objects.values_list('category', flat=True).distinct()
         return Response([cat for cat in categories if cat])
@@ -24,6 +31,7 @@ class KnowledgeBaseViewSet(viewsets.ModelViewSet):
 class ChatHistoryViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = ChatHistory.objects.all()  # ← FIX: Thêm queryset
     serializer_class = ChatHistorySerializer
+    pagination_class = ChatHistoryCursorPagination  # ✅ keyset thay cho OFFSET
     
     def get_queryset(self):
         session_id = self.request.query_params.get('session_id')
@@ -33,15 +41,31 @@ class ChatHistoryViewSet(viewsets.ReadOnlyModelViewSet):
     
     @action(detail=False, methods=['get'])
     def stats(self, request):
-        total_chats = ChatHistory.objects.count()
-        avg_confidence = ChatHistory.objects.aggregate(
-            avg_confidence=Avg('confidence_score')
-        )['avg_confidence'] or 0
+        """
+        ✅ CHANGED: Đọc từ bảng rollup (ChatStatsRollup) thay vì quét chat_history.
+        ?start=&end= (ISO datetime hoặc YYYY-MM-DD) & granularity=hour|day
+        """
+        try:
+            start = self._parse_moment(request.query_params.get('start'))
+            end = self._parse_moment(request.query_params.get('end'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        return Response({
-            'total_chats': total_chats,
-            'average_confidence': round(avg_confidence, 2)
-        })
+        return Response(get_chat_stats(start, end, request.query_params.get('granularity')))
+    
+    @staticmethod
+    def _parse_moment(value):
+        if not value:
+            return None
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(f'Invalid date/time: {value}')
+            moment = datetime(day.year, day.month, day.day)
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
 
 class UploadCSVView(APIView):
     def post(self, request):
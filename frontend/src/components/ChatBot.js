@@ -395,7 +395,7 @@ ${speechSupported ? '🎤 Bạn có thể gõ hoặc nói để hỏi câu hỏi
                     method: response.data.method,
                     response_time: response.data.response_time,
                     timestamp: new Date(),
-                    chat_id: Date.now() // For feedback purposes
+                    chat_id: response.data.chat_id // For feedback purposes
                 };
 
                 setMessages(prev => [...prev, botMessage]);
@@ -440,7 +440,7 @@ ${speechSupported ? '🎤 Bạn có thể gõ hoặc nói để hỏi câu hỏi
         }
     };
 
-    const sendFeedback = async (chatId, feedbackType, comment = '') => {
+    const sendFeedback = async (chatId, feedbackType, comment = '', attempt = 0) => {
         try {
             await axios.post('/api/feedback/', {
                 chat_id: chatId,
@@ -456,6 +456,12 @@ ${speechSupported ? '🎤 Bạn có thể gõ hoặc nói để hỏi câu hỏi
             ));
             
         } catch (error) {
+            // ✅ THÊM: 409 = câu trả lời chưa được lưu xong (write-behind) -> gửi lại sau Retry-After
+            if (error.response?.status === 409 && attempt < 3) {
+                const retryAfter = parseInt(error.response.headers?.['retry-after'], 10) || 1;
+                setTimeout(() => sendFeedback(chatId, feedbackType, comment, attempt + 1), retryAfter * 1000);
+                return;
+            }
             console.error('Error sending feedback:', error);
         }
     };